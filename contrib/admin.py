@@ -211,7 +211,7 @@ class TriggerExecutionAdmin(admin.ModelAdmin):
     pledge_count_.short_description = "pledges (exct'd/contrib'd)"
 
     def get_urls(self):
-        from django.conf.urls import  url
+        from django.conf.urls import url
         urls = super(TriggerExecutionAdmin, self).get_urls()
         return [
             url(r'^([0-9]+)/actions$', self.admin_site.admin_view(self.edit_actions)),
@@ -433,6 +433,85 @@ class ContributionAdmin(admin.ModelAdmin):
     def trigger(self, obj):
         return obj.pledge_execution.pledge.trigger
 
+    def get_urls(self):
+        # Add a view at /admin/contrib/contribution/export.
+        from django.conf.urls import url
+        urls = super(ContributionAdmin, self).get_urls()
+        return [
+            url(r'^export$', self.admin_site.admin_view(self.export)),
+        ] + urls
+
+    def export(self, request):
+        # Stream a CSV of all contribution and fee line items, optionally
+        # filtered by ?brand=, ?trigger=, and a ?start= and ?end= date
+        # (YYYY-MM-DD, inclusive).
+        from django.http import HttpResponseBadRequest
+        from django.utils.dateparse import parse_date
+        from itfsite.middleware import get_branding
+        from itfsite.utils import csv_streaming_response
+
+        executions = PledgeExecution.objects.select_related('pledge__via_campaign', 'trigger_execution__trigger')
+        try:
+            if request.GET.get("brand"):
+                executions = executions.filter(pledge__via_campaign__brand=get_branding(request.GET["brand"])['BRAND_INDEX'])
+            if request.GET.get("trigger"):
+                executions = executions.filter(pledge__trigger=int(request.GET["trigger"]))
+            for param, lookup in (("start", "created__date__gte"), ("end", "created__date__lte")):
+                if request.GET.get(param):
+                    date = parse_date(request.GET[param])
+                    if date is None: raise ValueError("Invalid date: " + request.GET[param])
+                    executions = executions.filter(**{ lookup: date })
+        except (KeyError, ValueError) as e:
+            return HttpResponseBadRequest(str(e))
+
+        def rows():
+            yield ['date', 'amount', 'recipient', 'action', 'link', 'trigger', 'pledge_execution', 'district']
+            for pe, contribs in PledgeExecution.iter_with_contributions(executions):
+                # Pledges made without a campaign get blank action and link
+                # columns and the default brand's fees.
+                campaign = pe.pledge.via_campaign
+                brand = campaign.brand if campaign else settings.DEFAULT_BRAND
+                line_items = [(c.amount, c.name_long()) for c in contribs]
+                line_items.append((pe.fees, '%s fees' % get_branding(brand)['SITE_NAME']))
+                for amount, recipient in line_items:
+                    yield [
+                        pe.created.isoformat(),
+                        amount,
+                        recipient,
+                        campaign.title if campaign else '',
+                        campaign.get_short_url() if campaign else '',
+                        pe.trigger_execution.trigger_id,
+                        pe.id,
+                        pe.district or '',
+                    ]
+        return csv_streaming_response(rows(), "contributions.csv")
+
+class DailyActivityAdmin(admin.ModelAdmin):
+    list_display = ['date', 'trigger', 'via_campaign'] + list(DailyActivity.counter_fields)
+    readonly_fields = ['date', 'trigger', 'via_campaign'] + list(DailyActivity.counter_fields) # counters are maintained automatically
+    date_hierarchy = 'date'
+    search_fields = ['trigger__'+f for f in TriggerAdmin.search_fields]
+
+class DistrictActivityAdmin(admin.ModelAdmin):
+    list_display = ['district', 'trigger'] + list(DistrictActivity.counter_fields)
+    readonly_fields = ['district', 'trigger'] + list(DistrictActivity.counter_fields) # counters are maintained automatically
+    search_fields = ['district'] + ['trigger__'+f for f in TriggerAdmin.search_fields]
+
+class UserSketchAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'trigger', 'via_campaign', 'estimated_count', 'updated']
+    list_filter = ['kind']
+    readonly_fields = ['kind', 'trigger', 'via_campaign', 'estimated_count', 'updated']
+    exclude = ['registers']
+    def estimated_count(self, obj):
+        from contrib.hll import HyperLogLog
+        return HyperLogLog(obj.registers).count()
+
+class ReferralActivityAdmin(admin.ModelAdmin):
+    list_display = ['date', 'via_campaign', 'ref_code'] + list(ReferralActivity.counter_fields)
+    readonly_fields = ['date', 'via_campaign', 'ref_code'] + list(ReferralActivity.counter_fields) # counters are maintained automatically
+    date_hierarchy = 'date'
+    search_fields = ['ref_code', 'via_campaign__id', 'via_campaign__title']
+
 admin.site.register(TriggerType)
 admin.site.register(Trigger, TriggerAdmin)
 admin.site.register(TriggerStatusUpdate, TriggerStatusUpdateAdmin)
@@ -447,3 +526,7 @@ admin.site.register(CancelledPledge, CancelledPledgeAdmin)
 admin.site.register(PledgeExecution, PledgeExecutionAdmin)
 admin.site.register(Recipient, RecipientAdmin)
 admin.site.register(Contribution, ContributionAdmin)
+admin.site.register(DailyActivity, DailyActivityAdmin)
+admin.site.register(DistrictActivity, DistrictActivityAdmin)
+admin.site.register(UserSketch, UserSketchAdmin)
+admin.site.register(ReferralActivity, ReferralActivityAdmin)
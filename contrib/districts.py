@@ -0,0 +1,152 @@
+# An offline index of ZIP codes to congressional districts and time zones.
+#
+# The index is built from a ZIP+4 crosswalk (see the build_district_index
+# management command) into a compact binary file that is memory-mapped,
+# so lookups are a binary search over the file without loading it. The
+# file is not in the repository. Its path is settings.DISTRICT_INDEX_PATH.
+#
+# File format: an 8-byte magic header followed by fixed-width records
+# sorted by their first ZIP+4, each covering a range of ZIP+4s (as the
+# nine-digit integers ZIP * 10000 + plus-four) in a single district:
+#
+#   uint32 first ZIP+4, uint32 last ZIP+4, 2-byte state, uint8 district, uint8 time zone
+#
+# Time zones are stored as an index into TIMEZONES, with 0 meaning unknown.
+#
+# Once the index has confirmed that a ZIP code is in the address's state,
+# the rest can be filled in from the state: at-large states have a single
+# district, and many states have a single time zone.
+
+import struct
+
+MAGIC = b"ITFCD01\n"
+RECORD = struct.Struct("<II2sBB")
+
+# The time zone names are the ones contrib.legislative.geocode uses.
+TIMEZONES = (None, "US/Eastern", "US/Central", "US/Mountain", "US/Pacific",
+	"US/Alaska", "US/Hawaii", "America/Puerto_Rico")
+
+# States with a single, at-large congressional district (in the 114th
+# Congress), which is numbered 00 like in the geocoder results. (DC is
+# left to the index and the geocoder.)
+AT_LARGE_STATES = ("AK", "DE", "MT", "ND", "SD", "VT", "WY")
+
+# States that are entirely in one time zone.
+STATE_TIMEZONES = {
+	"CT": "US/Eastern", "DE": "US/Eastern", "DC": "US/Eastern", "GA": "US/Eastern",
+	"ME": "US/Eastern", "MD": "US/Eastern", "MA": "US/Eastern", "NH": "US/Eastern",
+	"NJ": "US/Eastern", "NY": "US/Eastern", "NC": "US/Eastern", "OH": "US/Eastern",
+	"PA": "US/Eastern", "RI": "US/Eastern", "SC": "US/Eastern", "VT": "US/Eastern",
+	"VA": "US/Eastern", "WV": "US/Eastern",
+	"AL": "US/Central", "AR": "US/Central", "IL": "US/Central", "IA": "US/Central",
+	"LA": "US/Central", "MN": "US/Central", "MS": "US/Central", "MO": "US/Central",
+	"OK": "US/Central", "WI": "US/Central",
+	"CO": "US/Mountain", "MT": "US/Mountain", "NM": "US/Mountain", "UT": "US/Mountain",
+	"WY": "US/Mountain",
+	"CA": "US/Pacific", "WA": "US/Pacific",
+	"HI": "US/Hawaii",
+	"AZ": "US/Mountain", # the geocoder reports Arizona as MST
+	"PR": "America/Puerto_Rico",
+}
+
+class DistrictIndex:
+	def __init__(self, path):
+		import mmap
+		with open(path, 'rb') as f:
+			self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		if self.mm[0:len(MAGIC)] != MAGIC:
+			raise ValueError("%s is not a district index." % path)
+		self.count = (len(self.mm) - len(MAGIC)) // RECORD.size
+
+	def record(self, i):
+		# Returns the i'th record as (first, last, state, district, tz).
+		first, last, state, district, tz = RECORD.unpack_from(self.mm, len(MAGIC) + i*RECORD.size)
+		return (first, last, state.decode("ascii"), district, TIMEZONES[tz] if tz < len(TIMEZONES) else None)
+
+	def find(self, key):
+		# Returns the index of the last record whose range starts at or before
+		# key, or -1.
+		lo, hi = 0, self.count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if RECORD.unpack_from(self.mm, len(MAGIC) + mid*RECORD.size)[0] <= key:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo - 1
+
+	def lookup(self, zip5, plus4=None):
+		# Returns a dict with 'state', 'cd114' (as XX##) and 'tz' for a ZIP
+		# code, with whichever of those are known, or an empty dict if the
+		# ZIP code isn't in the index. With only a five-digit ZIP, the
+		# district is only returned if all of the ZIP is in one district.
+		if plus4 is not None:
+			first = last = zip5*10000 + plus4
+		else:
+			first, last = zip5*10000, zip5*10000 + 9999
+
+		# Scan the records that overlap the range.
+		matches = []
+		i = max(self.find(first), 0)
+		while i < self.count:
+			rec = self.record(i)
+			if rec[0] > last: break
+			if rec[1] >= first: matches.append(rec)
+			i += 1
+
+		ret = { }
+		states = set(rec[2] for rec in matches)
+		if len(states) == 1:
+			ret["state"] = states.pop()
+		districts = set((rec[2], rec[3]) for rec in matches)
+		if len(districts) == 1:
+			state, district = districts.pop()
+			ret["cd114"] = "%s%02d" % (state, district)
+		timezones = set(rec[4] for rec in matches)
+		if len(timezones) == 1 and None not in timezones:
+			ret["tz"] = timezones.pop()
+		return ret
+
+def get_district_index():
+	# Returns the DistrictIndex at settings.DISTRICT_INDEX_PATH, opened once
+	# per process, or None if there isn't one.
+	import os.path
+	from django.conf import settings
+	if not hasattr(get_district_index, 'index'):
+		path = getattr(settings, 'DISTRICT_INDEX_PATH', None)
+		get_district_index.index = DistrictIndex(path) if path and os.path.exists(path) else None
+	return get_district_index.index
+
+def parse_zip(zipcode):
+	# Splits a ZIP or ZIP+4 string into integers (zip5, plus4 or None).
+	import re
+	m = re.match(r"^\s*(\d{5})(?:\s*-?\s*(\d{4}))?\s*$", str(zipcode))
+	if not m: raise ValueError("Invalid ZIP code: %s" % zipcode)
+	return (int(m.group(1)), int(m.group(2)) if m.group(2) else None)
+
+def lookup_address(state, zipcode):
+	# Resolves what we can about an address locally. Returns a dict with
+	# 'cd114' and/or 'tz' (in the same format as contrib.legislative.geocode)
+	# or an empty dict if neither could be determined, e.g. if the ZIP code
+	# spans districts and no ZIP+4 was given. Addresses whose ZIP code the
+	# index doesn't confirm is in the state are left to the remote geocoder,
+	# which rejects invalid addresses.
+	state = str(state).strip().upper()
+	try:
+		zip5, plus4 = parse_zip(zipcode)
+	except ValueError:
+		return { }
+
+	index = get_district_index()
+	if not index:
+		return { }
+	ret = index.lookup(zip5, plus4)
+	if ret.pop("state", None) != state:
+		# The ZIP code isn't in the index or doesn't match the state.
+		return { }
+
+	if state in AT_LARGE_STATES:
+		ret["cd114"] = state + "00"
+	if "tz" not in ret and state in STATE_TIMEZONES:
+		ret["tz"] = STATE_TIMEZONES[state]
+	return ret
@@ -0,0 +1,104 @@
+# Geocodes ContributorInfo records in bulk.
+#
+# Addresses whose district and time zone can be determined from the offline
+# district index (see contrib.districts) aren't sent to the remote geocoder.
+# Other addresses are normalized so that trivially different spellings of the
+# same address (case, spacing, ZIP+4) are geocoded once, and results are
+# kept in GeocodeCache so that an address is never sent to the geocoder
+# again, even though a new ContributorInfo is created every time a user's
+# information changes. The remaining lookups are made concurrently but
+# rate-limited, and the results are written back in one transaction.
+
+import hashlib, re
+
+def get_profile_address(profile):
+	# Returns the (street, city, state, zip) tuple of a ContributorInfo,
+	# as contrib.legislative.geocode expects it.
+	c = profile.extra['contributor']
+	return (c['contribAddress'], c['contribCity'], c['contribState'], c['contribZip'])
+
+def normalize_address(address):
+	street, city, state, zipcode = (re.sub(r"\s+", " ", str(part)).strip().upper() for part in address)
+	zipcode = zipcode[0:5] # the ZIP+4 doesn't change the result
+	return (street, city, state, zipcode)
+
+def get_address_hash(address):
+	return hashlib.sha1("\n".join(normalize_address(address)).encode("utf8")).hexdigest()
+
+def geocode_profiles(profiles, threads=4, rate=5, retries=2):
+	# Geocodes the ContributorInfos in profiles, updating extra['geocode']
+	# and is_geocoded on each. Returns a list of (address hash, exception)
+	# for addresses that could not be geocoded. Those profiles are left
+	# unchanged so they'll be tried again next time.
+	import time
+	from concurrent.futures import ThreadPoolExecutor
+	from django.db import transaction
+	from contrib.models import GeocodeCache
+	from contrib.legislative import geocode
+	from django.utils.timezone import now
+	from contrib.utils import RateLimiter
+	from contrib.districts import lookup_address
+
+	# Group the profiles by address.
+	profiles_by_address = { }
+	addresses = { }
+	for profile in profiles:
+		address = get_profile_address(profile)
+		key = get_address_hash(address)
+		profiles_by_address.setdefault(key, []).append(profile)
+		addresses[key] = address
+
+	# Resolve what we can locally, from the offline district index.
+	results = { }
+	for key, address in addresses.items():
+		result = lookup_address(address[2], address[3])
+		if "cd114" in result and "tz" in result:
+			result.update({
+				'timestamp': now().isoformat(),
+				'source': 'district-index',
+			})
+			results[key] = result
+
+	# Then use cached results.
+	results.update(GeocodeCache.objects.filter(address_hash__in=[key for key in addresses if key not in results]).values_list('address_hash', 'result'))
+
+	# Geocode the rest concurrently.
+	limiter = RateLimiter(rate)
+	errors = []
+	def fetch(key):
+		for attempt in range(retries+1):
+			limiter.wait()
+			try:
+				return geocode(addresses[key])
+			except Exception as e:
+				if attempt == retries:
+					errors.append((key, e))
+					return None
+				time.sleep(2 ** attempt) # back off
+	new_results = { }
+	to_fetch = [key for key in addresses if key not in results]
+	if to_fetch:
+		with ThreadPoolExecutor(max_workers=threads) as pool:
+			for key, result in zip(to_fetch, pool.map(fetch, to_fetch)):
+				if result is not None:
+					new_results[key] = result
+
+	# Write back.
+	with transaction.atomic():
+		# Cache new results. Another process may have just cached the same
+		# address, so don't try to insert those again.
+		existing = set(GeocodeCache.objects.filter(address_hash__in=new_results.keys()).values_list('address_hash', flat=True))
+		GeocodeCache.objects.bulk_create(
+			GeocodeCache(address_hash=key, result=result)
+			for key, result in new_results.items()
+			if key not in existing)
+		results.update(new_results)
+
+		# Update the profiles.
+		for key, result in results.items():
+			for profile in profiles_by_address[key]:
+				profile.extra['geocode'] = result
+				profile.is_geocoded = True
+				profile.save(update_fields=['is_geocoded', 'extra'], override_immutable_check=True)
+
+	return errors
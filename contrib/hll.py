@@ -0,0 +1,54 @@
+# A HyperLogLog sketch for approximately counting distinct values.
+#
+# A sketch is a fixed-size array of registers (4 KB here), so it is cheap to
+# store and update, and two sketches can be merged to count the distinct
+# values seen by either. The estimate has a standard error of about 1.6%,
+# and counts up to a few thousand are nearly exact because of the
+# small-range (linear counting) correction.
+#
+# See Flajolet et al., "HyperLogLog: the analysis of a near-optimal
+# cardinality estimation algorithm" (2007).
+
+import hashlib, math
+
+class HyperLogLog:
+	p = 12 # number of bits of the hash used to pick a register
+	m = 1 << p # number of registers
+
+	def __init__(self, registers=None):
+		if registers is None:
+			self.registers = bytearray(self.m)
+		else:
+			self.registers = bytearray(registers)
+			if len(self.registers) != self.m:
+				raise ValueError("Sketch has %d registers, expected %d." % (len(self.registers), self.m))
+
+	def __bytes__(self):
+		return bytes(self.registers)
+
+	def add(self, value):
+		# Adds a value to the sketch. Returns whether the sketch changed,
+		# so callers can skip saving it when it didn't.
+		h = int.from_bytes(hashlib.sha1(str(value).encode("utf8")).digest()[0:8], "big")
+		index = h >> (64 - self.p)
+		rest = h & ((1 << (64 - self.p)) - 1)
+		rank = (64 - self.p) - rest.bit_length() + 1 # position of the leftmost 1-bit
+		if rank > self.registers[index]:
+			self.registers[index] = rank
+			return True
+		return False
+
+	def merge(self, other):
+		# Updates this sketch to count the union of the values seen by it and other.
+		self.registers = bytearray(map(max, self.registers, other.registers))
+		return self
+
+	def count(self):
+		# Returns the estimated number of distinct values added to the sketch.
+		alpha = 0.7213 / (1 + 1.079 / self.m)
+		estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+		zeros = self.registers.count(0)
+		if estimate <= 2.5 * self.m and zeros > 0:
+			# Small-range correction: linear counting.
+			estimate = self.m * math.log(self.m / zeros)
+		return int(round(estimate))
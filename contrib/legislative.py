@@ -132,14 +132,22 @@ def map_outcome_indexes(trigger, flip):
 
 	return outcome_index
 
+def get_actors_by_govtrack_id(govtrack_ids):
+	# Returns a dict mapping (integer) GovTrack IDs to Actors, using a
+	# single query. IDs without an Actor are left out.
+	return {
+		actor.govtrack_id: actor
+		for actor in Actor.objects.filter(govtrack_id__in=set(int(id) for id in govtrack_ids))
+	}
+
 def load_govtrack_vote(trigger, govtrack_url, flip):
-	import lxml.etree
+	from contrib.votes import get_vote
 
 	outcome_index = map_outcome_indexes(trigger, flip)
 
-	# Get vote metadata from GovTrack's API, via the undocumented
-	# '.json' extension added to vote pages.
-	vote = query_json_api(govtrack_url+'.json', {})
+	# Get the vote metadata and how each Member of Congress voted. This is
+	# only fetched from GovTrack the first time.
+	vote, voters = get_vote(govtrack_url)
 
 	# Sanity check that the chamber of the vote matches the trigger type.
 	if trigger.trigger_type.key not in ('congress_floorvote_x', 'congress_floorvote_both', 'congress_floorvote_' + vote['chamber'][0], 'announced-positions'):
@@ -149,25 +157,14 @@ def load_govtrack_vote(trigger, govtrack_url, flip):
 	# timezone-aware to store in our database.
 	when = parse_uscapitol_local_time(vote['created'])
 
-	# Then get how Members of Congress voted via the XML, which conveniently
-	# includes everything without limit/offset. The congress project vote
-	# JSON doesn't use GovTrack IDs, so it's more convenient to use GovTrack
-	# data.
-	r = query_json_api(govtrack_url+'/export/xml', {}, raw=True)
-	dom = lxml.etree.fromstring(r)
-	actor_outcomes = [ ]
-	for voter in dom.findall('voter'):
-		# Validate.
-		if not voter.get('id'):
-			 # VP tiebreaker
-			if voter.get('VP'):
-				continue
-			raise Exception("Missing data in GovTrack XML.")
+	# Get the Actors for all of the voters at once.
+	actors = get_actors_by_govtrack_id(govtrack_id for govtrack_id, vote_key in voters)
 
+	actor_outcomes = [ ]
+	for govtrack_id, vote_key in voters:
 		# Get the Actor.
-		try:
-			actor = Actor.objects.get(govtrack_id=voter.get('id'))
-		except Actor.DoesNotExist:
+		actor = actors.get(govtrack_id)
+		if actor is None:
 			# We don't have an Actor object for this person. If we're loading
 			# in an old vote to do a post-vote trigger with, some voters may
 			# no longer be serving and that's ok.
@@ -175,23 +172,23 @@ def load_govtrack_vote(trigger, govtrack_url, flip):
 				continue
 
 			if settings.DEBUG:
-				print("No Actor instance exists here for Member of Congress with GovTrack ID %d." % int(voter.get('id')))
+				print("No Actor instance exists here for Member of Congress with GovTrack ID %d." % govtrack_id)
 				continue
 				
-			raise Exception("No Actor instance exists here for Member of Congress with GovTrack ID %d." % int(voter.get('id')))
+			raise Exception("No Actor instance exists here for Member of Congress with GovTrack ID %d." % govtrack_id)
 
 		# Map vote keys '+' and '-' to outcome indexes.
 		# Treat not voting (0 and P) as a null outcome, meaning the Actor didn't
 		# take action for our purposes but should be recorded as not participating.
-		outcome = outcome_index.get(voter.get('vote'))
+		outcome = outcome_index.get(vote_key)
 
 		if outcome is None:
-			if voter.get('vote') == "0":
+			if vote_key == "0":
 				outcome = "Did not vote."
-			elif voter.get('vote') == "P":
+			elif vote_key == "P":
 				outcome = "Voted 'present'."
 			else:
-				raise ValueError("Invalid vote option key: " + str(voter.get('vote')))
+				raise ValueError("Invalid vote option key: " + str(vote_key))
 
 		actor_outcomes.append({
 			"actor": actor,
@@ -263,13 +260,15 @@ def load_govtrack_sponsors(trigger, bill, flip=False):
 	if trigger.trigger_type.key not in ('congress_sponsors_both', 'congress_sponsors_' + bill['bill_type'][0].lower(), 'announced-positions'):
 		raise Exception("The trigger type isn't one about bill sponsors or is for the wrong chamber.")
 
+	people = [person for person in [bill.get('sponsor')] + bill.get('cosponsors', [])
+		if person is not None] # skip empty sponsor
+	actors = get_actors_by_govtrack_id(person.get('id') for person in people)
+
 	actor_outcomes = [ ]
-	for person in [bill.get('sponsor')] + bill.get('cosponsors', []):
+	for person in people:
 		# Convert GovTrack ID to Actor object.
-		if person is None: continue # empty sponsor
-		try:
-			actor = Actor.objects.get(govtrack_id=person.get('id'))
-		except Actor.DoesNotExist:
+		actor = actors.get(int(person.get('id')))
+		if actor is None:
 			# See corresponding block for votes.
 			raise Exception("No Actor instance exists here for Member of Congress with GovTrack ID %d." % int(person.get('id')))
 
@@ -317,6 +316,75 @@ def get_trigger_type_for_sponsors(chamber):
 		})
 	return trigger_type
 
+def get_govtrack_bill_json_url(bill_id):
+	# Returns the URL to the JSON for a bill's GovTrack page, via the
+	# undocumented '.json' extension added to bill pages, given a
+	# congress-project-style bill ID like hr1024-114.
+	import re
+	m = re.match("^([a-z]+)(\d+)-(\d+)$", bill_id)
+	if not m: raise ValueError("'%s' is not a bill ID, e.g. hr1234-114." % bill_id)
+	return 'https://www.govtrack.us/congress/bills/%s/%s%s.json' \
+		% (m.group(3), m.group(1), m.group(2))
+
+def get_govtrack_cosponsorship_url(bill):
+	return 'https://www.govtrack.us/api/v2/cosponsorship?bill=%d' % bill['id']
+
+def get_govtrack_bill_api_url(govtrack_bill_id):
+	return 'https://www.govtrack.us/api/v2/bill/%d' % govtrack_bill_id
+
+def get_companion_bill(bill):
+	# Returns the GovTrack ID of a bill's identical bill in the other
+	# chamber, or None.
+	companion_bill = None
+	for rb in bill.get("related_bills", []):
+		if rb['relation'] == "identical":
+			companion_bill = rb['bill']
+	return companion_bill
+
+def prefetch_sponsors_data(bill_ids, companion_bill_ids=[], threads=8, rate=5, retries=3):
+	# Fetches the GovTrack documents that create_trigger_for_sponsors (and,
+	# for companion_bill_ids, create_trigger_for_sponsors_with_companion_bill)
+	# will need, concurrently, so that they are fresh in the HTTP cache when
+	# those functions are called. Requests are spread over a thread pool but
+	# limited to `rate` per second overall, and failed requests are retried.
+	# Returns a list of (url, exception) for documents that could not be fetched,
+	# which the caller can ignore since they will just be fetched again later.
+	import time
+	from concurrent.futures import ThreadPoolExecutor
+	from contrib.utils import RateLimiter
+
+	limiter = RateLimiter(rate)
+	errors = []
+
+	def fetch(url):
+		for attempt in range(retries+1):
+			limiter.wait()
+			try:
+				# max_age=0 forces a (conditional) request.
+				return query_json_api(url, max_age=0)
+			except Exception as e:
+				if attempt == retries:
+					errors.append((url, e))
+					return None
+				time.sleep(2 ** attempt) # back off
+
+	with ThreadPoolExecutor(max_workers=threads) as pool:
+		# First get the bills.
+		bill_ids = sorted(set(bill_ids) | set(companion_bill_ids))
+		bills = dict(zip(bill_ids, pool.map(fetch, [get_govtrack_bill_json_url(bill_id) for bill_id in bill_ids])))
+
+		# Then the documents that depend on the bills: their cosponsors and
+		# companion bills.
+		urls = []
+		for bill_id, bill in sorted(bills.items()):
+			if bill is None: continue
+			urls.append(get_govtrack_cosponsorship_url(bill))
+			if bill_id in companion_bill_ids and get_companion_bill(bill):
+				urls.append(get_govtrack_bill_api_url(get_companion_bill(bill)))
+		list(pool.map(fetch, urls))
+
+	return errors
+
 def create_trigger_for_sponsors(bill_id, update=True, with_companion=False):
 	# Gets or creates a Trigger that is immediately executed according to
 	# the sponsor and cosponsors of a federal bill. If the Trigger already
@@ -332,14 +400,10 @@ def create_trigger_for_sponsors(bill_id, update=True, with_companion=False):
 	if with_companion:
 		return create_trigger_for_sponsors_with_companion_bill(bill_id, update=update)
 
-	import re
 	from .models import TriggerExecution, TriggerStatus
 
 	# Validate that this is a valid-looking bill ID.
-	m = re.match("^([a-z]+)(\d+)-(\d+)$", bill_id)
-	if not m: raise ValueError("'%s' is not a bill ID, e.g. hr1234-114." % bill_id)
-	govtrack_api_url = 'https://www.govtrack.us/congress/bills/%s/%s%s.json' \
-		% (m.group(3), m.group(1), m.group(2))
+	govtrack_api_url = get_govtrack_bill_json_url(bill_id)
 	chamber = bill_id[0] # chamber 'h' or 's' is first character
 
 	existing_trigger = Trigger.objects.filter(key="usbill:sponsors:" + bill_id).first()
@@ -398,6 +462,9 @@ def create_trigger_for_sponsors(bill_id, update=True, with_companion=False):
 		},
 	]
 
+	# Note when the bill info was retreived so we know when it is stale.
+	bill['as_of'] = now().isoformat()
+
 	t.extra.update({
 		"type": "sponsors",
 		"bill_id": bill_id,
@@ -420,8 +487,7 @@ def create_trigger_for_sponsors(bill_id, update=True, with_companion=False):
 		})
 
 	# Add cosponsors.
-	cosponsors = query_json_api('https://www.govtrack.us/api/v2/cosponsorship?bill=%d'
-		% bill['id'])['objects']
+	cosponsors = query_json_api(get_govtrack_cosponsorship_url(bill))['objects']
 	for cosponsor in cosponsors:
 		sponsors.append({
 			"id": cosponsor['person'],
@@ -430,15 +496,21 @@ def create_trigger_for_sponsors(bill_id, update=True, with_companion=False):
 		})
 
 
-	# Update the TriggerExecution's Actions.
+	# Update the TriggerExecution's Actions. Load the existing Actions and the
+	# Actors once, work out what changed, and only write what did.
 	from .models import Action
 	execution = t.execution
-	seen_actions = set()
+	introduced_date = parse_uscapitol_local_time(bill['introduced_date'])
+	actors = get_actors_by_govtrack_id(record['id'] for record in sponsors)
+	existing_actions = { action.actor_id: action for action in Action.objects.filter(execution=execution) }
+	new_actions = { } # actor id => unsaved Action
+	changed_outcomes = { } # (outcome, reason_for_no_outcome) => set of Action ids
+	changed_extras = { } # Action id => Action
+	seen_actors = set()
 	for record in sponsors:
 		# Convert GovTrack ID to Actor object.
-		try:
-			actor = Actor.objects.get(govtrack_id=record['id'])
-		except Actor.DoesNotExist:
+		actor = actors.get(record['id'])
+		if actor is None:
 			# Slilently skip person if we aren't yet in sync with Actors for all
 			# possible (co)sponsors.
 			continue
@@ -457,50 +529,61 @@ def create_trigger_for_sponsors(bill_id, update=True, with_companion=False):
 		else:
 			# All good.
 			reason_for_no_outcome = None
+		outcome = 0 if not reason_for_no_outcome else None
 
-		# Update Actions.
-		action = Action.objects.filter(execution=execution, actor=actor).first()
-		if not action:
+		if record.get('is_primary_sponsor'):
+			sponsor_type = "primary"
+		elif record['joined'] == introduced_date:
+			sponsor_type = "original-cosponsor"
+		else:
+			sponsor_type = "joined-cosponsor"
+
+		action = existing_actions.get(actor.id)
+		if action is None:
 			# Create an Action. It's always outcome zero. If the cosponsor is already
 			# withdrawn or isn't running for re-election, then they get that reason
 			# which replaces the outcome integer index.
 			if not reason_for_no_outcome:
-				action = Action.create(execution, actor, 0, record['joined'])
-			else:
-				action = Action.create(execution, actor, reason_for_no_outcome, record['withdrawn'])
-		else:
-			# Update an existing action.
-			if not reason_for_no_outcome:
-				action.outcome = 0
-				action.reason_for_no_outcome = None
+				action = Action.build(execution, actor, 0, record['joined'])
 			else:
-				action.outcome = None
-				action.reason_for_no_outcome = reason_for_no_outcome
-			action.save()
+				action = Action.build(execution, actor, reason_for_no_outcome, record['withdrawn'])
+			action.extra = dict(action.extra or { })
+			action.extra['usbill:sponsors:sponsor_type'] = sponsor_type
+			new_actions[actor.id] = action
 
-		if not action.extra: action.extra = { }
-		if record.get('is_primary_sponsor'):
-			action.extra['usbill:sponsors:sponsor_type'] = "primary"
-		elif record['joined'] == parse_uscapitol_local_time(bill['introduced_date']):
-			action.extra['usbill:sponsors:sponsor_type'] = "original-cosponsor"
 		else:
-			action.extra['usbill:sponsors:sponsor_type'] = "joined-cosponsor"
+			# Update an existing action, if anything changed.
+			if (action.outcome, action.reason_for_no_outcome) != (outcome, reason_for_no_outcome):
+				for ids in changed_outcomes.values(): ids.discard(action.id)
+				changed_outcomes.setdefault((outcome, reason_for_no_outcome), set()).add(action.id)
+				action.outcome = outcome
+				action.reason_for_no_outcome = reason_for_no_outcome
+			if not action.extra or action.extra.get('usbill:sponsors:sponsor_type') != sponsor_type:
+				if not action.extra: action.extra = { }
+				action.extra['usbill:sponsors:sponsor_type'] = sponsor_type
+				changed_extras[action.id] = action
+
+		seen_actors.add(actor.id)
+
+	# Write the changes.
+	Action.objects.bulk_create(new_actions.values())
+	for (outcome, reason_for_no_outcome), ids in changed_outcomes.items():
+		if not ids: continue
+		Action.objects.filter(id__in=ids).update(outcome=outcome, reason_for_no_outcome=reason_for_no_outcome)
+	for action in changed_extras.values():
 		action.save(update_fields=['extra'])
 
-		seen_actions.add(action.id)
-
 	# If any cosponsorship records disappeared from the GovTrack API, typically
 	# from incorrect upstream data from Congress, mark those Actions as no longer
 	# active. Skip outcome=None Actions because we may have already marked them
 	# as obsoleted.
-	for obsolete_action in \
-		Action.objects.filter(execution=execution)\
-		.exclude(id__in=seen_actions)\
-		.exclude(outcome=None):
-		obsolete_action.outcome = None
-		obsolete_action.reason_for_no_outcome = "Cosponsorship record was removed on %s due to erroneous information reported by Congress." \
-			% now().strftime("%s")
-		obsolete_action.save()
+	Action.objects.filter(execution=execution)\
+		.exclude(actor_id__in=seen_actors)\
+		.exclude(outcome=None)\
+		.update(
+			outcome=None,
+			reason_for_no_outcome="Cosponsorship record was removed on %s due to erroneous information reported by Congress." \
+				% now().strftime("%s"))
 
 	# Update the metadata.
 
@@ -539,17 +622,14 @@ def create_trigger_for_sponsors_with_companion_bill(bill_id, update=True):
 	# If the bill has any identical related bills, form a new Trigger,
 	# that is empty-executed, which merely lists the triggers of the
 	# two bills as sub-triggers.
-	companion_bill = None
-	for rb in t1.extra['bill_info'].get("related_bills", []):
-		if rb['relation'] == "identical":
-			companion_bill = rb['bill']
+	companion_bill = get_companion_bill(t1.extra['bill_info'])
 
 	if not companion_bill:
 		# There is no companion bill. Just return this bill's trigger.
 		return t1
 
 	# Get a bill_id for the companion bill. Not so great code here.
-	b = query_json_api('https://www.govtrack.us/api/v2/bill/%d' % companion_bill)
+	b = query_json_api(get_govtrack_bill_api_url(companion_bill))
 	bill_id2 = b['bill_type_label'].replace(".", "").lower() + str(b['number']) + '-' + str(b['congress'])
 
 	# Get a trigger for it.
@@ -655,11 +735,12 @@ def geocode(address):
 	# Geocodes an address using the CDYNE Postal Address Verification API.
 	# address should be a tuple of of the street, city, state and zip code.
 
-	import requests, urllib.parse, json
+	import json
 	from django.conf import settings
+	from contrib.utils import get_http_session
 
 		# http version: "http://pav3.cdyne.com/PavService.svc/VerifyAddressAdvanced"
-	r = requests.post("https://pav3.cdyne.com/PavService.svc/rest_s/VerifyAddressAdvanced",
+	r = get_http_session().post("https://pav3.cdyne.com/PavService.svc/rest_s/VerifyAddressAdvanced",
 		data=json.dumps({
 			"PrimaryAddressLine": address[0],
 			"CityName": address[1],
@@ -670,7 +751,8 @@ def geocode(address):
 			"ReturnGeoLocation": True,
 			"ReturnLegislativeInfo": True,
 		}),
-		headers={ "Content-Type": "application/json", "Accept": "application/json" }
+		headers={ "Content-Type": "application/json", "Accept": "application/json" },
+		timeout=60,
 		)
 
 	# Raise an exception for non-200 OK responses.
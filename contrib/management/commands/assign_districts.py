@@ -0,0 +1,43 @@
+# Sets the congressional district of executed pledges from geocoded profiles.
+# ---------------------------------------------------------------------------
+
+from django.core.management.base import BaseCommand, CommandError
+
+from contrib.models import PledgeExecution, ContributorInfo
+
+import sys, tqdm
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Sets the district of PledgeExecutions whose contributor profiles have been geocoded, in batches.'
+
+	batch_size = 500
+
+	def add_arguments(self, parser):
+		parser.add_argument('--all', action='store_true', help='Re-check executions that already have a district, not just ones without.')
+
+	def handle(self, *args, **options):
+		# Get the PledgeExecutions to look at. Only the IDs are loaded up front.
+		pes = PledgeExecution.objects.filter(pledge__profile__is_geocoded=True)
+		if not options['all']:
+			pes = pes.filter(district=None)
+		pes = list(pes.order_by('id').values_list('id', 'pledge__profile'))
+
+		# Process in batches so that each transaction stays short.
+		batches = range(0, len(pes), self.batch_size)
+		if sys.stdout.isatty(): batches = tqdm.tqdm(batches)
+		changed = 0
+		for i in batches:
+			batch = pes[i:i+self.batch_size]
+
+			# Get the districts from the geocoded profiles.
+			profiles = dict(ContributorInfo.objects.filter(id__in=set(profile for pe, profile in batch)).values_list('id', 'extra'))
+			districts = { }
+			for pe, profile in batch:
+				district = (profiles[profile] or {}).get('geocode', {}).get('cd114')
+				if district:
+					districts[pe] = district
+
+			changed += PledgeExecution.assign_districts(districts)
+
+		print("Updated the district of %d of %d executions." % (changed, len(pes)))
@@ -0,0 +1,29 @@
+# Rebuilds pre-aggregated statistics from the underlying records.
+# ---------------------------------------------------------------
+
+from django.core.management.base import BaseCommand, CommandError
+
+from contrib.models import DailyActivity, DistrictActivity, UserSketch, ReferralActivity
+
+class Command(BaseCommand):
+	args = '[daily|districts|sketches|referrals ...]'
+	help = 'Rebuilds pre-aggregated statistics (all kinds if none are given) from the underlying records.'
+
+	def handle(self, *args, **options):
+		# Which statistics to rebuild, and how.
+		rebuilders = [
+			("daily", "daily activity buckets", DailyActivity.rebuild),
+			("districts", "district rollups", DistrictActivity.rebuild),
+			("sketches", "distinct-user sketches", UserSketch.rebuild),
+			("referrals", "referral code rollups", ReferralActivity.rebuild),
+		]
+
+		kinds = set(args) or set(r[0] for r in rebuilders)
+		unknown = kinds - set(r[0] for r in rebuilders)
+		if unknown:
+			raise CommandError("Unknown statistics: %s" % ", ".join(sorted(unknown)))
+
+		for kind, description, rebuild in rebuilders:
+			if kind not in kinds: continue
+			count = rebuild()
+			print("Rebuilt %d %s." % (count, description))
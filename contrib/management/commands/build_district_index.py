@@ -0,0 +1,62 @@
+# Builds the offline ZIP code to district index.
+# ----------------------------------------------
+#
+# Reads a ZIP+4 to congressional district crosswalk CSV with the columns
+# zip5, plus4_lo, plus4_hi, state, district, timezone (plus4_lo/plus4_hi
+# may be blank for a whole ZIP code and timezone may be blank if unknown)
+# and writes the binary index used by contrib.districts.
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from contrib.districts import MAGIC, RECORD, TIMEZONES
+
+import csv, os, tempfile
+
+class Command(BaseCommand):
+	args = 'crosswalk.csv [index_path]'
+	help = 'Builds the ZIP code to congressional district index from a crosswalk CSV file.'
+
+	def handle(self, *args, **options):
+		if len(args) not in (1, 2):
+			raise CommandError("Usage: ./manage.py build_district_index crosswalk.csv [index_path]")
+		output = args[1] if len(args) == 2 else getattr(settings, 'DISTRICT_INDEX_PATH', None)
+		if not output:
+			raise CommandError("Give an output path or set DISTRICT_INDEX_PATH.")
+
+		# Read the crosswalk.
+		records = []
+		with open(args[0]) as f:
+			for row in csv.DictReader(f):
+				zip5 = int(row['zip5'])
+				state = row['state'].strip().upper()
+				if len(state) != 2:
+					raise CommandError("Invalid state: %s" % row)
+				tz = (row.get('timezone') or '').strip() or None
+				if tz == "US/Arizona": tz = "US/Mountain" # as the geocoder reports it
+				if tz not in TIMEZONES:
+					raise CommandError("Unrecognized time zone: %s" % row)
+				records.append((
+					zip5*10000 + int(row['plus4_lo'] or 0),
+					zip5*10000 + int(row['plus4_hi'] or 9999),
+					state.encode("ascii"),
+					int(row['district']),
+					TIMEZONES.index(tz),
+				))
+
+		# Sort and sanity-check that ranges don't overlap, because lookups
+		# assume there is at most one record per ZIP+4.
+		records.sort()
+		for prev, rec in zip(records, records[1:]):
+			if rec[0] <= prev[1]:
+				raise CommandError("Overlapping ZIP+4 ranges: %s and %s." % (prev, rec))
+
+		# Write atomically since running processes may have the old file mapped.
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)))
+		with os.fdopen(fd, 'wb') as f:
+			f.write(MAGIC)
+			for rec in records:
+				f.write(RECORD.pack(*rec))
+		os.replace(tmp, output)
+
+		print("Wrote %d ZIP+4 ranges to %s." % (len(records), output))
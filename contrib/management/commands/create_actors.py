@@ -10,9 +10,11 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from django.conf import settings
 from django.contrib.humanize.templatetags.humanize import ordinal
+from django.core.serializers.json import DjangoJSONEncoder
 
 import requests
 import rtyaml
+import json
 
 from contrib.models import Actor, ActorParty, Recipient
 from contrib.bizlogic import DemocracyEngineAPI
@@ -28,7 +30,6 @@ class Command(BaseCommand):
 	args = ''
 	help = 'Creates/updates Actor and Recipient instances.'
 
-	@transaction.atomic
 	def handle(self, *args, **options):
 		# Load and parse current Members of Congress YAML.
 		r = load_yaml_from_url("https://raw.githubusercontent.com/unitedstates/congress-legislators/master/legislators-current.yaml")
@@ -37,8 +38,13 @@ class Command(BaseCommand):
 		de_recips = DemocracyEngineAPI.recipients()
 		de_recips = { r['recipient_id']: r for r in de_recips }
 
-		# Create Actor instances.
-		seen_actors = set()
+		# Load what we have now, once. Nothing is locked while we work out
+		# what changed. Only the changes are written, in short transactions.
+		actors = { actor.govtrack_id: actor for actor in Actor.objects.all() }
+		recipients = { recipient.id: recipient for recipient in Recipient.objects.all() }
+
+		# Work out what the Actor instances should be.
+		current = [ ]
 		for p in r:
 			# The last term is the Member of Congress's current term.
 			term = p['terms'][-1]
@@ -69,60 +75,105 @@ class Command(BaseCommand):
 				'office': "-".join(office),
 			}
 
-			# Kick a former legislator out of office.
-			former_officeholder = Actor.objects.filter(office=fields["office"]).exclude(govtrack_id=p["id"]["govtrack"])
-			if former_officeholder.exists():
-				self.stdout.write('%s now marked as out of office.' % ", ".join([actor.name_long for actor in former_officeholder]))
-				former_officeholder.update(office=None, challenger=None)
-
-			# Create or update.
-			actor, is_new = Actor.objects.get_or_create(
-				govtrack_id = p["id"]["govtrack"],
-				defaults = fields,
-				)
-
-			if not is_new:
-				# Update. These are required fields so we
-				# had to specify them in get_or_create.
-				# Now report what's changed.
-				for k, v in fields.items():
-					if getattr(actor, k) != v:
-						self.stdout.write('%s\t%s=>%s' % (actor.name_long, getattr(actor, k), v))
-					setattr(actor, k, v)
+			# The full congress-legislators record is stored in the Actor instance.
+			# Round-trip it through JSON so it compares equal to what's stored (e.g.
+			# dates become strings).
+			p = json.loads(json.dumps(p, cls=DjangoJSONEncoder))
 
-			# Store the full congress-legislators record in the Actor instance.
-			if actor.extra in (None, ''): actor.extra = { }
-			actor.extra['legislators-current'] = p
-			actor.save()
-			seen_actors.add(actor.id)
+			current.append((p, office, fields))
 
-			if is_new:
+		current_ids = set(p["id"]["govtrack"] for p, office, fields in current)
+		officeholders = { fields["office"]: p["id"]["govtrack"] for p, office, fields in current }
+
+		# Diff the Actors.
+		vacate = [ ] # Actors no longer in office
+		move = [ ] # Actors changing offices
+		new_actors = [ ]
+		changed_actors = [ ] # (Actor, changed fields)
+		for actor in actors.values():
+			if actor.govtrack_id not in current_ids or officeholders.get(actor.office, actor.govtrack_id) != actor.govtrack_id:
+				# Mark all other actors, i.e. ones not in legislators-current, as not-current
+				# by un-setting the 'office' and 'challenger' attributes. Likewise kick a
+				# former legislator out of office.
+				if actor.office is not None or actor.challenger_id is not None:
+					self.stdout.write('%s now marked as out of office.' % actor.name_long)
+					vacate.append(actor.id)
+					actor.office = None
+					actor.challenger_id = None
+		for p, office, fields in current:
+			actor = actors.get(p["id"]["govtrack"])
+			if actor is None:
+				actor = Actor(govtrack_id=p["id"]["govtrack"], extra={ 'legislators-current': p }, **fields)
+				new_actors.append(actor)
 				self.stdout.write('Added: ' + actor.name_long)
+				continue
+
+			# Update, and report what's changed.
+			changed = [ ]
+			for k, v in fields.items():
+				if getattr(actor, k) != v:
+					self.stdout.write('%s\t%s=>%s' % (actor.name_long, getattr(actor, k), v))
+					if k == "office" and actor.office is not None: move.append(actor.id)
+					setattr(actor, k, v)
+					changed.append(k)
+			if actor.extra in (None, ''): actor.extra = { }
+			if actor.extra.get('legislators-current') != p:
+				actor.extra['legislators-current'] = p
+				changed.append('extra')
+			if changed:
+				changed_actors.append((actor, changed))
+
+		# Write the Actor changes. Offices are unique, so take Actors out of their
+		# old offices before putting anyone in new ones.
+		with transaction.atomic():
+			Actor.objects.filter(id__in=vacate).update(office=None, challenger=None)
+			Actor.objects.filter(id__in=move).update(office=None)
+			for actor, changed in changed_actors:
+				actor.save(update_fields=changed)
+			Actor.objects.bulk_create(new_actors)
+		if new_actors:
+			# Get the new Actors' IDs.
+			actors.update({
+				actor.govtrack_id: actor
+				for actor in Actor.objects.filter(govtrack_id__in=[actor.govtrack_id for actor in new_actors]) })
+
+		# Diff the Recipients.
+		incumbent_recipients = { recipient.actor_id: recipient for recipient in recipients.values() if recipient.actor_id }
+		challenger_recipients = { (recipient.office_sought, recipient.party): recipient for recipient in recipients.values() if not recipient.actor_id }
+		new_recipients = [ ]
+		party_changes = { } # party => Recipient IDs
+		active_changes = { } # active => Recipient IDs
+		new_challengers = [ ] # (Actor, office, party, DE ID)
+		def update_recipient_active(recipient):
+			active = (de_recips[recipient.de_id]['status'] == 'active')
+			if recipient.active != active:
+				self.stdout.write('Setting recipient %s active to %s.' % (recipient, str(active)))
+				active_changes.setdefault(active, []).append(recipient.id)
+				recipient.active = active
+		for p, office, fields in current:
+			actor = actors[p["id"]["govtrack"]]
 
 			# Create a Recipient for this Actor.
 			de_id = "p_%d" % actor.govtrack_id
 			if de_id not in de_recips:
 				self.stdout.write('Missing recipient %s for %s!' % (de_id, actor.name_long))
 				continue
+			recipient = incumbent_recipients.get(actor.id)
+			if recipient is None:
+				recipient = Recipient(actor=actor, office_sought=None, de_id=de_id, party=actor.party,
+					active=(de_recips[de_id]['status'] == 'active'))
+				new_recipients.append(recipient)
+				self.stdout.write('Added recipient for: %s (%s)' % (actor.name_long, de_recips[de_id]['name']))
 			else:
-				recipient, is_new = Recipient.objects.get_or_create(
-					actor=actor,
-					office_sought=None,
-					defaults={
-						"de_id": de_id,
-						"party": actor.party,
-					})
-				if is_new:
-					self.stdout.write('Added recipient for: %s (%s)' % (actor.name_long, de_recips[de_id]['name']))
-				elif recipient.party != actor.party:
+				if recipient.party != actor.party:
 					self.stdout.write('Updating party of recipient %s to %s.' % (recipient, actor.party))
+					party_changes.setdefault(actor.party, []).append(recipient.id)
 					recipient.party = actor.party
-					recipient.save()
-				self.update_recipient_active(recipient, de_recips)
+				update_recipient_active(recipient)
 
 			# Create a challenger for the Actor if one is not yet set
 			# and the Actor has an active recipient itself.
-			if actor.challenger is None and recipient.active:
+			if actor.challenger_id is None and recipient.active:
 				party = actor.party.opposite()
 
 				# See if the Democracy Engine recipient exists.
@@ -130,35 +181,44 @@ class Command(BaseCommand):
 				if de_id not in de_recips:
 					self.stdout.write('Missing challenger recipient %s!' % de_id)
 				else:
-					recipient, is_new = Recipient.objects.get_or_create(
-						actor=None,
-						office_sought="-".join(office),
-						party=party,
-						defaults={ "de_id": de_id }
-						)
-					actor.challenger = recipient
-					actor.save()
-					self.stdout.write('%s challenger recipient for %s (%s).' %
-						("Created" if is_new else "Associated", actor.name_long, de_id))
+					new_challengers.append((actor, "-".join(office), party, de_id))
 
 			# Update the 'active' field on the challenger.
-			if actor.challenger:
-				self.update_recipient_active(actor.challenger, de_recips)
-
-		# Mark all other actors, i.e. ones not in legislators-current, as not-current
-		# by un-setting the 'office' and 'challenger' attributes.
-		for actor in Actor.objects.exclude(id__in=seen_actors).exclude(office=None, challenger=None):
-			self.stdout.write('%s now marked as out of office.' % actor.name_long)
-			actor.office = None
-			actor.challenger = None
-			actor.save()
-
-	def update_recipient_active(self, recipient, de_recips):
-		active = (de_recips[recipient.de_id]['status'] == 'active')
-		if recipient.active != active:
-			self.stdout.write('Setting recipient %s active to %s.' % (recipient, str(active)))
-			recipient.active = active
-			recipient.save()
+			elif actor.challenger_id:
+				update_recipient_active(recipients[actor.challenger_id])
+
+		# Write the Recipient changes.
+		with transaction.atomic():
+			Recipient.objects.bulk_create(new_recipients)
+			for party, ids in party_changes.items():
+				Recipient.objects.filter(id__in=ids).update(party=party)
+			for active, ids in active_changes.items():
+				Recipient.objects.filter(id__in=ids).update(active=active)
+			self.set_challengers(new_challengers, challenger_recipients, de_recips)
+
+		self.stdout.write('%d actors added, %d updated, %d out of office; %d recipients added, %d updated, %d challengers set.' % (
+			len(new_actors), len(changed_actors), len(vacate),
+			len(new_recipients), len(set(sum(party_changes.values(), []) + sum(active_changes.values(), []))), len(new_challengers)))
+
+	def set_challengers(self, new_challengers, challenger_recipients, de_recips):
+		# Assigns challenger Recipients to Actors, given a list of (Actor,
+		# office, party, DE ID), creating the Recipients that don't exist yet
+		# in challenger_recipients (keyed by (office, party)). The Recipients'
+		# active flags are set from the Democracy Engine recipients.
+		for actor, office, party, de_id in new_challengers:
+			active = (de_recips[de_id]['status'] == 'active')
+			recipient = challenger_recipients.get((office, party))
+			is_new = recipient is None
+			if is_new:
+				recipient = Recipient.objects.create(actor=None, office_sought=office, party=party, de_id=de_id, active=active)
+				challenger_recipients[(office, party)] = recipient
+			elif recipient.active != active:
+				self.stdout.write('Setting recipient %s active to %s.' % (recipient, str(active)))
+				Recipient.objects.filter(id=recipient.id).update(active=active)
+				recipient.active = active
+			Actor.objects.filter(id=actor.id).update(challenger=recipient)
+			self.stdout.write('%s challenger recipient for %s (%s).' %
+				("Created" if is_new else "Associated", actor.name_long, de_id))
 
 def build_name(p, t, mode):
 	# Based on:
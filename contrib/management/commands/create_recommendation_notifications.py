@@ -0,0 +1,22 @@
+# Create notifications for new TriggerRecommendations
+# ---------------------------------------------------
+#
+# For each TriggerRecommendation that hasn't had its notifications created
+# yet, notify the users who took action on one trigger but not the other.
+# Safe to interrupt and run again.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from contrib.models import TriggerRecommendation
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Creates notifications for users for new TriggerRecommendations.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--chunk-size', type=int, default=1000, help='The number of notifications to create at a time.')
+
+	def handle(self, *args, **options):
+		for tr in TriggerRecommendation.objects.filter(notifications_created=False).select_related('trigger1', 'trigger2'):
+			count = tr.create_initial_notifications(chunk_size=options['chunk_size'])
+			print("%s: created %d notifications." % (tr, count))
@@ -5,15 +5,28 @@ from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 
 from contrib.models import ContributorInfo
+from contrib.geocoder import geocode_profiles
+
+import sys, tqdm
 
 class Command(BaseCommand):
 	args = ''
 	help = 'Geocodes ContributorInfos.'
 
+	batch_size = 500
+
+	def add_arguments(self, parser):
+		parser.add_argument('--threads', type=int, default=4, help='The number of concurrent geocoder requests.')
+		parser.add_argument('--rate', type=float, default=5, help='The maximum number of geocoder requests per second.')
+
 	def handle(self, *args, **options):
-		profiles = ContributorInfo.objects.filter(is_geocoded=False)
-		for profile in profiles:
-			try:
-				profile.geocode()
-			except OSError as e:
-				print(profile.id, profile, e)
+		# Only the IDs are loaded up front, then the profiles are geocoded
+		# in batches.
+		ids = list(ContributorInfo.objects.filter(is_geocoded=False).order_by('id').values_list('id', flat=True))
+		batches = range(0, len(ids), self.batch_size)
+		if sys.stdout.isatty(): batches = tqdm.tqdm(batches)
+		for i in batches:
+			profiles = ContributorInfo.objects.filter(id__in=ids[i:i+self.batch_size])
+			errors = geocode_profiles(profiles, threads=options['threads'], rate=options['rate'])
+			for address_hash, e in errors:
+				print(address_hash, e)
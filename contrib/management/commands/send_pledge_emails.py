@@ -1,9 +1,13 @@
 # Send pre- and post- pledge execution emails
 # -------------------------------------------
+#
+# The emails are queued and sent by send_queued_emails, which records
+# that they were sent.
 
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.utils import timezone
+from django.db.models import Count
 
 from datetime import timedelta
 
@@ -11,7 +15,7 @@ from contrib.models import Pledge, TriggerStatus, PledgeStatus, IncompletePledge
 from contrib.bizlogic import get_pledge_recipients, compute_charge
 from itfsite.middleware import get_branding
 
-from htmlemailer import send_mail
+from itfsite.mailer import SharedContextCache, queue_mail
 
 class Command(BaseCommand):
 	args = ''
@@ -22,7 +26,8 @@ class Command(BaseCommand):
 		self.send_pledge_emails('post')
 		self.send_incomplete_pledge_emails()
 
-	def send_pledge_emails(self, pre_or_post):
+	def send_pledge_emails(self, pre_or_post, triggers=None):
+		# If triggers is given, only pledges for those Triggers are emailed.
 		if pre_or_post == "pre":
 			# Pledges on executed triggers that have not yet been
 			# executed, are confirmed (have a user account), and
@@ -52,50 +57,95 @@ class Command(BaseCommand):
 		else:
 			raise ValueError()
 
-		# Send email for each.
-		pledges = pledges.select_related("user")
+		if triggers is not None:
+			pledges = pledges.filter(trigger__in=triggers)
+
+		# Apply a post-db-query filter.
+		pledges = pledges.select_related("user", "profile", "trigger", "via_campaign")
+		if pre_or_post == "post":
+			# The number of contributions goes into the targets summary.
+			pledges = pledges.select_related("execution")\
+				.annotate(contributions_count=Count('execution__contributions'))
+		pledges = (pledge for pledge in pledges if pledge_filter(pledge))
+
+		# Queue an email for each. Most of each email is the same for all
+		# of the pledges on a trigger with the same options, so those parts
+		# are computed once and shared.
+		shared = SharedContextCache()
+		queued = 0
 		for pledge in pledges:
-			# Apply a post-db-query filter.
-			if not pledge_filter(pledge):
-				continue
-
-			# Send email.
-			self.send_pledge_email(pre_or_post, pledge)
-
-	def send_pledge_email(self, pre_or_post, pledge):
-		# What will happen when the pledge is executed?
-		recipients = get_pledge_recipients(pledge)
+			try:
+				if self.send_pledge_email(pre_or_post, pledge, shared):
+					queued += 1
+			except Exception as e:
+				# Don't let one bad pledge hold up the others.
+				print(pledge, e)
+		if queued:
+			print("Queued %d %s-execution emails." % (queued, pre_or_post))
+
+	def send_pledge_email(self, pre_or_post, pledge, shared=None):
+		# Queues the email. Returns False if there was nothing to send or
+		# it was already queued.
+		# The pledge's *_execution_email_sent_at field is set when it is
+		# sent. shared is a SharedContextCache used across calls.
+		if shared is None: shared = SharedContextCache()
+
+		# What will happen when the pledge is executed? The recipients
+		# depend only on the trigger and the pledge's filters, unless the
+		# pledge uses the actions of other triggers.
+		if not pledge.extra or not pledge.extra.get("triggers"):
+			recipients = shared.get(
+				("recipients", pledge.trigger_id, pledge.desired_outcome, pledge.incumb_challgr, pledge.filter_party),
+				lambda : get_pledge_recipients(pledge))
+		else:
+			recipients = get_pledge_recipients(pledge)
 		if len(recipients) == 0:
 			# This pledge will result in nothing happening. There is
 			# no need to email.
-			return
+			return False
 		recip_contribs, fees, total_charge = compute_charge(pledge, recipients)
 
-		context = { }
-		context.update(get_branding(pledge.via_campaign.brand))
+		# The parts of the email that are the same for all pledges on
+		# the same trigger and campaign (and so brand) with the same filters.
+		contributions_count = getattr(pledge, "contributions_count", None)
+		context = dict(shared.get(
+			("context", pledge.trigger_id, pledge.via_campaign_id, pledge.desired_outcome, pledge.incumb_challgr, pledge.filter_party, pledge.status, contributions_count),
+			lambda : self.get_shared_context(pledge, contributions_count)))
+
+		# And the parts that are specific to the recipient.
 		context.update({
 			"profile": pledge.profile, # used in salutation in email_template
 			"pledge": pledge,
-			"until": Pledge.current_algorithm()['pre_execution_warn_time'][1],
 			"total_charge": total_charge,
 		})
 
-		# Send email.
-		send_mail(
+		# Queue email.
+		return queue_mail(
 			"contrib/mail/%s_execution" % pre_or_post,
 			context["MAIL_FROM_EMAIL"],
 			[pledge.user.email],
-			context)
+			context,
+			key="pledge-%s-execution:%d" % (pre_or_post, pledge.id),
+			on_sent=[("contrib.Pledge", "%s_execution_email_sent_at" % pre_or_post, [pledge.id])]) is not None
 
-		# Record that it was sent.
-		field_name = "%s_execution_email_sent_at" % pre_or_post
-		setattr(pledge, field_name, timezone.now())
-		pledge.save(update_fields=[field_name])
+	def get_shared_context(self, pledge, contributions_count):
+		# Returns the template context variables that are the same for all
+		# pledges on pledge's trigger and campaign with pledge's filters.
+		context = { }
+		context.update(get_branding(pledge.via_campaign.brand))
+		context.update({
+			"targets_summary": pledge.get_targets_summary(contributions_count=contributions_count),
+			"trigger_strings": pledge.trigger.trigger_type.strings,
+			"campaign_url": pledge.via_campaign.get_short_url(),
+			"until": Pledge.current_algorithm()['pre_execution_warn_time'][1],
+		})
+		return context
 
 	def send_incomplete_pledge_emails(self):
 		# For every IncompletePledge instance that has not yet been
-		# sent a reminder email, send one. Wait at least some hours
-		# after the user left the page.
+		# sent a reminder email, queue one. Wait at least some hours
+		# after the user left the page. sent_followup_at is set when
+		# it is sent.
 		before = timezone.now() - timedelta(hours=3)
 		for ip in IncompletePledge.objects.filter(created__lt=before, sent_followup_at=None):
 			context = { }
@@ -106,16 +156,14 @@ class Command(BaseCommand):
 				"trigger": ip.trigger,
 			})
 
-			# Send email.
-			send_mail(
+			# Queue email.
+			queue_mail(
 				"contrib/mail/incomplete_pledge",
 				get_branding(ip.via_campaign.brand)["MAIL_FROM_EMAIL"],
 				[ip.email],
 				context,
 				headers={
 					"Reply-To": get_branding(ip.via_campaign.brand)["CONTACT_EMAIL"],
-				})
-
-			# Record that it was sent.
-			ip.sent_followup_at = timezone.now()
-			ip.save()
+				},
+				key="incomplete-pledge:%d" % ip.id,
+				on_sent=[("contrib.IncompletePledge", "sent_followup_at", [ip.id])])
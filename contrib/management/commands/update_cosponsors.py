@@ -6,7 +6,7 @@
 from django.core.management.base import BaseCommand, CommandError
 
 from contrib.models import Trigger
-from contrib.legislative import create_trigger_for_sponsors, create_trigger_for_sponsors_with_companion_bill
+from contrib.legislative import create_trigger_for_sponsors, create_trigger_for_sponsors_with_companion_bill, prefetch_sponsors_data
 from itfsite.views import update_automatic_campaign_from_trigger
 
 import tqdm
@@ -15,7 +15,23 @@ class Command(BaseCommand):
 	args = ''
 	help = 'Update bill cosponsor triggers.'
 
+	def add_arguments(self, parser):
+		parser.add_argument('--threads', type=int, default=8, help='The number of concurrent GovTrack API requests.')
+		parser.add_argument('--rate', type=float, default=5, help='The maximum number of GovTrack API requests per second.')
+
 	def handle(self, *args, **options):
+		# Fetch all of the GovTrack data we'll need concurrently up front. It
+		# goes into the HTTP cache, so the updates below don't wait on the network.
+		bill_ids = [
+			key[len("usbill:sponsors:"):]
+			for key in Trigger.objects.filter(key__startswith="usbill:sponsors:").values_list('key', flat=True)]
+		companion_bill_ids = [
+			key[len("usbill:sponsors-with-companion:"):]
+			for key in Trigger.objects.filter(key__startswith="usbill:sponsors-with-companion:").values_list('key', flat=True)]
+		errors = prefetch_sponsors_data(bill_ids, companion_bill_ids, threads=options['threads'], rate=options['rate'])
+		for url, e in errors:
+			print("Could not prefetch %s: %s" % (url, e))
+
 		# Regular sponsors triggers. Set update=True to force a GovTrack API query.
 		prefix = "usbill:sponsors:"
 		for trigger in tqdm.tqdm(Trigger.objects.filter(key__startswith=prefix), desc=prefix.rstrip(":")):
@@ -0,0 +1,104 @@
+# Watch for congressional votes and execute triggers.
+# ---------------------------------------------------
+#
+# Polls GovTrack's feed of recent roll call votes. When a passage vote
+# occurs on a bill that an Open trigger is waiting on, the trigger is
+# executed with that vote and the pre-execution emails for its pledges
+# are queued right away. Runs until killed, or just once with --once.
+#
+# With settings.LOAD_REMOTE_DATA_FROM_FIXTURES, the feed is read from
+# the fixtures directory like all other GovTrack data.
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from contrib.models import Trigger, TriggerStatus
+from contrib.legislative import execute_trigger_from_data_urls, parse_uscapitol_local_time
+from contrib.utils import query_json_api
+
+import time, traceback
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Polls for new congressional votes and executes the Open triggers they decide.'
+
+	feed_url = "https://www.govtrack.us/api/v2/vote"
+
+	# Only these kinds of votes decide a trigger on a bill. (Votes on
+	# amendments, cloture, etc. also list the bill as the related bill.)
+	vote_categories = ('passage', 'passage-suspension', 'veto-override')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--once', action='store_true', help='Check for new votes once and exit.')
+		parser.add_argument('--interval', type=int, default=120, help='The number of seconds to wait between checks.')
+		parser.add_argument('--dry-run', action='store_true', help='Report what triggers would be executed, but do not execute them.')
+		parser.add_argument('--include-old-votes', action='store_true', help='Also execute triggers with votes that occurred before the triggers were created.')
+
+	def handle(self, *args, **options):
+		while True:
+			try:
+				self.check_votes(options['dry_run'], options['include_old_votes'])
+			except Exception:
+				# Keep watching after transient errors, e.g. if GovTrack is down.
+				if options['once']: raise
+				traceback.print_exc()
+
+			if options['once']:
+				break
+
+			# Don't hold a database connection open while sleeping.
+			close_old_connections()
+			time.sleep(options['interval'])
+
+	def check_votes(self, dry_run, include_old_votes=False):
+		# Get the most recent votes, oldest first so that a trigger for
+		# whichever chamber votes first ('x') is executed by the first vote.
+		votes = query_json_api(self.feed_url, { "order_by": "-created", "limit": 100 }, max_age=0)['objects']
+		votes.sort(key = lambda vote : vote['created'])
+
+		# Get the Open triggers for bills, by GovTrack bill ID.
+		triggers = { }
+		for t in Trigger.objects.filter(status=TriggerStatus.Open, key__startswith="usbill:"):
+			if (t.extra or {}).get("type") != "usbill": continue
+			triggers.setdefault(t.extra["govtrack_bill_id"], []).append(t)
+
+		executed = []
+		for vote in votes:
+			if vote['category'] not in self.vote_categories: continue
+
+			bill = vote.get('related_bill')
+			if isinstance(bill, dict): bill = bill['id']
+			for t in triggers.get(bill, []):
+				# Has the trigger already been executed by an earlier vote?
+				if t in executed: continue
+
+				# Is the trigger for this chamber?
+				if t.extra["chamber"] not in ('x', vote['chamber'][0]): continue
+
+				# Ignore votes that occurred before the trigger was created,
+				# since pledges were made on the expectation of a future vote,
+				# unless --include-old-votes is given (e.g. to test with the
+				# fixture votes, which are old).
+				if parse_uscapitol_local_time(vote['created']) < t.created and not include_old_votes:
+					continue
+
+				print("Executing %s with %s." % (t, vote['link']))
+				if dry_run:
+					executed.append(t)
+					continue
+
+				try:
+					execute_trigger_from_data_urls(t, [{ "url": vote['link'] }])
+				except Exception:
+					# Don't let one bad trigger hold up the others.
+					traceback.print_exc()
+					continue
+
+				executed.append(t)
+
+		# Queue the pre-execution emails for the pledges on the triggers
+		# that were just executed, so the clock on executing them starts
+		# when the queue is next sent rather than at the next cron run.
+		if executed and not dry_run:
+			from contrib.management.commands.send_pledge_emails import Command as SendPledgeEmails
+			SendPledgeEmails().send_pledge_emails('pre', triggers=executed)
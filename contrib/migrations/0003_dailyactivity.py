@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2016-08-15 14:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_daily_activity(apps, schema_editor):
+    # Fill in the buckets for the activity before this migration.
+    import contrib.models
+    contrib.models.DailyActivity.rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itfsite', '0001_initial'),
+        ('contrib', '0002_auto_20160727_0725'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True, help_text="The day (in the site's time zone) that the activity occurred on.")),
+                ('pledge_count', models.IntegerField(default=0, help_text='The number of Pledges made on this day, including those later cancelled.')),
+                ('pledge_amount', models.DecimalField(decimal_places=2, default=0, help_text='The total amount of the Pledges made on this day, including those later cancelled.', max_digits=10)),
+                ('cancel_count', models.IntegerField(default=0, help_text='The number of Pledges cancelled on this day.')),
+                ('execution_count', models.IntegerField(default=0, help_text='The number of Pledges executed on this day.')),
+                ('contribution_count', models.IntegerField(default=0, help_text='The number of (non-voided) Contributions made by Pledges executed on this day.')),
+                ('contribution_amount', models.DecimalField(decimal_places=2, default=0, help_text='The total amount of (non-voided) Contributions made by Pledges executed on this day, excluding fees.', max_digits=10)),
+                ('fees', models.DecimalField(decimal_places=2, default=0, help_text='The total fees of (non-voided) Pledges executed on this day.', max_digits=10)),
+                ('trigger', models.ForeignKey(help_text='The Trigger that the Pledges were made for.', on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity', to='contrib.Trigger')),
+                ('via_campaign', models.ForeignKey(blank=True, help_text='The Campaign that the Pledges were made via.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity', to='itfsite.Campaign')),
+            ],
+            options={
+                'verbose_name_plural': 'daily activity',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyactivity',
+            unique_together=set([('date', 'trigger', 'via_campaign')]),
+        ),
+        migrations.RunPython(backfill_daily_activity, migrations.RunPython.noop),
+    ]
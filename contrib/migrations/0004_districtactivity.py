@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2016-08-17 10:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_district_activity(apps, schema_editor):
+    # Fill in the rollups for the Pledges executed before this migration.
+    import contrib.models
+    contrib.models.DistrictActivity.rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contrib', '0003_dailyactivity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistrictActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('district', models.CharField(db_index=True, help_text='The congressional district of the users, in the same form as PledgeExecution.district.', max_length=4)),
+                ('pledge_count', models.IntegerField(default=0, help_text='The number of executed Pledges from users in the district.')),
+                ('contribution_count', models.IntegerField(default=0, help_text='The number of Contributions made by those Pledges.')),
+                ('contribution_amount', models.DecimalField(decimal_places=2, default=0, help_text='The total amount of Contributions made by those Pledges, excluding fees.', max_digits=10)),
+                ('trigger', models.ForeignKey(help_text='The Trigger that the Pledges were made for.', on_delete=django.db.models.deletion.CASCADE, related_name='district_activity', to='contrib.Trigger')),
+            ],
+            options={
+                'verbose_name_plural': 'district activity',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='districtactivity',
+            unique_together=set([('district', 'trigger')]),
+        ),
+        migrations.RunPython(backfill_district_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2016-08-19 16:12
+from __future__ import unicode_literals
+
+import contrib.models
+from django.db import migrations, models
+import django.db.models.deletion
+import enumfields.fields
+
+
+def backfill_user_sketches(apps, schema_editor):
+    # Fill in the sketches for the Pledges made before this migration.
+    contrib.models.UserSketch.rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itfsite', '0001_initial'),
+        ('contrib', '0004_districtactivity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', enumfields.fields.EnumIntegerField(enum=contrib.models.UserSketchKind, help_text='Which users are counted in the sketch.')),
+                ('registers', models.BinaryField(help_text='The registers of the HyperLogLog sketch (see contrib.hll).')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('trigger', models.ForeignKey(help_text='The Trigger that the users made Pledges for.', on_delete=django.db.models.deletion.CASCADE, related_name='user_sketches', to='contrib.Trigger')),
+                ('via_campaign', models.ForeignKey(blank=True, help_text='The Campaign that the users made Pledges via.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='user_sketches', to='itfsite.Campaign')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='usersketch',
+            unique_together=set([('trigger', 'via_campaign', 'kind')]),
+        ),
+        migrations.RunPython(backfill_user_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2016-08-22 09:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_referral_activity(apps, schema_editor):
+    # Fill in the rollups for the activity before this migration.
+    import contrib.models
+    contrib.models.ReferralActivity.rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itfsite', '0001_initial'),
+        ('contrib', '0005_usersketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True, help_text="The day (in the site's time zone) that the activity occurred on.")),
+                ('ref_code', models.CharField(blank=True, db_index=True, help_text='The normalized referral code (see normalize_ref_code), or the empty string for activity without one.', max_length=24)),
+                ('incomplete_count', models.IntegerField(default=0, help_text='The number of IncompletePledges created, i.e. users who entered an email address for a new account.')),
+                ('pledge_count', models.IntegerField(default=0, help_text='The number of Pledges made, including those later cancelled.')),
+                ('pledge_amount', models.DecimalField(decimal_places=2, default=0, help_text='The total amount of the Pledges made, including those later cancelled.', max_digits=10)),
+                ('confirmed_count', models.IntegerField(default=0, help_text='The number of Pledges that became tied to a confirmed user account, either when made by a logged-in user or when an anonymous user confirmed their email address.')),
+                ('execution_count', models.IntegerField(default=0, help_text='The number of Pledges executed.')),
+                ('contribution_amount', models.DecimalField(decimal_places=2, default=0, help_text='The total amount of Contributions made by the Pledges executed, excluding fees.', max_digits=10)),
+                ('via_campaign', models.ForeignKey(blank=True, help_text='The Campaign that the activity was on.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='referral_activity', to='itfsite.Campaign')),
+            ],
+            options={
+                'verbose_name_plural': 'referral activity',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='referralactivity',
+            unique_together=set([('date', 'via_campaign', 'ref_code')]),
+        ),
+        migrations.RunPython(backfill_referral_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2016-08-29 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import itfsite.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contrib', '0006_referralactivity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address_hash', models.CharField(help_text='The SHA1 hash of the normalized address, see contrib.geocoder.', max_length=40, unique=True)),
+                ('result', itfsite.utils.JSONField(help_text="The geocoder result, in the same format as ContributorInfo.extra['geocode'].")),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, help_text='When the address was geocoded.')),
+            ],
+        ),
+    ]
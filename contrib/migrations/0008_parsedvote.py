@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2016-09-01 11:24
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import itfsite.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contrib', '0007_geocodecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParsedVote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(help_text='The GovTrack vote page URL.', max_length=256, unique=True)),
+                ('metadata', itfsite.utils.JSONField(help_text="GovTrack's JSON metadata for the vote.")),
+                ('voters', itfsite.utils.JSONField(help_text='How each Member of Congress voted, as a list of [GovTrack ID, vote option key] pairs.')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -194,6 +194,7 @@ class Trigger(models.Model):
 		# or None if the Actor didn't properly participate or a string
 		# meaning the Actor didn't participate and the string gives
 		# the reason_for_no_outcome value.
+		actions = []
 		for actor_outcome in actor_outcomes:
 			# If an Actor has an inactive_reason set, then we ignore
 			# any outcome supplied to us and replace it with that.
@@ -201,7 +202,10 @@ class Trigger(models.Model):
 			if actor_outcome["actor"].inactive_reason:
 				actor_outcome["outcome"] = actor_outcome["actor"].inactive_reason
 
-			ac = Action.create(te, actor_outcome["actor"], actor_outcome["outcome"], actor_outcome.get("action_time"))
+			actions.append(Action.build(te, actor_outcome["actor"], actor_outcome["outcome"], actor_outcome.get("action_time")))
+
+		# Insert them all at once.
+		Action.objects.bulk_create(actions)
 
 		# Mark as executed.
 		trigger.status = TriggerStatus.Executed
@@ -287,6 +291,106 @@ class TriggerRecommendation(models.Model):
 		if not override_immutable_check and self.id: raise Exception("This model is immutable.")
 		super(TriggerRecommendation, self).save(*args, **kwargs)
 
+	def get_notification_targets(self):
+		# Returns a list of (QuerySet of User IDs, Trigger) pairs, one for
+		# each direction of the recommendation, of users who took action
+		# on one trigger but not the other (and so should be recommended
+		# the other trigger) and that haven't already been notified about
+		# this recommendation.
+		from itfsite.models import Notification, NotificationType
+		notified = Notification.objects.filter(
+			notif_type=NotificationType.TriggerRecommendation,
+			source_content_type=ContentType.objects.get_for_model(self),
+			source_object_id=self.id)\
+			.values('user')
+		def users_to_notify(took_action_on, recommended):
+			return Pledge.objects\
+				.filter(trigger=took_action_on)\
+				.exclude(user=None)\
+				.exclude(user__in=Pledge.objects.filter(trigger=recommended).exclude(user=None).values('user'))\
+				.exclude(user__in=notified)\
+				.values_list('user', flat=True)\
+				.distinct()\
+				.order_by('user')
+		targets = [(users_to_notify(self.trigger1, self.trigger2), self.trigger2)]
+		if self.symmetric:
+			targets.append((users_to_notify(self.trigger2, self.trigger1), self.trigger1))
+		return targets
+
+	def create_initial_notifications(self, chunk_size=1000):
+		# Creates a Notification for every user who took action on trigger1
+		# (and, if symmetric, on trigger2) but not on the other trigger, in
+		# chunks of bulk inserts. Each chunk is committed on its own and
+		# users already notified are skipped, so if this is interrupted it
+		# can just be run again. notifications_created is set at the end.
+		# Returns the number of Notifications created.
+		from django.db import transaction, IntegrityError
+		from itfsite.models import Notification, NotificationType
+
+		source_content_type = ContentType.objects.get_for_model(self)
+		count = 0
+		for users, recommended in self.get_notification_targets():
+			last_user = 0
+			while True:
+				user_ids = list(users.filter(user__gt=last_user)[0:chunk_size])
+				if not user_ids: break
+				last_user = user_ids[-1]
+
+				def create():
+					Notification.objects.bulk_create(
+						Notification(
+							user_id=user_id,
+							notif_type=NotificationType.TriggerRecommendation,
+							source_content_type=source_content_type,
+							source_object_id=self.id,
+							extra={ "trigger": recommended.id })
+						for user_id in user_ids)
+				try:
+					with transaction.atomic():
+						create()
+				except IntegrityError:
+					# Some of these users were just notified by another process,
+					# so skip them (the query excludes notified users).
+					user_ids = list(users.filter(user__in=user_ids))
+					with transaction.atomic():
+						create()
+				Notification.invalidate_cache(user_ids)
+				count += len(user_ids)
+
+		TriggerRecommendation.objects.filter(id=self.id).update(notifications_created=True)
+		self.notifications_created = True
+		return count
+
+	@staticmethod
+	def render_notifications(notifications):
+		# Renders TriggerRecommendation Notifications into alerts for
+		# itfsite.models.Notification.render.
+		from itfsite.models import Campaign, CampaignStatus
+		triggers = Trigger.objects.in_bulk(set(n.extra["trigger"] for n in notifications))
+		campaigns = { }
+		for campaign in Campaign.objects.filter(contrib_triggers__in=triggers.keys(), status=CampaignStatus.Open).prefetch_related('contrib_triggers'):
+			for trigger in campaign.contrib_triggers.all():
+				campaigns.setdefault(trigger.id, campaign)
+
+		alerts = []
+		for n in notifications:
+			trigger = triggers.get(n.extra["trigger"])
+			campaign = campaigns.get(n.extra["trigger"])
+			if not trigger or not campaign:
+				# The trigger or its campaign is gone, so there's nothing to recommend.
+				continue
+			alerts.append({
+				"title": trigger.title,
+				"body_html": """<p>You might also be interested in <a href="{{url}}">{{trigger.title}}</a>.</p>""",
+				"body_text": """You might also be interested in {{trigger.title}}: {{url}}""",
+				"body_context": {
+					"trigger": trigger,
+					"url": campaign.get_short_url(),
+				},
+				"notifications": [n],
+			})
+		return alerts
+
 
 class TriggerCustomization(models.Model):
 	"""The specialization of a trigger for an Organization."""
@@ -464,6 +568,14 @@ class Action(models.Model):
 
 	@staticmethod
 	def create(execution, actor, outcome, action_time):
+		a = Action.build(execution, actor, outcome, action_time)
+		a.save()
+		return a
+
+	@staticmethod
+	def build(execution, actor, outcome, action_time):
+		# Returns a new, unsaved Action, e.g. for use with bulk_create.
+
 		# outcome can be an integer giving the Trigger's outcome index
 		# that the Actor did . . .
 		if isinstance(outcome, int):
@@ -486,14 +598,26 @@ class Action(models.Model):
 
 		# Copy fields that may change on the Actor but that we want to know what they were
 		# at the time this Action ocurred.
-		for f in ('name_long', 'name_short', 'name_sort', 'party', 'title', 'office', 'extra', 'challenger'):
+		# (Copy challenger_id rather than challenger so that we don't need to
+		# fetch the Recipient.)
+		for f in ('name_long', 'name_short', 'name_sort', 'party', 'title', 'office', 'extra', 'challenger_id'):
 			setattr(a, f, getattr(actor, f))
 
-		# Save.
-		a.save()
 		return a
 
 
+class ParsedVote(models.Model):
+	"""A roll call vote loaded from GovTrack, stored so it is only fetched and parsed once. See contrib.votes."""
+
+	url = models.CharField(max_length=256, unique=True, help_text="The GovTrack vote page URL.")
+	metadata = JSONField(help_text="GovTrack's JSON metadata for the vote.")
+	voters = JSONField(help_text="How each Member of Congress voted, as a list of [GovTrack ID, vote option key] pairs.")
+	created = models.DateTimeField(auto_now_add=True, db_index=True)
+	updated = models.DateTimeField(auto_now=True, db_index=True)
+
+	def __str__(self):
+		return self.url
+
 #####################################################################
 #
 # Pledges
@@ -559,16 +683,11 @@ class ContributorInfo(models.Model):
 
 	def geocode(self):
 		# Updates this record with geocoder information, especially congressional district
-		# and timezone.
-		from contrib.legislative import geocode
-		info = geocode([
-			self.extra['contributor']['contribAddress'],
-			self.extra['contributor']['contribCity'],
-			self.extra['contributor']['contribState'],
-			self.extra['contributor']['contribZip']])
-		self.extra['geocode'] = info
-		self.is_geocoded = True
-		self.save(update_fields=['is_geocoded', 'extra'], override_immutable_check=True)
+		# and timezone. See contrib.geocoder.geocode_profiles to do many at once.
+		from contrib.geocoder import geocode_profiles
+		errors = geocode_profiles([self])
+		if errors:
+			raise errors[0][1]
 
 	@staticmethod
 	def find_from_cc(cc_number):
@@ -600,6 +719,16 @@ class ContributorInfo(models.Model):
 			},
 		})
 
+class GeocodeCache(models.Model):
+	"""A geocoder result for a normalized address, so that the same address is only geocoded once."""
+
+	address_hash = models.CharField(max_length=40, unique=True, help_text="The SHA1 hash of the normalized address, see contrib.geocoder.")
+	result = JSONField(help_text="The geocoder result, in the same format as ContributorInfo.extra['geocode'].")
+	created = models.DateTimeField(auto_now_add=True, db_index=True, help_text="When the address was geocoded.")
+
+	def __str__(self):
+		return self.address_hash
+
 class PledgeStatus(enum.Enum):
 	Open = 1
 	Executed = 2
@@ -684,6 +813,18 @@ class Pledge(models.Model):
 			self.trigger.total_pledged = models.F('total_pledged') + self.amount
 			self.trigger.save(update_fields=['pledge_count', 'total_pledged'])
 
+		# Count the new Pledge in the day's activity.
+		if is_new:
+			DailyActivity.record(self.created, self.trigger, self.via_campaign,
+				pledge_count=1, pledge_amount=self.amount)
+			ReferralActivity.record(self.created, self.via_campaign, self.ref_code,
+				pledge_count=1, pledge_amount=self.amount, confirmed_count=1 if self.user else 0)
+
+		# Count the user in the sketch of users pledging if this is a
+		# confirmed Pledge.
+		if is_new and self.user:
+			UserSketch.add(UserSketchKind.Pledging, self.trigger, self.via_campaign, self.user)
+
 	@transaction.atomic
 	def delete(self):
 		if self.status != PledgeStatus.Open:
@@ -699,6 +840,9 @@ class Pledge(models.Model):
 		# Archive as a cancelled pledge.
 		cp = CancelledPledge.from_pledge(self)
 
+		# Count the cancellation in the day's activity.
+		DailyActivity.record(timezone.now(), self.trigger, self.via_campaign, cancel_count=1)
+
 		# Remove record. Will raise an exception and abort the transaction if
 		# the pledge has been executed and a PledgeExecution object refers to this.
 		super(Pledge, self).delete()	
@@ -741,7 +885,12 @@ class Pledge(models.Model):
 
 	@property
 	def targets_summary(self):
-		# This is mirrored in pledge_form.html.
+		return self.get_targets_summary()
+
+	def get_targets_summary(self, contributions_count=None):
+		# This is mirrored in pledge_form.html. For executed pledges,
+		# contributions_count can be passed if it's already known to save
+		# a query.
 
 		def outcome_label(outcome):
 			x = self.trigger.outcomes[outcome]
@@ -773,6 +922,8 @@ class Pledge(models.Model):
 			# goes to incumbents and challengers, no party filter
 			if self.status != PledgeStatus.Executed:
 				count = "up to %d" % self.trigger.max_split()
+			elif contributions_count is not None:
+				count = str(contributions_count)
 			else:
 				count = str(self.execution.contributions.count())
 			return "%s %s, each getting a part of your contribution if they %s %s, but if they %s %s their part of your contribution will go to their next general election opponent" \
@@ -788,28 +939,56 @@ class Pledge(models.Model):
 	def is_from_long_ago(self):
 		return timezone.now() - self.created > timedelta(days=21)
 
-	def set_confirmed_user(self, user, request):
+	@staticmethod
+	def confirm_anonymous_pledges(anon_user, user):
+		# Moves the anonymous user's Pledges to the user's account now that
+		# they've confirmed their email address. Returns a pair of lists of
+		# the Pledges that were confirmed and that were deleted instead.
+		#
 		# The user may have anonymously created a second Pledge for the same
 		# trigger. We can't tell them before they confirm their email that
-		# they already made a pledge. We can't confirm both --- warn the user
-		# and go on.
-
-		from django.contrib import messages
-
-		if self.trigger.pledges.filter(user=user).exists():
-			messages.add_message(request, messages.ERROR, 'You had a previous contribution already scheduled for the same thing. Your more recent contribution will be ignored.')
-			self.delete() # else we will try to confirm the email address indefinitely, but the AnonymousUser for this is already confirmed, so it would be an error
-			return
-
-		# Move this anonymous pledge to the user's account.
-		self.user = user
-		self.anon_user = None
-		self.email_confirmed_at = timezone.now()
-		self.save(update_fields=['user', 'anon_user', 'email_confirmed_at'])
-
-		# Let the user know what happened.
-		messages.add_message(request, messages.SUCCESS, 'Your contribution regarding %s has been confirmed.'
-			% self.trigger.title)
+		# they already made a pledge. We can't confirm both --- the more
+		# recent one is deleted (else we will try to confirm the email address
+		# indefinitely, but the AnonymousUser for this is already confirmed,
+		# so it would be an error).
+		pledges = list(Pledge.objects.filter(anon_user=anon_user)
+			.select_related('trigger', 'via_campaign')
+			.order_by('created'))
+		taken = set(Pledge.objects
+			.filter(user=user, trigger__in=set(p.trigger_id for p in pledges))
+			.values_list('trigger', flat=True))
+		confirmed = []
+		duplicates = []
+		for p in pledges:
+			if p.trigger_id in taken:
+				duplicates.append(p)
+			else:
+				confirmed.append(p)
+				taken.add(p.trigger_id)
+
+		for p in duplicates:
+			p.delete()
+
+		# Move the other pledges to the user's account.
+		now = timezone.now()
+		Pledge.objects.filter(id__in=[p.id for p in confirmed])\
+			.update(user=user, anon_user=None, email_confirmed_at=now)
+		for p in confirmed:
+			p.user = user
+			p.anon_user = None
+			p.email_confirmed_at = now
+
+		# Update the stats once per trigger & campaign and referral code.
+		for trigger, via_campaign in set((p.trigger, p.via_campaign) for p in confirmed):
+			UserSketch.add(UserSketchKind.Pledging, trigger, via_campaign, user)
+		referrals = { }
+		for p in confirmed:
+			key = (p.via_campaign, ReferralActivity.normalize_ref_code(p.ref_code))
+			referrals[key] = referrals.get(key, 0) + 1
+		for (via_campaign, ref_code), count in referrals.items():
+			ReferralActivity.record(now, via_campaign, ref_code, confirmed_count=count)
+
+		return (confirmed, duplicates)
 
 	def needs_pre_execution_email(self):
 		# If the user confirmed their email address after the trigger
@@ -908,6 +1087,8 @@ class Pledge(models.Model):
 			pe.problem = problem
 			pe.charged = total_charge
 			pe.fees = fees
+			if pledge.profile.is_geocoded:
+				pe.district = pledge.profile.extra['geocode'].get('cd114')
 			pe.extra = {
 				"donation": de_don, # donation record, which refers to transactions
 				"exception": exception, 
@@ -939,6 +1120,25 @@ class Pledge(models.Model):
 				trigger_execution.pledge_count_with_contribs = models.F('pledge_count_with_contribs') + 1
 			trigger_execution.save(update_fields=['pledge_count', 'pledge_count_with_contribs'])
 
+			# Count the execution in the day's, district's, and referral code's activity.
+			contrib_amount = sum(amount for action, recipient_type, recipient, amount in recip_contribs)
+			DailyActivity.record(pe.created, pledge.trigger, pledge.via_campaign,
+				execution_count=1,
+				contribution_count=len(recip_contribs),
+				contribution_amount=contrib_amount,
+				fees=fees if problem == PledgeExecutionProblem.NoProblem else 0)
+			DistrictActivity.record(pe.district, pledge.trigger,
+				pledge_count=1,
+				contribution_count=len(recip_contribs),
+				contribution_amount=contrib_amount)
+			ReferralActivity.record(pe.created, pledge.via_campaign, pledge.ref_code,
+				execution_count=1,
+				contribution_amount=contrib_amount)
+
+			# Count the user in the sketch of users contributing.
+			if problem == PledgeExecutionProblem.NoProblem and pledge.user:
+				UserSketch.add(UserSketchKind.Contributing, pledge.trigger, pledge.via_campaign, pledge.user)
+
 		except Exception as e:
 			# If a DE transaction was made, include its info in any exception that was raised.
 			if de_don:
@@ -1054,9 +1254,45 @@ class PledgeExecution(models.Model):
 		te.pledge_count = models.F('pledge_count') - 1
 		te.save(update_fields=['pledge_count'])
 
+		# Un-count the execution from the day's activity.
+		DailyActivity.record(self.created, self.pledge.trigger, self.pledge.via_campaign, execution_count=-1)
+		DistrictActivity.record(self.district, self.pledge.trigger, pledge_count=-1)
+		ReferralActivity.record(self.created, self.pledge.via_campaign, self.pledge.ref_code, execution_count=-1)
+
 		# Delete record.
 		super(PledgeExecution, self).delete()	
 
+	@staticmethod
+	def iter_with_contributions(executions, chunk_size=500):
+		# Yields (PledgeExecution, [Contribution, ...]) for each PledgeExecution
+		# in the executions QuerySet, most recent first, with the Contributions
+		# in the order they are listed to users. The PledgeExecutions are fetched
+		# in chunks using keyset pagination on (created, id), and the Contributions
+		# are fetched one chunk at a time, so memory use doesn't grow with the
+		# number of records.
+		from collections import defaultdict
+		executions = executions.order_by('-created', '-id')
+		last = None
+		while True:
+			chunk = executions
+			if last:
+				chunk = chunk.filter(models.Q(created__lt=last.created) | models.Q(created=last.created, id__lt=last.id))
+			chunk = list(chunk[:chunk_size])
+			if not chunk:
+				return
+
+			contribs = defaultdict(list)
+			for c in Contribution.objects.filter(pledge_execution__in=chunk).select_related('recipient', 'action'):
+				contribs[c.pledge_execution_id].append(c)
+
+			for pe in chunk:
+				cc = contribs[pe.id]
+				cc.sort(key = lambda c : (c.recipient.actor_id is None, c.id), reverse=True) # challengers first
+				for c in cc: c.pledge_execution = pe # saves a query
+				yield (pe, cc)
+
+			last = chunk[-1]
+
 	def show_txn(self):
 		import rtyaml
 		from contrib.bizlogic import DemocracyEngineAPI
@@ -1091,6 +1327,17 @@ class PledgeExecution(models.Model):
 		# Take care of database things first. Let any of these
 		# things fail before we call out to DE.
 
+		# Remove the contributions and fees from the day's activity. They're
+		# taken off of the day the pledge was executed (and not today) so that
+		# the counters match what DailyActivity.rebuild would compute.
+		agg = self.contributions.aggregate(count=models.Count('id'), amount=models.Sum('amount'))
+		DailyActivity.record(self.created, self.pledge.trigger, self.pledge.via_campaign,
+			contribution_count=-agg['count'], contribution_amount=-(agg['amount'] or 0), fees=-self.fees)
+		DistrictActivity.record(self.district, self.pledge.trigger,
+			contribution_count=-agg['count'], contribution_amount=-(agg['amount'] or 0))
+		ReferralActivity.record(self.created, self.pledge.via_campaign, self.pledge.ref_code,
+			contribution_amount=-(agg['amount'] or 0))
+
 		# Delete the contributions explicitly so that .delete() gets called (by our manager).
 		self.contributions.all().delete()
 
@@ -1131,20 +1378,64 @@ class PledgeExecution(models.Model):
 
 	@transaction.atomic
 	def update_district(self, district, other):
+		# Set the district and store the geocoder information that it came from.
+
 		# lock so we don't overwrite
 		self = PledgeExecution.objects.filter(id=self.id).select_for_update().get()
 
-		# temporarily decrement all of the contributions from the aggregates
-		for c in self.contributions.all():
-			c.update_aggregates(factor=-1)
+		PledgeExecution.assign_districts({ self.id: district })
 
-		self.district = district
 		self.extra['geocode'] = other
-		self.save(update_fields=['district', 'extra'])
+		self.save(update_fields=['extra'])
 
-		# re-increment now that the district is set
-		for c in self.contributions.all():
-			c.update_aggregates(factor=1)
+	@staticmethod
+	@transaction.atomic
+	def assign_districts(districts):
+		# Sets the district of many PledgeExecutions at once. districts is a
+		# dict mapping PledgeExecution IDs to district codes (or None). The
+		# per-district aggregates are adjusted with one UPDATE per (district,
+		# trigger) pair and the PledgeExecutions are updated with one UPDATE
+		# per district. The Action and TriggerExecution aggregates don't depend
+		# on the district so they are left alone. Returns the number of
+		# PledgeExecutions whose district changed.
+		from collections import defaultdict
+
+		# Lock the rows and find the ones that are actually changing.
+		current = PledgeExecution.objects.select_for_update()\
+			.filter(id__in=list(districts))\
+			.values_list('id', 'district', 'pledge__trigger')
+		changed = { }
+		deltas = defaultdict(lambda : defaultdict(lambda : 0))
+		for pe, old_district, trigger in current:
+			new_district = districts[pe]
+			if old_district == new_district: continue
+			changed[pe] = (old_district, new_district, trigger)
+			deltas[(old_district, trigger)]['pledge_count'] -= 1
+			deltas[(new_district, trigger)]['pledge_count'] += 1
+		if not changed:
+			return 0
+
+		# Move the contribution totals of the changing executions from their
+		# old districts to their new districts.
+		totals = Contribution.objects.filter(pledge_execution__in=list(changed))\
+			.values('pledge_execution')\
+			.annotate(count=models.Count('id'), amount=models.Sum('amount'))
+		for t in totals:
+			old_district, new_district, trigger = changed[t['pledge_execution']]
+			for district, sign in ((old_district, -1), (new_district, +1)):
+				deltas[(district, trigger)]['contribution_count'] += sign*t['count']
+				deltas[(district, trigger)]['contribution_amount'] += sign*t['amount']
+		for (district, trigger), counters in deltas.items():
+			DistrictActivity.record(district, trigger, **counters)
+
+		# Update the PledgeExecutions, grouped by their new district.
+		by_district = defaultdict(list)
+		for pe, (old_district, new_district, trigger) in changed.items():
+			by_district[new_district].append(pe)
+		for district, pes in by_district.items():
+			PledgeExecution.objects.filter(id__in=pes).update(district=district)
+
+		return len(changed)
 
 class Tip(models.Model):
 	"""A tip to an Organization made while making a Pledge."""
@@ -1432,4 +1723,376 @@ class Contribution(models.Model):
 			# sort by amount, descending
 			ret.sort(key = lambda item : item[1][1], reverse=True)
 
-			return ret
\ No newline at end of file
+			return ret
+#####################################################################
+#
+# Statistics
+#
+# Pre-aggregated counters that are maintained incrementally as
+# pledges and contributions are made so that reports don't have to
+# scan all of the underlying records.
+#
+#####################################################################
+
+def increment_counters(model, keys, deltas):
+	# Atomically add each value in the deltas dict to the field of the same
+	# name on the model instance identified by keys, creating the instance
+	# if it doesn't exist yet. The INSERT is done in a savepoint so that if
+	# another process creates the same row first we can just retry the
+	# UPDATE without aborting an enclosing transaction.
+	deltas = { k: v for k, v in deltas.items() if v }
+	if not deltas: return
+	updates = { k: models.F(k) + v for k, v in deltas.items() }
+	if model.objects.filter(**keys).update(**updates):
+		return
+	try:
+		with transaction.atomic():
+			model.objects.create(**dict(keys, **deltas))
+	except IntegrityError:
+		model.objects.filter(**keys).update(**updates)
+
+def local_date(when):
+	# The calendar day of a datetime in the site's time zone.
+	if timezone.is_aware(when):
+		when = timezone.localtime(when)
+	return when.date()
+
+def get_stats_models(apps, *names):
+	# Returns the contrib models with the given names from the app registry
+	# apps, so that the statistics can be rebuilt by a data migration from
+	# its historical models, or the current models if apps is None.
+	if apps is None:
+		return [globals()[name] for name in names]
+	return [apps.get_model('contrib', name) for name in names]
+
+class DailyActivity(models.Model):
+	"""Per-day totals of pledges and contributions for a Trigger via a Campaign."""
+
+	date = models.DateField(db_index=True, help_text="The day (in the site's time zone) that the activity occurred on.")
+	trigger = models.ForeignKey(Trigger, related_name="daily_activity", on_delete=models.CASCADE, help_text="The Trigger that the Pledges were made for.")
+	via_campaign = models.ForeignKey('itfsite.Campaign', blank=True, null=True, related_name="daily_activity", on_delete=models.CASCADE, help_text="The Campaign that the Pledges were made via.")
+
+	pledge_count = models.IntegerField(default=0, help_text="The number of Pledges made on this day, including those later cancelled.")
+	pledge_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="The total amount of the Pledges made on this day, including those later cancelled.")
+	cancel_count = models.IntegerField(default=0, help_text="The number of Pledges cancelled on this day.")
+	execution_count = models.IntegerField(default=0, help_text="The number of Pledges executed on this day.")
+	contribution_count = models.IntegerField(default=0, help_text="The number of (non-voided) Contributions made by Pledges executed on this day.")
+	contribution_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="The total amount of (non-voided) Contributions made by Pledges executed on this day, excluding fees.")
+	fees = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="The total fees of (non-voided) Pledges executed on this day.")
+
+	counter_fields = ('pledge_count', 'pledge_amount', 'cancel_count', 'execution_count', 'contribution_count', 'contribution_amount', 'fees')
+
+	class Meta:
+		unique_together = [('date', 'trigger', 'via_campaign')]
+		verbose_name_plural = "daily activity"
+
+	def __str__(self):
+		return "%s / %s / %s" % (self.date, self.trigger, self.via_campaign)
+
+	@staticmethod
+	def record(when, trigger, via_campaign, **deltas):
+		# Add to the counters for the day of the datetime when.
+		increment_counters(DailyActivity,
+			{ "date": local_date(when), "trigger": trigger, "via_campaign": via_campaign },
+			deltas)
+
+	@staticmethod
+	def series(**filters):
+		# Returns a list of dicts, one per day in chronological order, summing
+		# the counters over the DailyActivity instances matching the filters.
+		# Days with no activity are omitted. We always sum because a
+		# null via_campaign doesn't participate in the uniqueness constraint,
+		# so a day may be split across more than one row.
+		return list(DailyActivity.objects.filter(**filters)
+			.values('date')
+			.annotate(**{ f: models.Sum(f) for f in DailyActivity.counter_fields })
+			.order_by('date'))
+
+	@staticmethod
+	@transaction.atomic
+	def rebuild(apps=None):
+		# Recompute all DailyActivity instances from the underlying records
+		# (see get_stats_models for apps). Pledges that have been cancelled
+		# are still counted as pledges on the day they were made using the
+		# archived record.
+		from collections import defaultdict
+		import dateutil.parser
+		Pledge, CancelledPledge, PledgeExecution, Contribution, Activity = get_stats_models(apps,
+			'Pledge', 'CancelledPledge', 'PledgeExecution', 'Contribution', 'DailyActivity')
+		buckets = defaultdict(lambda : defaultdict(lambda : 0))
+
+		for created, trigger, via_campaign, amount in Pledge.objects.values_list('created', 'trigger', 'via_campaign', 'amount').iterator():
+			b = buckets[(local_date(created), trigger, via_campaign)]
+			b['pledge_count'] += 1
+			b['pledge_amount'] += amount
+
+		for created, trigger, via_campaign, pledge in CancelledPledge.objects.values_list('created', 'trigger', 'via_campaign', 'pledge').iterator():
+			b = buckets[(local_date(dateutil.parser.parse(pledge['created'])), trigger, via_campaign)]
+			b['pledge_count'] += 1
+			b['pledge_amount'] += decimal.Decimal(str(pledge['amount']))
+			b = buckets[(local_date(created), trigger, via_campaign)]
+			b['cancel_count'] += 1
+
+		for created, trigger, via_campaign, problem, fees in PledgeExecution.objects.values_list('created', 'pledge__trigger', 'pledge__via_campaign', 'problem', 'fees').iterator():
+			b = buckets[(local_date(created), trigger, via_campaign)]
+			b['execution_count'] += 1
+			if PledgeExecutionProblem(problem) == PledgeExecutionProblem.NoProblem:
+				b['fees'] += fees
+
+		for created, trigger, via_campaign, amount in Contribution.objects.values_list('pledge_execution__created', 'pledge_execution__pledge__trigger', 'pledge_execution__pledge__via_campaign', 'amount').iterator():
+			b = buckets[(local_date(created), trigger, via_campaign)]
+			b['contribution_count'] += 1
+			b['contribution_amount'] += amount
+
+		Activity.objects.all().delete()
+		Activity.objects.bulk_create(
+			Activity(date=date, trigger_id=trigger, via_campaign_id=via_campaign, **counters)
+			for (date, trigger, via_campaign), counters in buckets.items())
+		return len(buckets)
+
+class DistrictActivity(models.Model):
+	"""Totals of executed pledges and their contributions for a Trigger from users in a congressional district."""
+
+	district = models.CharField(max_length=4, db_index=True, help_text="The congressional district of the users, in the same form as PledgeExecution.district.")
+	trigger = models.ForeignKey(Trigger, related_name="district_activity", on_delete=models.CASCADE, help_text="The Trigger that the Pledges were made for.")
+
+	pledge_count = models.IntegerField(default=0, help_text="The number of executed Pledges from users in the district.")
+	contribution_count = models.IntegerField(default=0, help_text="The number of Contributions made by those Pledges.")
+	contribution_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="The total amount of Contributions made by those Pledges, excluding fees.")
+
+	counter_fields = ('pledge_count', 'contribution_count', 'contribution_amount')
+
+	class Meta:
+		unique_together = [('district', 'trigger')]
+		verbose_name_plural = "district activity"
+
+	def __str__(self):
+		return "%s / %s" % (self.district, self.trigger)
+
+	@staticmethod
+	def record(district, trigger, **deltas):
+		# Add to the counters for a district. Executions whose district
+		# is not known aren't tracked.
+		if not district: return
+		trigger_key = "trigger_id" if isinstance(trigger, int) else "trigger"
+		increment_counters(DistrictActivity, { "district": district, trigger_key: trigger }, deltas)
+
+	@staticmethod
+	@transaction.atomic
+	def rebuild(apps=None):
+		# Recompute all DistrictActivity instances from the underlying records
+		# (see get_stats_models for apps).
+		from collections import defaultdict
+		PledgeExecution, Contribution, Activity = get_stats_models(apps,
+			'PledgeExecution', 'Contribution', 'DistrictActivity')
+		buckets = defaultdict(lambda : defaultdict(lambda : 0))
+
+		for district, trigger in PledgeExecution.objects.exclude(district=None).values_list('district', 'pledge__trigger').iterator():
+			buckets[(district, trigger)]['pledge_count'] += 1
+
+		for district, trigger, amount in Contribution.objects.exclude(pledge_execution__district=None)\
+			.values_list('pledge_execution__district', 'pledge_execution__pledge__trigger', 'amount').iterator():
+			b = buckets[(district, trigger)]
+			b['contribution_count'] += 1
+			b['contribution_amount'] += amount
+
+		Activity.objects.all().delete()
+		Activity.objects.bulk_create(
+			Activity(district=district, trigger_id=trigger, **counters)
+			for (district, trigger), counters in buckets.items())
+		return len(buckets)
+
+class UserSketchKind(enum.Enum):
+	Pledging = 1 # users with a confirmed Pledge
+	Contributing = 2 # users with a Pledge executed without a problem
+
+class UserSketch(models.Model):
+	"""A HyperLogLog sketch of the distinct users pledging or contributing to a Trigger via a Campaign."""
+
+	trigger = models.ForeignKey(Trigger, related_name="user_sketches", on_delete=models.CASCADE, help_text="The Trigger that the users made Pledges for.")
+	via_campaign = models.ForeignKey('itfsite.Campaign', blank=True, null=True, related_name="user_sketches", on_delete=models.CASCADE, help_text="The Campaign that the users made Pledges via.")
+	kind = EnumField(UserSketchKind, help_text="Which users are counted in the sketch.")
+	registers = models.BinaryField(help_text="The registers of the HyperLogLog sketch (see contrib.hll).")
+	updated = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		unique_together = [('trigger', 'via_campaign', 'kind')]
+
+	def __str__(self):
+		return "%s / %s / %s" % (self.kind.name, self.trigger, self.via_campaign)
+
+	@staticmethod
+	def add(kind, trigger, via_campaign, user):
+		# Add a user to the sketch. Users are never removed (e.g. when a
+		# Pledge is cancelled or voided), so counts are of users who ever
+		# pledged/contributed.
+		#
+		# This is called while saving Pledges, so the sketch isn't locked,
+		# which would make concurrent Pledges on the same Trigger wait on
+		# each other. Most users don't change the sketch at all. When one
+		# does, the registers are only written if no one else changed them
+		# since they were read, and otherwise the user is added again to
+		# the new registers.
+		from contrib.hll import HyperLogLog
+		keys = { "kind": kind, "trigger": trigger, "via_campaign": via_campaign }
+		while True:
+			sketch = UserSketch.objects.filter(**keys).values_list('id', 'registers').first()
+			if sketch is None:
+				# Create it --- in a savepoint in case another process creates
+				# it first, in which case add the user to theirs.
+				hll = HyperLogLog()
+				hll.add(user.id)
+				try:
+					with transaction.atomic():
+						UserSketch.objects.create(registers=bytes(hll), **keys)
+					return
+				except IntegrityError:
+					continue
+
+			sketch_id, registers = sketch
+			registers = bytes(registers)
+			hll = HyperLogLog(registers)
+			if not hll.add(user.id):
+				return
+			if UserSketch.objects.filter(id=sketch_id, registers=registers)\
+				.update(registers=bytes(hll), updated=timezone.now()):
+				return
+
+	@staticmethod
+	def count(kind, **filters):
+		# Estimates the number of distinct users across all of the sketches
+		# of the given kind matching the filters, e.g. trigger__in=[...] or
+		# via_campaign=campaign.
+		from contrib.hll import HyperLogLog
+		hll = HyperLogLog()
+		for registers in UserSketch.objects.filter(kind=kind, **filters).values_list('registers', flat=True).iterator():
+			hll.merge(HyperLogLog(registers))
+		return hll.count()
+
+	@staticmethod
+	@transaction.atomic
+	def rebuild(apps=None):
+		# Recompute all UserSketch instances from the underlying records
+		# (see get_stats_models for apps).
+		from collections import defaultdict
+		from contrib.hll import HyperLogLog
+		Pledge, PledgeExecution, Sketch = get_stats_models(apps, 'Pledge', 'PledgeExecution', 'UserSketch')
+		sketches = defaultdict(HyperLogLog)
+
+		for trigger, via_campaign, user in Pledge.objects.exclude(user=None).values_list('trigger', 'via_campaign', 'user').iterator():
+			sketches[(UserSketchKind.Pledging, trigger, via_campaign)].add(user)
+
+		for trigger, via_campaign, user in PledgeExecution.objects.filter(problem=PledgeExecutionProblem.NoProblem)\
+			.values_list('pledge__trigger', 'pledge__via_campaign', 'pledge__user').iterator():
+			sketches[(UserSketchKind.Contributing, trigger, via_campaign)].add(user)
+
+		Sketch.objects.all().delete()
+		Sketch.objects.bulk_create(
+			Sketch(kind=kind, trigger_id=trigger, via_campaign_id=via_campaign, registers=bytes(hll))
+			for (kind, trigger, via_campaign), hll in sketches.items())
+		return len(sketches)
+
+class ReferralActivity(models.Model):
+	"""Per-day counts of how users arriving with a referral code (utm_campaign) progressed through a Campaign."""
+
+	date = models.DateField(db_index=True, help_text="The day (in the site's time zone) that the activity occurred on.")
+	via_campaign = models.ForeignKey('itfsite.Campaign', blank=True, null=True, related_name="referral_activity", on_delete=models.CASCADE, help_text="The Campaign that the activity was on.")
+	ref_code = models.CharField(max_length=24, blank=True, db_index=True, help_text="The normalized referral code (see normalize_ref_code), or the empty string for activity without one.")
+
+	incomplete_count = models.IntegerField(default=0, help_text="The number of IncompletePledges created, i.e. users who entered an email address for a new account.")
+	pledge_count = models.IntegerField(default=0, help_text="The number of Pledges made, including those later cancelled.")
+	pledge_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="The total amount of the Pledges made, including those later cancelled.")
+	confirmed_count = models.IntegerField(default=0, help_text="The number of Pledges that became tied to a confirmed user account, either when made by a logged-in user or when an anonymous user confirmed their email address.")
+	execution_count = models.IntegerField(default=0, help_text="The number of Pledges executed.")
+	contribution_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="The total amount of Contributions made by the Pledges executed, excluding fees.")
+
+	counter_fields = ('incomplete_count', 'pledge_count', 'pledge_amount', 'confirmed_count', 'execution_count', 'contribution_amount')
+
+	class Meta:
+		unique_together = [('date', 'via_campaign', 'ref_code')]
+		verbose_name_plural = "referral activity"
+
+	def __str__(self):
+		return "%s / %s / %s" % (self.date, self.via_campaign, self.ref_code)
+
+	@staticmethod
+	def normalize_ref_code(ref_code):
+		# Users coming back from an IncompletePledge follow-up email arrive with
+		# a utm_campaign of "itf_ip_<id>" followed by ",<ref_code>" if they had
+		# originally come with one (see IncompletePledge.get_utm_campaign_string).
+		# Credit those to the original referral code, or to "itf_ip" (the follow-up
+		# email itself) if there wasn't one.
+		import re
+		ref_code = (ref_code or "").strip()
+		m = re.match(r"^itf_ip_\d+(?:,(.*))?$", ref_code)
+		if m:
+			ref_code = m.group(1) or "itf_ip"
+		return ref_code[0:24]
+
+	@staticmethod
+	def record(when, via_campaign, ref_code, **deltas):
+		# Add to the counters for the day of the datetime when.
+		increment_counters(ReferralActivity,
+			{ "date": local_date(when), "via_campaign": via_campaign, "ref_code": ReferralActivity.normalize_ref_code(ref_code) },
+			deltas)
+
+	@staticmethod
+	def summarize(by_date=False, **filters):
+		# Returns a list of dicts summing the counters for each referral code
+		# (and each day, if by_date) over the instances matching the filters.
+		fields = ('ref_code', 'date') if by_date else ('ref_code',)
+		return list(ReferralActivity.objects.filter(**filters)
+			.values(*fields)
+			.annotate(**{ f: models.Sum(f) for f in ReferralActivity.counter_fields })
+			.order_by(*fields))
+
+	@staticmethod
+	@transaction.atomic
+	def rebuild(apps=None):
+		# Recompute all ReferralActivity instances from the underlying records
+		# (see get_stats_models for apps). IncompletePledges are deleted when
+		# the user finishes their Pledge, so incomplete_count can't be
+		# recomputed: the existing counts are kept, and only if there are none
+		# yet are they taken from the IncompletePledges that still exist.
+		from collections import defaultdict
+		import dateutil.parser
+		IncompletePledge, Pledge, CancelledPledge, PledgeExecution, Contribution, Activity = get_stats_models(apps,
+			'IncompletePledge', 'Pledge', 'CancelledPledge', 'PledgeExecution', 'Contribution', 'ReferralActivity')
+		buckets = defaultdict(lambda : defaultdict(lambda : 0))
+
+		existing = Activity.objects.filter(incomplete_count__gt=0).values_list('date', 'via_campaign', 'ref_code', 'incomplete_count')
+		if existing.exists():
+			for date, via_campaign, ref_code, count in existing.iterator():
+				buckets[(date, via_campaign, ref_code)]['incomplete_count'] += count
+		else:
+			for created, via_campaign, extra in IncompletePledge.objects.values_list('created', 'via_campaign', 'extra').iterator():
+				buckets[(local_date(created), via_campaign, ReferralActivity.normalize_ref_code((extra or {}).get('ref_code')))]['incomplete_count'] += 1
+
+		for created, via_campaign, ref_code, amount, user, email_confirmed_at in Pledge.objects.values_list('created', 'via_campaign', 'ref_code', 'amount', 'user', 'email_confirmed_at').iterator():
+			ref_code = ReferralActivity.normalize_ref_code(ref_code)
+			b = buckets[(local_date(created), via_campaign, ref_code)]
+			b['pledge_count'] += 1
+			b['pledge_amount'] += amount
+			if user:
+				buckets[(local_date(email_confirmed_at or created), via_campaign, ref_code)]['confirmed_count'] += 1
+
+		for via_campaign, user, pledge in CancelledPledge.objects.values_list('via_campaign', 'user', 'pledge').iterator():
+			# The archived record doesn't say when the Pledge was confirmed, so
+			# use the date it was made.
+			b = buckets[(local_date(dateutil.parser.parse(pledge['created'])), via_campaign, ReferralActivity.normalize_ref_code(pledge['ref_code']))]
+			b['pledge_count'] += 1
+			b['pledge_amount'] += decimal.Decimal(str(pledge['amount']))
+			if user:
+				b['confirmed_count'] += 1
+
+		for created, via_campaign, ref_code in PledgeExecution.objects.values_list('created', 'pledge__via_campaign', 'pledge__ref_code').iterator():
+			buckets[(local_date(created), via_campaign, ReferralActivity.normalize_ref_code(ref_code))]['execution_count'] += 1
+
+		for created, via_campaign, ref_code, amount in Contribution.objects.values_list('pledge_execution__created', 'pledge_execution__pledge__via_campaign', 'pledge_execution__pledge__ref_code', 'amount').iterator():
+			buckets[(local_date(created), via_campaign, ReferralActivity.normalize_ref_code(ref_code))]['contribution_amount'] += amount
+
+		Activity.objects.all().delete()
+		Activity.objects.bulk_create(
+			Activity(date=date, via_campaign_id=via_campaign, ref_code=ref_code, **counters)
+			for (date, via_campaign, ref_code), counters in buckets.items())
+		return len(buckets)
@@ -20,6 +20,191 @@ class DEAPITestCase(TestCase):
 		self.assertEqual(f(Decimal('123')), '$123.00')
 		self.assertEqual(f(Decimal('1234')), '$1234.00')
 
+class GeocoderTestCase(TestCase):
+	def test_geocode_cache(self):
+		# Trivially different addresses are the same for the cache.
+		from contrib.geocoder import get_address_hash, geocode_profiles
+		self.assertEqual(
+			get_address_hash(("1 Main St", "Springfield", "VA", "22150")),
+			get_address_hash(("1  MAIN st ", "springfield", "va", "22150-1234")))
+
+		# A profile whose address is cached is geocoded from the cache,
+		# without calling the remote API.
+		result = { "cd114": "VA08", "tz": "US/Eastern" }
+		GeocodeCache.objects.create(address_hash=get_address_hash(("1 Main St", "Springfield", "VA", "22150")), result=result)
+		profile = ContributorInfo.createRandom()
+		profile.extra['contributor'].update({ "contribAddress": "1 main st", "contribCity": "SPRINGFIELD", "contribState": "VA", "contribZip": "22150" })
+		self.assertEqual(geocode_profiles([profile]), [])
+		profile = ContributorInfo.objects.get(id=profile.id)
+		self.assertTrue(profile.is_geocoded)
+		self.assertEqual(profile.extra['geocode'], result)
+
+	def test_district_index(self):
+		import os, tempfile
+		from contrib.districts import DistrictIndex, MAGIC, RECORD, TIMEZONES, get_district_index, lookup_address
+
+		# Write an index where 22150 is split between two districts.
+		fd, path = tempfile.mkstemp()
+		with os.fdopen(fd, 'wb') as f:
+			f.write(MAGIC)
+			f.write(RECORD.pack(199010000, 199019999, b"DE", 1, 0))
+			f.write(RECORD.pack(221500000, 221504999, b"VA", 8, TIMEZONES.index("US/Eastern")))
+			f.write(RECORD.pack(221505000, 221509999, b"VA", 11, TIMEZONES.index("US/Eastern")))
+			f.write(RECORD.pack(850010000, 850019999, b"AZ", 7, 0))
+			f.write(RECORD.pack(940430000, 940439999, b"CA", 18, TIMEZONES.index("US/Pacific")))
+		try:
+			index = DistrictIndex(path)
+			self.assertEqual(index.lookup(22150, 1234), { "state": "VA", "cd114": "VA08", "tz": "US/Eastern" })
+			self.assertEqual(index.lookup(22150, 6000)["cd114"], "VA11")
+			self.assertEqual(index.lookup(22150), { "state": "VA", "tz": "US/Eastern" }) # ambiguous district
+			self.assertEqual(index.lookup(94043)["cd114"], "CA18")
+			self.assertEqual(index.lookup(10001), { })
+
+			# Addresses are filled in from their state only once the index
+			# confirms their ZIP code is in the state.
+			get_district_index.index = index
+			self.assertEqual(lookup_address("DE", "19901"), { "cd114": "DE00", "tz": "US/Eastern" })
+			self.assertEqual(lookup_address("AZ", "85001"), { "cd114": "AZ07", "tz": "US/Mountain" })
+			self.assertEqual(lookup_address("VA", "22150-1234"), { "cd114": "VA08", "tz": "US/Eastern" })
+			self.assertEqual(lookup_address("DE", "19999"), { }) # not in the index
+			self.assertEqual(lookup_address("DE", "22150"), { }) # wrong state
+		finally:
+			get_district_index.__dict__.pop("index", None)
+			os.unlink(path)
+
+class VoteParsingTestCase(TestCase):
+	def test_parse_vote_xml(self):
+		from contrib.votes import parse_vote_xml, InvalidVoteError
+		with open("fixtures/govtrack.us---congress-votes-114-2015-h14-export-xml", "rb") as f:
+			voters = parse_vote_xml(f)
+		self.assertEqual(len(voters), 429)
+		self.assertEqual(voters[0], (412630, "+"))
+		self.assertEqual(sum(1 for govtrack_id, vote in voters if vote == "-"), 172)
+
+		# Tallies that don't match the voters are rejected.
+		import io
+		with self.assertRaises(InvalidVoteError):
+			parse_vote_xml(io.BytesIO(b'<roll aye="2" nay="0"><option key="+">Aye</option><voter id="1" vote="+"/></roll>'))
+
+		# A Vice President's tie-breaking vote counts toward the tallies but
+		# isn't returned as a voter.
+		voters = parse_vote_xml(io.BytesIO(b'<roll aye="2" nay="1"><option key="+">Yea</option><option key="-">Nay</option>'
+			b'<voter id="1" vote="+"/><voter id="2" vote="-"/><voter VP="1" vote="+"/></roll>'))
+		self.assertEqual(voters, [(1, "+"), (2, "-")])
+
+class CreateActorsTestCase(TestCase):
+	def test_inactive_challenger(self):
+		from django.utils.six import StringIO
+		from contrib.management.commands.create_actors import Command as create_actors
+
+		def make_actor(govtrack_id):
+			return Actor.objects.create(govtrack_id=govtrack_id, name_long="Actor", name_short="Actor", name_sort="Actor",
+				party=ActorParty.Republican, title="Test Actor")
+		actor1 = make_actor(1)
+		actor2 = make_actor(2)
+		existing = Recipient.objects.create(de_id="c_S-NY-I-D", office_sought="S-NY-I", party=ActorParty.Democratic, active=True)
+		de_recips = {
+			"c_S-NY-I-D": { "status": "inactive" },
+			"c_S-NY-II-D": { "status": "inactive" },
+		}
+
+		# A new challenger listed as inactive is created inactive, and an
+		# existing one has its active flag updated.
+		create_actors(stdout=StringIO()).set_challengers([
+				(actor1, "S-NY-I", ActorParty.Democratic, "c_S-NY-I-D"),
+				(actor2, "S-NY-II", ActorParty.Democratic, "c_S-NY-II-D"),
+			], { ("S-NY-I", ActorParty.Democratic): existing }, de_recips)
+		actor1.refresh_from_db()
+		actor2.refresh_from_db()
+		self.assertEqual(actor1.challenger, existing)
+		self.assertFalse(actor1.challenger.active)
+		self.assertEqual(actor2.challenger.de_id, "c_S-NY-II-D")
+		self.assertFalse(actor2.challenger.active)
+
+class EmailDispatcherTestCase(TestCase):
+	def test_dispatcher(self):
+		from django.core import mail
+		from itfsite.mailer import EmailDispatcher
+
+		def send(i, connection):
+			if i == 3: return False # nothing to send
+			if i == 4: raise ValueError("Bad item.")
+			mail.EmailMessage("Subject %d" % i, "Body", "from@example.com", ["to@example.com"], connection=connection).send()
+
+		batches = []
+		dispatcher = EmailDispatcher(threads=0, batch_size=2)
+		dispatcher.run(range(6), send, batches.append)
+		self.assertEqual((dispatcher.sent, dispatcher.skipped, len(dispatcher.errors)), (4, 1, 1))
+		self.assertEqual(batches, [[0, 1], [2, 5]])
+		self.assertEqual(len(mail.outbox), 4)
+
+	def test_shared_context_cache(self):
+		from itfsite.mailer import SharedContextCache
+		shared = SharedContextCache()
+		calls = []
+		def compute(key):
+			calls.append(key)
+			return { "value": key }
+		for key in (1, 2, 1, 1, 2):
+			self.assertEqual(shared.get(key, lambda : compute(key)), { "value": key })
+		self.assertEqual(calls, [1, 2])
+		self.assertEqual((shared.hits, shared.misses), (3, 2))
+
+	def test_queue(self):
+		from django.core import mail
+		from itfsite.models import OutboundEmail, OutboundEmailStatus
+		from itfsite.management.commands.send_queued_emails import Command as send_queued_emails
+
+		user = User.objects.create(email="test@example.com")
+		message = mail.EmailMultiAlternatives("Subject", "Body", "from@example.com", ["to@example.com"], headers={ "Reply-To": "reply@example.com" })
+		message.attach_alternative("<p>Body</p>", "text/html")
+		OutboundEmail.from_message(message, key="test", on_sent=[("itfsite.User", "last_login", [user.id])]).save()
+
+		send_queued_emails().handle(once=True)
+		self.assertEqual(len(mail.outbox), 1)
+		self.assertEqual(mail.outbox[0].subject, "Subject")
+		self.assertEqual(mail.outbox[0].alternatives, [("<p>Body</p>", "text/html")])
+		self.assertEqual(mail.outbox[0].extra_headers["Reply-To"], "reply@example.com")
+		self.assertEqual(OutboundEmail.objects.get(key="test").status, OutboundEmailStatus.Sent)
+		user.refresh_from_db()
+		self.assertIsNotNone(user.last_login)
+
+		# Nothing more is sent.
+		send_queued_emails().handle(once=True)
+		self.assertEqual(len(mail.outbox), 1)
+
+	def test_queued_digests(self):
+		from django.core import mail
+		from itfsite.models import OutboundEmail, OutboundEmailStatus
+		from itfsite.management.commands.send_notification_emails import Command as send_notification_emails
+
+		# Users with a digest that is queued but not sent yet are skipped.
+		message = mail.EmailMessage("Subject", "Body", "from@example.com", ["to@example.com"])
+		for key, status in (("notifications:1:10", OutboundEmailStatus.Queued), ("notifications:2:20", OutboundEmailStatus.Sending),
+			("notifications:3:30", OutboundEmailStatus.Sent), ("pledge-pre-execution:4", OutboundEmailStatus.Queued)):
+			email = OutboundEmail.from_message(message, key=key)
+			email.status = status
+			email.save()
+		self.assertEqual(send_notification_emails().get_users_with_queued_digests(), { 1, 2 })
+
+	def test_queue_failed(self):
+		from django.core import mail
+		from itfsite.models import OutboundEmail, OutboundEmailStatus
+
+		# An email that is given up on releases its key so it can be queued again.
+		message = mail.EmailMessage("Subject", "Body", "from@example.com", ["to@example.com"])
+		email = OutboundEmail.from_message(message, key="pledge-pre-execution:1")
+		email.save()
+		for i in range(OutboundEmail.MAX_ATTEMPTS):
+			self.assertTrue(OutboundEmail.objects.filter(key="pledge-pre-execution:1").exists())
+			email.record_failed(OSError("Connection refused."))
+		email.refresh_from_db()
+		self.assertEqual(email.status, OutboundEmailStatus.Failed)
+		self.assertEqual(email.last_error, "Connection refused.")
+		self.assertFalse(OutboundEmail.objects.filter(key="pledge-pre-execution:1").exists())
+		OutboundEmail.from_message(message, key="pledge-pre-execution:1").save()
+		self.assertEqual(OutboundEmail.objects.get(key="pledge-pre-execution:1").status, OutboundEmailStatus.Queued)
+
 def create_trigger(trigger_type, key, title):
 	trigger = Trigger.objects.create(
 		key=key,
@@ -101,6 +286,76 @@ class PledgeTestCase(TestCase):
 	def test_pledge_throwemout_partyfilter(self):
 		self._test_pledge(0, -1, ActorParty.Democratic, "the Democratic opponents in the next general election of Republican ACTORS who ACT No")
 
+	def test_trigger_recommendation_notifications(self):
+		from itfsite.models import Notification
+		campaign2, trigger2 = create_trigger(self.trigger_type, 'test2', 'Test Trigger 2')
+
+		# Users 0-2 pledged on the first trigger, users 2-3 on the second.
+		users = [User.objects.create(email="user%d@example.com" % i) for i in range(4)]
+		for user, trigger, campaign in ((users[0], self.trigger, self.campaign), (users[1], self.trigger, self.campaign),
+			(users[2], self.trigger, self.campaign), (users[2], trigger2, campaign2), (users[3], trigger2, campaign2)):
+			Pledge.objects.create(user=user, trigger=trigger, via_campaign=campaign, profile=ContributorInfo.objects.create(),
+				algorithm=Pledge.current_algorithm()['id'], desired_outcome=0, amount=1)
+
+		tr = TriggerRecommendation.objects.create(trigger1=self.trigger, trigger2=trigger2, symmetric=True)
+		self.assertEqual(tr.create_initial_notifications(chunk_size=1), 3)
+		self.assertEqual(
+			sorted((n.user.email, n.extra["trigger"]) for n in Notification.objects.all()),
+			[("user0@example.com", trigger2.id), ("user1@example.com", trigger2.id), ("user3@example.com", self.trigger.id)])
+		tr.refresh_from_db()
+		self.assertTrue(tr.notifications_created)
+
+		# Running it again doesn't create duplicates.
+		self.assertEqual(tr.create_initial_notifications(), 0)
+
+	def test_confirm_anonymous_pledges(self):
+		from itfsite.models import AnonymousUser
+		campaign2, trigger2 = create_trigger(self.trigger_type, 'test2', 'Test Trigger 2')
+		def make_pledge(trigger, campaign, **kwargs):
+			return Pledge.objects.create(trigger=trigger, via_campaign=campaign, profile=ContributorInfo.objects.create(),
+				algorithm=Pledge.current_algorithm()['id'], desired_outcome=0, amount=1, **kwargs)
+
+		# The user already pledged on the first trigger, then made anonymous
+		# pledges on both triggers.
+		make_pledge(self.trigger, self.campaign, user=self.user)
+		anon_user = AnonymousUser.objects.create(email=self.user.email)
+		p1 = make_pledge(self.trigger, self.campaign, anon_user=anon_user)
+		p2 = make_pledge(trigger2, campaign2, anon_user=anon_user)
+
+		confirmed, duplicates = Pledge.confirm_anonymous_pledges(anon_user, self.user)
+		self.assertEqual(confirmed, [p2])
+		self.assertEqual(duplicates, [p1])
+		self.assertFalse(Pledge.objects.filter(id=p1.id).exists())
+		p2.refresh_from_db()
+		self.assertEqual((p2.user, p2.anon_user), (self.user, None))
+		self.assertIsNotNone(p2.email_confirmed_at)
+
+	def test_referral_activity(self):
+		self.assertEqual(ReferralActivity.normalize_ref_code(None), "")
+		self.assertEqual(ReferralActivity.normalize_ref_code("fb"), "fb")
+		self.assertEqual(ReferralActivity.normalize_ref_code("itf_ip_123"), "itf_ip")
+		self.assertEqual(ReferralActivity.normalize_ref_code("itf_ip_123,fb"), "fb")
+
+		p = Pledge.objects.create(
+			user=self.user,
+			trigger=self.trigger,
+			via_campaign=self.campaign,
+			profile=ContributorInfo.objects.create(),
+			ref_code="itf_ip_5,fb",
+			algorithm=Pledge.current_algorithm()['id'],
+			desired_outcome=0,
+			amount=2,
+			incumb_challgr=0,
+		)
+		summary = ReferralActivity.summarize(via_campaign=self.campaign)
+		self.assertEqual(len(summary), 1)
+		self.assertEqual(summary[0]['ref_code'], "fb")
+		self.assertEqual(summary[0]['pledge_count'], 1)
+		self.assertEqual(summary[0]['pledge_amount'], p.amount)
+		self.assertEqual(summary[0]['confirmed_count'], 1)
+		ReferralActivity.rebuild()
+		self.assertEqual(ReferralActivity.summarize(via_campaign=self.campaign), summary)
+
 
 class ExecutionTestCase(TestCase):
 	ACTORS_PER_PARTY = 20
@@ -521,6 +776,71 @@ class ExecutionTestCase(TestCase):
 		for ((actor, recipient_type), (count, amount)) in Contribution.aggregate("actor", "recipient_type", trigger=p.trigger):
 			self.assertEqual(amount, totals_by_actor[actor][0 if recipient_type == ContributionRecipientType.Incumbent else 1][1])
 
+		# Test the line-item iterator used by the CSV exports.
+		items = list(PledgeExecution.iter_with_contributions(PledgeExecution.objects.all(), chunk_size=1))
+		self.assertEqual([pe for pe, contribs in items], [p.execution])
+		self.assertEqual(set(items[0][1]), set(p.execution.contributions.all()))
+
+		# Test the daily activity counters, and that rebuilding them from scratch
+		# gives the same result.
+		def daily(): return DailyActivity.series(trigger=p.trigger)
+		activity = daily()
+		self.assertEqual(len(activity), 1)
+		self.assertEqual(activity[0]['pledge_count'], 1)
+		self.assertEqual(activity[0]['pledge_amount'], p.amount)
+		self.assertEqual(activity[0]['execution_count'], 1)
+		self.assertEqual(activity[0]['contribution_count'], expected_contrib_count)
+		self.assertEqual(activity[0]['contribution_amount'], p.execution.charged-p.execution.fees)
+		self.assertEqual(activity[0]['fees'], p.execution.fees)
+		DailyActivity.rebuild()
+		self.assertEqual(daily(), activity)
+
+		# Test the distinct-user sketches, which are exact for small counts.
+		self.assertEqual(UserSketch.count(UserSketchKind.Pledging, trigger=p.trigger), 1)
+		self.assertEqual(UserSketch.count(UserSketchKind.Contributing, trigger=p.trigger), 1)
+		self.assertEqual(UserSketch.count(UserSketchKind.Contributing, trigger=p.trigger, via_campaign=self.campaign), 1)
+		UserSketch.rebuild()
+		self.assertEqual(UserSketch.count(UserSketchKind.Contributing, trigger=p.trigger), 1)
+
+		# Test assigning a district, which moves the execution's totals into
+		# the district rollup, and then moving it to another district.
+		p.execution.update_district("NY12", { })
+		def district(d): return DistrictActivity.objects.get(district=d, trigger=p.trigger)
+		self.assertEqual(district("NY12").pledge_count, 1)
+		self.assertEqual(district("NY12").contribution_count, expected_contrib_count)
+		self.assertEqual(district("NY12").contribution_amount, p.execution.charged-p.execution.fees)
+		self.assertEqual(PledgeExecution.assign_districts({ p.execution.id: "NY13" }), 1)
+		self.assertEqual(PledgeExecution.assign_districts({ p.execution.id: "NY13" }), 0)
+		self.assertEqual(district("NY12").pledge_count, 0)
+		self.assertEqual(district("NY12").contribution_amount, 0)
+		self.assertEqual(district("NY13").contribution_count, expected_contrib_count)
+		DistrictActivity.rebuild()
+		self.assertFalse(DistrictActivity.objects.filter(district="NY12").exists())
+		self.assertEqual(district("NY13").contribution_amount, p.execution.charged-p.execution.fees)
+
+	def test_contribution_export(self):
+		from django.contrib import admin
+		from django.test import RequestFactory
+		from contrib.admin import ContributionAdmin
+
+		self._pledge_execution(desired_outcome=0, amount=10, incumb_challgr=0, filter_party=None,
+			expected_contrib_amount=Decimal('0.33'))
+		pe = PledgeExecution.objects.get()
+		def export():
+			resp = ContributionAdmin(Contribution, admin.site).export(RequestFactory().get('/'))
+			return b"".join(resp.streaming_content).decode("utf8").splitlines()
+
+		rows = export()
+		self.assertEqual(len(rows), 1 + pe.contributions.count() + 1)
+		self.assertIn(self.campaign.get_short_url(), rows[-1])
+
+		# Pledges without a campaign are exported too.
+		Pledge.objects.filter(id=pe.pledge_id).update(via_campaign=None)
+		rows2 = export()
+		self.assertEqual(len(rows2), len(rows))
+		self.assertNotIn(self.campaign.get_short_url(), rows2[-1])
+		self.assertIn("fees", rows2[-1])
+
 	def test_multitrigger_execution(self):
 		"""Tests the execution of a Pledge that involves multiple Triggers."""
 
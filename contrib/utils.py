@@ -2,28 +2,27 @@ from django.http import HttpResponse, HttpResponseServerError
 from django.conf import settings
 
 from functools import wraps
-import json, datetime
+import json, datetime, threading
 
-def query_json_api(base_url, params={}, raw=False):
+def query_json_api(base_url, params={}, raw=False, max_age=None):
+	# Fetches a remote JSON (or, if raw is True, any) resource. Responses
+	# are kept in an on-disk HTTP cache and re-used for max_age seconds
+	# (by default, according to HTTP_CACHE_TTLS), after which they are
+	# revalidated with a conditional GET. Pass max_age=0 to always
+	# revalidate.
 	import urllib.request, urllib.parse, json
 	
 	url = base_url
 	if len(params) > 0: url += "?" + urllib.parse.urlencode(params)
 	
 	if not getattr(settings, 'LOAD_REMOTE_DATA_FROM_FIXTURES', False):
-		# Execute a web request.
-		req = urllib.request.urlopen(url)
+		# Execute a web request, or use the cache.
+		content = http_get_cached(url, max_age=max_age)
 	
 	else:
 		# For off-line testing, load JSON from fixtures path.
 		import os.path
-		urlparts = urllib.parse.urlparse(url)
-		fn = "fixtures/" + (
-			          urlparts.hostname.replace("www.", "")
-			 + "--" + urlparts.path
-			 + ("--" if urlparts.query else "")
-			 + "-".join(k+"="+v[0] for (k, v) in sorted(urllib.parse.parse_qs(urlparts.query).items()))
-			 ).replace("/", "-")
+		fn = "fixtures/" + url_to_filename(url)
 		if not raw and not fn.endswith(".json"): fn += ".json"
 		if not os.path.exists(fn):
 			# This is probably the first time we're accessing this resource.
@@ -33,11 +32,154 @@ def query_json_api(base_url, params={}, raw=False):
 			with open(fn, 'wb') as f:
 				f.write(remote_content)
 
-		req = open(fn, 'rb')
+		with open(fn, 'rb') as f:
+			content = f.read()
 	
-	if raw: return req.read()
+	if raw: return content
 	
-	return json.loads(req.read().decode("utf-8"))
+	return json.loads(content.decode("utf-8"))
+
+def url_to_filename(url):
+	# Makes a readable file name for a URL, e.g.
+	# govtrack.us---api-v2-cosponsorship--bill=338037.
+	# This is how fixtures and cached responses are named.
+	import urllib.parse
+	urlparts = urllib.parse.urlparse(url)
+	return (
+		          urlparts.hostname.replace("www.", "")
+		 + "--" + urlparts.path
+		 + ("--" if urlparts.query else "")
+		 + "-".join(k+"="+v[0] for (k, v) in sorted(urllib.parse.parse_qs(urlparts.query).items()))
+		 ).replace("/", "-")
+
+# How long cached remote resources are used before they are revalidated,
+# as (URL regex, seconds), first match wins. Votes don't change once they
+# are posted, but bill status and cosponsors do.
+HTTP_CACHE_TTLS = [
+	(r"^https://www.govtrack.us/congress/votes/", 60*60*24*7),
+	(r"^https://www.govtrack.us/congress/bills/", 60*60),
+	(r"^https://www.govtrack.us/api/v2/bill", 60*60),
+	(r"^https://www.govtrack.us/api/v2/cosponsorship", 60*60),
+]
+HTTP_CACHE_DEFAULT_TTL = 60*10
+
+_http_sessions = threading.local()
+
+def get_http_session():
+	# Returns a requests.Session for the current thread so that connections
+	# to the same host are kept alive and re-used across calls. (Sessions
+	# aren't guaranteed to be thread-safe, so each thread gets its own.)
+	if not hasattr(_http_sessions, 'session'):
+		import requests, requests.adapters
+		session = requests.Session()
+		adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2)
+		session.mount('http://', adapter)
+		session.mount('https://', adapter)
+		_http_sessions.session = session
+	return _http_sessions.session
+
+def http_get_cached(url, max_age=None):
+	# Gets the body of a remote resource using the on-disk cache in
+	# settings.HTTP_CACHE_DIR. Within max_age seconds of when a response
+	# was fetched (or last revalidated), it is returned without a request.
+	# After that, the server is asked for it with If-None-Match/If-Modified-Since
+	# and a 304 Not Modified response just refreshes the cached copy. The
+	# session asks for and decompresses gzip'd responses.
+	import os, os.path, re, time, json, hashlib, tempfile
+
+	if max_age is None:
+		max_age = HTTP_CACHE_DEFAULT_TTL
+		for pattern, ttl in HTTP_CACHE_TTLS:
+			if re.match(pattern, url):
+				max_age = ttl
+				break
+
+	cache_dir = getattr(settings, 'HTTP_CACHE_DIR', None)
+	if not cache_dir:
+		# Caching is turned off.
+		resp = get_http_session().get(url, timeout=60)
+		resp.raise_for_status()
+		return resp.content
+
+	# Where is the response cached? Very long URLs are shortened with a hash
+	# to stay within file name limits.
+	fn = url_to_filename(url)
+	if len(fn) > 200:
+		fn = fn[:150] + "-" + hashlib.sha1(url.encode("utf8")).hexdigest()
+	fn = os.path.join(cache_dir, fn)
+
+	# Load the cached response's metadata.
+	meta = None
+	if os.path.exists(fn) and os.path.exists(fn + ".meta"):
+		try:
+			with open(fn + ".meta") as f:
+				meta = json.load(f)
+		except ValueError:
+			pass # corrupt, ignore it
+
+	def read_body():
+		with open(fn, 'rb') as f:
+			return f.read()
+
+	def write_file(path, content):
+		# Write atomically so that concurrent readers never see a partial file.
+		fd, tmp = tempfile.mkstemp(dir=cache_dir)
+		with os.fdopen(fd, 'wb') as f:
+			f.write(content)
+		os.replace(tmp, path)
+
+	def write_meta():
+		meta["fetched"] = time.time()
+		write_file(fn + ".meta", json.dumps(meta).encode("utf8"))
+
+	# Use the cached response if it's fresh.
+	if meta and time.time() - meta["fetched"] < max_age:
+		return read_body()
+
+	# Fetch, conditionally if we have a cached copy.
+	headers = { }
+	if meta and meta.get("etag"):
+		headers["If-None-Match"] = meta["etag"]
+	if meta and meta.get("last_modified"):
+		headers["If-Modified-Since"] = meta["last_modified"]
+	resp = get_http_session().get(url, headers=headers, timeout=60)
+
+	if resp.status_code == 304 and meta:
+		# Our copy is still good.
+		write_meta()
+		return read_body()
+
+	resp.raise_for_status()
+
+	# Update the cache.
+	os.makedirs(cache_dir, exist_ok=True)
+	write_file(fn, resp.content)
+	meta = {
+		"url": url,
+		"etag": resp.headers.get("ETag"),
+		"last_modified": resp.headers.get("Last-Modified"),
+	}
+	write_meta()
+
+	return resp.content
+
+class RateLimiter:
+	# Spaces out calls to wait(), across all threads, so that they
+	# return no more than `rate` times per second.
+
+	def __init__(self, rate):
+		self.interval = 1.0 / rate
+		self.lock = threading.Lock()
+		self.next_time = 0
+
+	def wait(self):
+		import time
+		with self.lock:
+			now = time.monotonic()
+			delay = self.next_time - now
+			self.next_time = max(now, self.next_time) + self.interval
+		if delay > 0:
+			time.sleep(delay)
 
 def build_json_httpresponse(obj):
 	import decimal
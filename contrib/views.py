@@ -8,7 +8,7 @@ from django.conf import settings
 
 from twostream.decorators import anonymous_view, user_view_for
 
-from contrib.models import Trigger, TriggerStatus, TriggerExecution, ContributorInfo, Pledge, PledgeStatus, PledgeExecution, PledgeExecutionProblem, Contribution, ActorParty, IncompletePledge, TriggerCustomization
+from contrib.models import Trigger, TriggerStatus, TriggerExecution, ContributorInfo, Pledge, PledgeStatus, PledgeExecution, PledgeExecutionProblem, Contribution, ActorParty, IncompletePledge, TriggerCustomization, UserSketch, UserSketchKind, ReferralActivity
 from contrib.utils import json_response
 from contrib.bizlogic import HumanReadableValidationError, run_authorization_test
 
@@ -134,7 +134,7 @@ def validate_email(request):
 	if not User.objects.filter(email=email).exists():
 		# Store for later, if this is not a user already with an account.
 		# We store a max of one per email address.
-		IncompletePledge.objects.get_or_create(
+		ip, is_new = IncompletePledge.objects.get_or_create(
 			email=email,
 			defaults={
 				"trigger": Trigger.objects.get(id=request.POST['trigger']),
@@ -144,6 +144,8 @@ def validate_email(request):
 					"ref_code": get_sanitized_ref_code(request),
 				}
 			})
+		if is_new:
+			ReferralActivity.record(ip.created, ip.via_campaign, ip.extra['ref_code'], incomplete_count=1)
 
 	return HttpResponse("OK", content_type="text/plain")
 
@@ -507,9 +509,11 @@ def report_fetch_data(trigger, via_campaign):
 	pledge_slice_fields = { }
 	pledgeexec_slice_fields = { }
 	ca_slice_fields = { }
+	sketch_slice_fields = { }
 
 	if trigger:
 		pledge_slice_fields["trigger"] = trigger
+		sketch_slice_fields["trigger"] = trigger
 		try:
 			te = trigger.execution
 		except TriggerExecution.DoesNotExist:
@@ -523,6 +527,7 @@ def report_fetch_data(trigger, via_campaign):
 
 	if via_campaign:
 		pledge_slice_fields["via_campaign"] = via_campaign
+		sketch_slice_fields["via_campaign"] = via_campaign
 		pledgeexec_slice_fields["pledge__via_campaign"] = via_campaign
 		ca_slice_fields["pledge_execution__pledge__via_campaign"] = via_campaign
 
@@ -531,7 +536,7 @@ def report_fetch_data(trigger, via_campaign):
 
 	# number of pledges & users making pledges
 	pledges = Pledge.objects.filter(**pledge_slice_fields)
-	ret["users_pledging"] = pledges.exclude(user=None).values("user").distinct().count()
+	ret["users_pledging"] = UserSketch.count(UserSketchKind.Pledging, **sketch_slice_fields) # approximate
 	ret["users_pledging_twice"] = pledges.exclude(user=None).values("user").annotate(count=Count('id')).filter(count__gt=1).count()
 	ret["pledges"] = pledges.count()
 	ret["pledges_confirmed"] = pledges.exclude(user=None).count()
@@ -540,7 +545,7 @@ def report_fetch_data(trigger, via_campaign):
 
 	# number of executed pledges and users with executed pledges
 	pledge_executions = PledgeExecution.objects.filter(problem=PledgeExecutionProblem.NoProblem, **pledgeexec_slice_fields)
-	ret["users"] = pledge_executions.values("pledge__user").distinct().count()
+	ret["users"] = UserSketch.count(UserSketchKind.Contributing, **sketch_slice_fields) # approximate
 	ret["num_triggers"] = pledge_executions.values("trigger_execution").distinct().count()
 	if ret["num_triggers"] > 0:
 		ret["first_contrib_date"] = pledge_executions.order_by('created').first().created
@@ -0,0 +1,106 @@
+# Loads roll call votes from GovTrack.
+#
+# A vote's metadata (GovTrack's undocumented '.json' extension added to vote
+# pages) and how each Member of Congress voted (the '/export/xml' document)
+# are fetched once, checked, and stored as a ParsedVote. Executing triggers,
+# previewing and editing Actions in the admin all use the stored record, so
+# the same vote is never downloaded or parsed twice.
+
+# The counts on the <roll> element for each vote option key.
+COUNT_ATTRIBUTES = { "+": "aye", "-": "nay", "0": "nv", "P": "present" }
+
+class InvalidVoteError(ValueError):
+	pass
+
+def parse_vote_xml(f):
+	# Parses GovTrack's vote XML from the file-like object f incrementally,
+	# clearing elements as it goes. Returns a list of (GovTrack ID, vote
+	# option key) pairs, in document order, where the vote option key is
+	# '+', '-', '0', 'P', etc.
+	# Vice Presidential tie-breakers, which have no ID, are skipped (but are
+	# counted when checking the tallies). Raises InvalidVoteError if the
+	# document isn't a vote or doesn't add up.
+	import lxml.etree
+
+	roll = None
+	options = set()
+	voters = [ ]
+	tiebreakers = [ ]
+	seen = set()
+	for event, element in lxml.etree.iterparse(f, events=("start", "end")):
+		if event == "start":
+			if roll is None:
+				if element.tag != "roll":
+					raise InvalidVoteError("Vote XML does not start with a <roll> element.")
+				roll = dict(element.attrib)
+			continue
+
+		if element.tag == "option":
+			options.add(element.get("key"))
+
+		elif element.tag == "voter":
+			if not element.get("id"):
+				 # VP tiebreaker
+				if not element.get("VP"):
+					raise InvalidVoteError("Missing data in GovTrack XML.")
+				tiebreakers.append(element.get("vote"))
+			else:
+				govtrack_id = int(element.get("id"))
+				if govtrack_id in seen:
+					raise InvalidVoteError("GovTrack ID %d voted twice." % govtrack_id)
+				if element.get("vote") not in options:
+					raise InvalidVoteError("Invalid vote option key: " + str(element.get("vote")))
+				voters.append((govtrack_id, element.get("vote")))
+				seen.add(govtrack_id)
+
+		# Free the memory used by elements we're done with. (The root
+		# element is only ended at the end of the document.)
+		if element.tag != "roll":
+			element.clear()
+			while element.getprevious() is not None:
+				del element.getparent()[0]
+
+	if roll is None:
+		raise InvalidVoteError("Vote XML is empty.")
+
+	# Check that the tallies match the voters, including any tie-breaking
+	# vote by the Vice President.
+	for key, attr in COUNT_ATTRIBUTES.items():
+		if attr in roll:
+			count = sum(1 for govtrack_id, vote in voters if vote == key) \
+				+ tiebreakers.count(key)
+			if count != int(roll[attr]):
+				raise InvalidVoteError("Vote XML has %d '%s' votes but says %s." % (count, key, roll[attr]))
+
+	return voters
+
+def get_vote(govtrack_url, refresh=False):
+	# Returns (metadata, voters) for the vote at the GovTrack vote page URL,
+	# where metadata is GovTrack's vote JSON and voters is as returned by
+	# parse_vote_xml, from the stored ParsedVote, fetching and parsing the
+	# vote the first time (or if refresh is True).
+	import io
+	from contrib.models import ParsedVote
+	from contrib.utils import query_json_api
+
+	if not refresh:
+		pv = ParsedVote.objects.filter(url=govtrack_url).first()
+		if pv:
+			return (pv.metadata, [tuple(voter) for voter in pv.voters])
+
+	# Get vote metadata from GovTrack's API, via the undocumented
+	# '.json' extension added to vote pages.
+	metadata = query_json_api(govtrack_url+'.json', {})
+
+	# Then get how Members of Congress voted via the XML, which conveniently
+	# includes everything without limit/offset. The congress project vote
+	# JSON doesn't use GovTrack IDs, so it's more convenient to use GovTrack
+	# data.
+	voters = parse_vote_xml(io.BytesIO(query_json_api(govtrack_url+'/export/xml', {}, raw=True)))
+
+	ParsedVote.objects.update_or_create(url=govtrack_url, defaults={
+		"metadata": metadata,
+		"voters": voters,
+	})
+
+	return (metadata, voters)
@@ -34,9 +34,8 @@ class User(UserBase):
 
 	def twostream_data(self):
 		from itfsite.models import Notification
-		notifs = Notification.objects.filter(user=self).order_by('-created')[0:30]
 		return {
-			"notifications": Notification.render(notifs),
+			"notifications": Notification.render_for_user(self),
 		}
 
 	def get_contributorinfo(self):
@@ -61,6 +60,13 @@ class User(UserBase):
 		if pledge and pledge.profile.extra['geocode'].get('tz'):
 			tz = pledge.profile.extra['geocode']['tz']
 
+		# Otherwise see if we can tell from the ZIP code of their most recent profile.
+		else:
+			profile = self.get_contributorinfo()
+			if profile:
+				from contrib.districts import lookup_address
+				tz = lookup_address(profile.extra['contributor']['contribState'], profile.extra['contributor']['contribZip']).get('tz', tz)
+
 		# Activate.
 		timezone.activate(pytz.timezone(tz))
 
@@ -80,7 +86,10 @@ class AnonymousUser(models.Model):
 	def __str__(self):
 		return self.email + ((" → " + str(self.confirmed_user)) if self.confirmed_user else "")
 
-	def send_email_confirmation(self):
+	def send_email_confirmation(self, ec=None, pledge=None):
+		# When sending in bulk, the caller can pass this user's existing
+		# EmailConfirmation and the Pledge to confirm (which must be the
+		# first of get_confirmable_pledges for this user) to save queries.
 		from datetime import timedelta
 		from django.utils import timezone
 
@@ -94,28 +103,18 @@ class AnonymousUser(models.Model):
 			ec = EmailConfirmation.create(self)
 		else:
 			# Get an existing EmailConfirmation object.
-			ec = EmailConfirmation.get_for(self)
+			if ec is None:
+				ec = EmailConfirmation.get_for(self)
 
 			# Don't send another email confirmation if we just sent one for this user
 			# (e.g. if the user took a second action a few minutes later).
 			if timezone.now() - ec.sent_at <  timedelta(seconds=60*20):
 				return
 
-		# For when we re-send confirmation emails later, ensure we choose
-		# an action that isn't already confirmed and wasn't created so long
-		# ago that the user will have forgotten what this is about. For
-		# Pledges, also don't try to confirm one that is already executed.
-		from itfsite.models import CampaignStatus
-		from contrib.models import Pledge, PledgeStatus
-		def filter_objs(qs):
-			return qs.filter(
-				user=None,
-				anon_user=self,
-				created__gt=timezone.now()-timedelta(days=7),
-				via_campaign__status=CampaignStatus.Open)\
-				.order_by('-created')
+		# Choose the Pledge to confirm.
 		profile = None
-		pledge = filter_objs(Pledge.objects).first()
+		if pledge is None:
+			pledge = AnonymousUser.get_confirmable_pledges().filter(anon_user=self).first()
 		if pledge:
 			template = "contrib/mail/confirm_email"
 			profile = pledge.profile
@@ -124,7 +123,8 @@ class AnonymousUser(models.Model):
 			raise ValueError("AnonymousUser is not associated with a Pledge on an open campaign.")
 
 		# Use a custom mailer function so we can send through our
-		# HTML emailer app.
+		# HTML emailer app. The email is queued so that the user isn't
+		# kept waiting on the mail relay.
 		def mailer(context):
 			from itfsite.middleware import get_branding
 			context.update(get_branding(brand_id))
@@ -135,8 +135,8 @@ class AnonymousUser(models.Model):
 				"first_try": not self.sentConfirmationEmail,
 			})
 			
-			from htmlemailer import send_mail
-			send_mail(
+			from itfsite.mailer import queue_mail
+			queue_mail(
 				template,
 				context["MAIL_FROM_EMAIL"],
 				[context['email']],
@@ -149,6 +149,23 @@ class AnonymousUser(models.Model):
 		self.sentConfirmationEmail = True
 		self.save()
 
+	@staticmethod
+	def get_confirmable_pledges():
+		# For when we re-send confirmation emails later, ensure we choose
+		# an action that isn't already confirmed and wasn't created so long
+		# ago that the user will have forgotten what this is about. For
+		# Pledges, also don't try to confirm one that is already executed.
+		# Most recent first.
+		from datetime import timedelta
+		from django.utils import timezone
+		from itfsite.models import CampaignStatus
+		from contrib.models import Pledge
+		return Pledge.objects.filter(
+			user=None,
+			created__gt=timezone.now()-timedelta(days=7),
+			via_campaign__status=CampaignStatus.Open)\
+			.order_by('-created')
+
 	def should_retry_email_confirmation(self):
 		from datetime import timedelta
 		from django.utils import timezone
@@ -181,8 +198,17 @@ class AnonymousUser(models.Model):
 
 		# Confirm all associated pledges.
 		from contrib.models import Pledge
-		for pledge in Pledge.objects.filter(anon_user=self):
-			pledge.set_confirmed_user(user, request)
+		confirmed, duplicates = Pledge.confirm_anonymous_pledges(self, user)
+
+		# Let the user know what happened, once the changes are committed.
+		def add_messages():
+			from django.contrib import messages
+			if duplicates:
+				messages.add_message(request, messages.ERROR, 'You had a previous contribution already scheduled for the same thing. Your more recent contribution will be ignored.')
+			for pledge in confirmed:
+				messages.add_message(request, messages.SUCCESS, 'Your contribution regarding %s has been confirmed.'
+					% pledge.trigger.title)
+		transaction.on_commit(add_messages)
 
 		return user
 
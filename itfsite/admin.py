@@ -138,8 +138,14 @@ class CampaignAdmin(admin.ModelAdmin):
     exclude = ['contrib_triggers']
     prepopulated_fields = {"slug": ("title",)}
 
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'id', 'status', 'attempts', 'created', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['id', 'key', 'subject']
+
 admin.site.register(User, UserAdmin)
 admin.site.register(AnonymousUser, AnonymousUserAdmin)
 admin.site.register(Organization, OrganizationAdmin)
 admin.site.register(Campaign, CampaignAdmin)
 admin.site.register(Notification) # not really helpful outside of debugging
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
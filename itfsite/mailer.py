@@ -0,0 +1,187 @@
+# Sends a lot of emails quickly.
+#
+# EmailDispatcher hands work items to a pool of worker threads. Each
+# worker keeps one mail connection open for all of the messages it
+# sends, rather than connecting once per message. Items that were sent
+# are reported back on the calling thread in batches, so that callers
+# can record that with one UPDATE per batch.
+#
+# Most emails aren't sent directly though. queue_mail renders an email and
+# stores it as an OutboundEmail, and the send_queued_emails command sends
+# queued emails using EmailDispatcher.
+#
+# SharedContextCache holds the parts of email contexts that are the same
+# for many recipients, so they are computed once rather than per email.
+
+import queue, threading, time
+
+class EmailDispatcher:
+	def __init__(self, threads=8, batch_size=100):
+		# With threads=0, emails are sent on the calling thread, which
+		# is needed when the caller's database transaction isn't committed
+		# (e.g. in tests).
+		self.threads = threads
+		self.batch_size = batch_size
+		self.sent = 0
+		self.skipped = 0
+		self.errors = [] # (item, exception)
+		self.elapsed = 0.0
+
+	def run(self, items, send, record_sent):
+		# Calls send(item, connection) for each item, where connection is
+		# a mail connection to pass to send_mail. send returns False if there
+		# was nothing to send for the item. record_sent(items) is called on
+		# this thread with batches of items that were sent. Exceptions raised
+		# by send are collected in self.errors and don't stop the run.
+		start = time.time()
+		pending = []
+
+		def handle_result(item, result, error):
+			if error is not None:
+				self.errors.append((item, error))
+			elif result is False:
+				self.skipped += 1
+			else:
+				self.sent += 1
+				pending.append(item)
+				if len(pending) >= self.batch_size:
+					record_sent(list(pending))
+					del pending[:]
+
+		if self.threads == 0:
+			self.run_worker(iter(items).__next__, send, handle_result, close_db=False)
+		else:
+			tasks = queue.Queue(maxsize=self.threads*4)
+			results = queue.Queue()
+			done = object()
+
+			def next_task():
+				item = tasks.get()
+				if item is done: raise StopIteration()
+				return item
+
+			workers = [
+				threading.Thread(target=self.run_worker, args=(next_task, send, lambda *r : results.put(r)))
+				for i in range(self.threads)]
+			for w in workers:
+				w.start()
+
+			def drain():
+				while True:
+					try:
+						handle_result(*results.get_nowait())
+					except queue.Empty:
+						break
+
+			for item in items:
+				tasks.put(item) # blocks when the workers are behind
+				drain()
+			for w in workers:
+				tasks.put(done)
+			for w in workers:
+				w.join()
+			drain()
+
+		if pending:
+			record_sent(list(pending))
+		self.elapsed = time.time() - start
+
+	@staticmethod
+	def run_worker(next_task, send, handle_result, close_db=True):
+		from django.core.mail import get_connection
+		from django.db import connection as db_connection
+		connection = None
+		try:
+			while True:
+				try:
+					item = next_task()
+				except StopIteration:
+					break
+				try:
+					if connection is None:
+						connection = get_connection()
+						connection.open()
+					handle_result(item, send(item, connection), None)
+				except Exception as e:
+					# The mail connection may be broken now, so start a new
+					# one for the next item.
+					if connection is not None:
+						try:
+							connection.close()
+						except Exception:
+							pass
+						connection = None
+					handle_result(item, None, e)
+		finally:
+			if connection is not None:
+				connection.close()
+			if close_db:
+				# Worker threads get their own database connections.
+				db_connection.close()
+
+	def summary(self):
+		return "Sent %d emails (%d skipped, %d failed) in %.1f seconds (%.1f/sec)." % (
+			self.sent, self.skipped, len(self.errors), self.elapsed,
+			self.sent / self.elapsed if self.elapsed else 0)
+
+class SharedContextCache:
+	def __init__(self):
+		# Safe to use from EmailDispatcher's worker threads.
+		self.lock = threading.Lock()
+		self.values = { }
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, compute):
+		# Returns the value for key, calling compute() to get it the first
+		# time. Exceptions aren't cached, so compute is tried again for the
+		# next email with the same key.
+		with self.lock:
+			if key in self.values:
+				self.hits += 1
+				return self.values[key]
+			value = compute()
+			self.values[key] = value
+			self.misses += 1
+			return value
+
+def get_spool_connection():
+	# Returns a mail connection that keeps the messages sent through it
+	# in its 'messages' attribute rather than sending them.
+	from django.core.mail.backends.base import BaseEmailBackend
+	class SpoolConnection(BaseEmailBackend):
+		def __init__(self, *args, **kwargs):
+			super(SpoolConnection, self).__init__(*args, **kwargs)
+			self.messages = []
+		def send_messages(self, messages):
+			self.messages.extend(messages)
+			return len(messages)
+	return SpoolConnection()
+
+def queue_mail(template_prefix, from_email, recipient_list, context, key=None, on_sent=[], **kwargs):
+	# Renders an email like htmlemailer.send_mail (additional keyword
+	# arguments are passed to it) and queues it to be sent. on_sent is a
+	# list of (model label, field name, IDs) whose field is set to the
+	# time the email is sent. If key is given and an email with that key
+	# was already queued (and not given up on), nothing is queued. Returns
+	# the OutboundEmail or None.
+	from django.db import transaction, IntegrityError
+	from htmlemailer import send_mail
+	from itfsite.models import OutboundEmail
+
+	if key is not None and OutboundEmail.objects.filter(key=key).exists():
+		return None
+
+	# Render.
+	spool = get_spool_connection()
+	send_mail(template_prefix, from_email, recipient_list, context, connection=spool, **kwargs)
+	email = OutboundEmail.from_message(spool.messages[0], key=key, on_sent=on_sent)
+
+	# Queue. Another process may have just queued the same key.
+	try:
+		with transaction.atomic():
+			email.save()
+	except IntegrityError:
+		if key is None: raise
+		return None
+	return email
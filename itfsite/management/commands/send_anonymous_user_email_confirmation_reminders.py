@@ -1,8 +1,14 @@
 # Send AnonymousUsers a follow-up email confirmation.
 # ---------------------------------------------------
+#
+# The AnonymousUsers due for a reminder, their EmailConfirmations and the
+# Pledges to confirm are loaded in batches with a few queries rather than
+# a few queries per user. The emails are queued and sent concurrently by
+# send_queued_emails.
 
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 
 from itfsite.models import AnonymousUser
@@ -10,26 +16,60 @@ from itfsite.models import AnonymousUser
 import sys
 import tqdm
 from datetime import timedelta
-from htmlemailer import send_mail
 
 class Command(BaseCommand):
 	args = ''
 	help = 'Sends follow-up confirmation emails for AnonymousUsers.'
 
+	# How many AnonymousUsers to load at a time.
+	batch_size = 500
+
 	def handle(self, *args, **options):
-		# Loop through AnonymousUsers that haven't been confirmed
-		# and whose EmailConfirmation object isn't close to expiring
-		# (make sure they have 30 hours before the record is expunged).
+		from email_confirm_la.models import EmailConfirmation
 
-		for au in AnonymousUser.objects.filter(
+		# Get AnonymousUsers that haven't been confirmed and whose
+		# EmailConfirmation object isn't close to expiring (make sure
+		# they have 30 hours before the record is expunged), that have
+		# been sent fewer than three emails, the last more than a day ago
+		# (see AnonymousUser.should_retry_email_confirmation).
+		anon_users = AnonymousUser.objects.filter(
 			confirmed_user=None,
 			created__gt=timezone.now()-timedelta(seconds=
 				settings.EMAIL_CONFIRM_LA_CONFIRM_EXPIRE_SEC
-					- 60*60*30)):
-
-			if au.should_retry_email_confirmation():
-				try:
-					au.send_email_confirmation()
-				except ValueError as e:
-					# Some sort of invalid call.
-					print(au, e)
+					- 60*60*30))
+		ecs = EmailConfirmation.objects.filter(
+			content_type=ContentType.objects.get_for_model(AnonymousUser),
+			object_id__in=anon_users.values('id'),
+			send_count__lt=3,
+			sent_at__lt=timezone.now() - timedelta(days=1))\
+			.order_by('object_id')
+		ecs = list(ecs)
+
+		batches = range(0, len(ecs), self.batch_size)
+
+		# Nice progress meter when debugging.
+		if sys.stdout.isatty():
+			batches = tqdm.tqdm(batches)
+
+		for i in batches:
+			self.send_batch(ecs[i:i+self.batch_size])
+
+	def send_batch(self, ecs):
+		# Load the AnonymousUsers and the most recent Pledge to confirm
+		# for each.
+		anon_users = AnonymousUser.objects.in_bulk([ec.object_id for ec in ecs])
+		pledges = { }
+		for pledge in AnonymousUser.get_confirmable_pledges()\
+			.filter(anon_user__in=anon_users.keys())\
+			.select_related('profile', 'via_campaign'):
+			pledges.setdefault(pledge.anon_user_id, pledge)
+
+		for ec in ecs:
+			au = anon_users.get(ec.object_id)
+			if au is None or au.confirmed_user_id is not None:
+				continue
+			try:
+				au.send_email_confirmation(ec=ec, pledge=pledges.get(au.id))
+			except ValueError as e:
+				# Some sort of invalid call.
+				print(au, e)
@@ -1,21 +1,34 @@
 # Send users emails of new notifications.
 # ---------------------------------------
+#
+# The pending notifications for a batch of users are loaded in a few
+# queries (with their sources prefetched), grouped by user in memory,
+# rendered into digests, and queued (see send_queued_emails). The
+# notifications are marked as mailed when the digest is sent. Users whose
+# last digest is still waiting to be sent are skipped until it is sent.
 
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.utils import timezone
+from django.db.models import Max
 
-from itfsite.models import User, Notification, NotificationsFrequency
+from itfsite.models import User, Notification, NotificationsFrequency, OutboundEmail, OutboundEmailStatus
+from itfsite.mailer import queue_mail
 
 import sys
 import tqdm
 from datetime import timedelta
-from htmlemailer import send_mail
 
 class Command(BaseCommand):
 	args = 'daily|weekly'
 	help = 'Sends users emails with new notifications.'
 
+	# How many users to load notifications for at a time.
+	batch_size = 500
+
+	# Only send up to this many of the most recent notifications to a user.
+	max_notifications = 50
+
 	def handle(self, *args, **options):
 		if len(args) == 0:
 			print("Specify daily or weekly.")
@@ -27,21 +40,23 @@ class Command(BaseCommand):
 		}[args[0]]
 
 		# What users do we plausibly have notifications to send to?
-		users = self.get_notifications_qs()\
+		users = list(self.get_notifications_qs()\
 			.filter(user__notifs_freq=freq)\
 			.values_list('user', flat=True)\
-			.distinct()
+			.distinct())
 
-		# Nice progress meter when debugging.
-		if sys.stdout.isatty():
-			users = tqdm.tqdm(users)
+		# Skip users who have a digest queued that hasn't been sent yet. Its
+		# notifications aren't marked as mailed until it is sent, so they
+		# would be sent again in a second digest with any new ones.
+		queued = self.get_users_with_queued_digests()
+		users = [user for user in users if user not in queued]
 
-		# Loop through users.
-		for user in users:
+		# Queue the digests.
+		for digest in self.get_digests(users):
 			try:
-				self.send_notifications_email(user)
+				self.send_notifications_email(digest)
 			except OSError as e:
-				print(user, e)
+				print(digest["user"], e)
 
 	def get_notifications_qs(self):
 		return Notification.objects.filter(
@@ -50,64 +65,112 @@ class Command(BaseCommand):
 			mailed_at=None, # don't send stuff we have already mailed
 			)
 
-	def send_notifications_email(self, user_id):
-		# Get the user.
-		user = User.objects.get(id=user_id)
+	def get_users_with_queued_digests(self):
+		# Returns the set of IDs of users that have a digest that is queued
+		# or being sent, from the keys of their OutboundEmails (see
+		# send_notifications_email).
+		keys = OutboundEmail.objects.filter(
+			status__in=(OutboundEmailStatus.Queued, OutboundEmailStatus.Sending),
+			key__startswith="notifications:")\
+			.values_list('key', flat=True)
+		return set(int(key.split(":")[1]) for key in keys)
+
+	def get_digests(self, user_ids):
+		# Yields a dict for each user that has notifications to email, with
+		# the user, profile, the rendered alerts and the notifications.
+		batches = range(0, len(user_ids), self.batch_size)
+
+		# Nice progress meter when debugging.
+		if sys.stdout.isatty():
+			batches = tqdm.tqdm(batches)
+
+		for i in batches:
+			yield from self.get_digests_batch(user_ids[i:i+self.batch_size])
 
-		# Get the notifications to email.
-		notifs = self.get_notifications_qs().filter(user=user)
+	def get_digests_batch(self, user_ids):
+		users = User.objects.in_bulk(user_ids)
 
 		# Don't send any notifications that were generated prior to the
-		# most recently emailed notification.
-		most_recent_emailed = Notification.objects.filter(user=user)\
-			.exclude(mailed_at=None).order_by('-mailed_at').first()
-		if most_recent_emailed:
-			notifs = notifs.filter(created__gte=most_recent_emailed.mailed_at)
-
-		# Nothing to send after all?
-		if notifs.count() == 0:
-			return
-
-		# Only send up to the 50 most recent.
-		notifs = notifs.order_by('-created')[0:50]
+		# most recently emailed notification for each user. (Compare with
+		# when it was generated rather than when it was mailed, since
+		# notifications generated while a digest was waiting in the queue
+		# haven't been mailed.)
+		most_recent_emailed = dict(Notification.objects
+			.filter(user__in=user_ids)
+			.exclude(mailed_at=None)
+			.values('user')
+			.annotate(last_mailed_created=Max('created'))
+			.values_list('user', 'last_mailed_created'))
+
+		# Get the notifications to email, grouped by user, most recent first.
+		notifs_by_user = { }
+		for n in self.get_notifications_qs()\
+			.filter(user__in=user_ids)\
+			.select_related('source_content_type')\
+			.prefetch_related('source')\
+			.order_by('-created'):
+			if n.user_id in most_recent_emailed and n.created < most_recent_emailed[n.user_id]:
+				continue
+			notifs_by_user.setdefault(n.user_id, []).append(n)
 
 		# Prune any Notification objects whose generic object 'source'
 		# is dangling (source object has since been deleted).
-		def filter_and_delete(n):
-			if n.source is None:
-				n.delete()
-				return False
-			return True
-		notifs = list(filter(filter_and_delete, notifs))
-
-		# Render.
-		alerts = Notification.render(notifs, for_client=False)
-		if len(alerts) == 0: # Nothing to send after all?
-			return
+		dangling = [n for notifs in notifs_by_user.values() for n in notifs if n.source is None]
+		if dangling:
+			Notification.objects.filter(id__in=[n.id for n in dangling]).delete()
+			Notification.invalidate_cache([n.user_id for n in dangling])
 
-		# Get the user's most recent pledge ContributorInfo object
+		# Get each user's most recent pledge ContributorInfo object
 		# to generate the salutation from. (May be null.)
-		profile = user.get_contributorinfo()
-
-		# Activate the user's preferred timezone? Not needed since 
+		profiles = get_latest_contributorinfos(list(notifs_by_user))
+
+		for user_id, notifs in notifs_by_user.items():
+			# Only send up to the most recent notifications that still
+			# have sources.
+			notifs = [n for n in notifs if n.source is not None][0:self.max_notifications]
+
+			# Render.
+			alerts = Notification.render(notifs, for_client=False)
+			if len(alerts) == 0: # Nothing to send after all?
+				continue
+
+			yield {
+				"user": users[user_id],
+				"profile": profiles.get(user_id),
+				"alerts": alerts,
+				"notifications": notifs,
+			}
+
+	def send_notifications_email(self, digest):
+		# Activate the user's preferred timezone? Not needed since
 		# we aren't displaying notification times in the email, but
 		# maybe we will?
 		#user.active_timezone()
 
-		# Send email.
-		send_mail(
+		# Queue email. The notifications are marked as mailed when it is sent.
+		# The key identifies the user (see get_users_with_queued_digests).
+		notif_ids = [n.id for n in digest["notifications"]]
+		queue_mail(
 			"itfsite/mail/notifications",
 			settings.DEFAULT_FROM_EMAIL,
-			[user.email],
+			[digest["user"].email],
 			{
-				"user": user,
-				"profile": profile,
-				"notifs": alerts,
-				"subject": alerts[0]['title'],
-				"count": len(alerts),
-			})
-
-		# Record that these notifications were sent.
-		# Weird because of 'Cannot update a query once a slice has been taken.'.
-		notifs = Notification.objects.filter(id__in=[n.id for n in notifs])
-		notifs.update(mailed_at=timezone.now())
+				"user": digest["user"],
+				"profile": digest["profile"],
+				"notifs": digest["alerts"],
+				"subject": digest["alerts"][0]['title'],
+				"count": len(digest["alerts"]),
+			},
+			key="notifications:%d:%d" % (digest["user"].id, max(notif_ids)),
+			on_sent=[("itfsite.Notification", "mailed_at", notif_ids)])
+
+def get_latest_contributorinfos(user_ids):
+	# Returns a dict from user IDs to the ContributorInfo of each user's
+	# most recent Pledge, like User.get_contributorinfo, for users with
+	# pledges.
+	from contrib.models import Pledge, ContributorInfo
+	latest = { }
+	for user_id, profile_id in Pledge.objects.filter(user__in=user_ids).order_by('-created').values_list('user', 'profile'):
+		latest.setdefault(user_id, profile_id)
+	profiles = ContributorInfo.objects.in_bulk(latest.values())
+	return { user_id: profiles.get(profile_id) for user_id, profile_id in latest.items() }
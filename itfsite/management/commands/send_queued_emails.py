@@ -0,0 +1,93 @@
+# Send queued emails.
+# -------------------
+#
+# Emails are rendered and queued as OutboundEmail records by the commands
+# and views that produce them (see itfsite.mailer.queue_mail). This command
+# sends them. It runs until killed, or just once with --once.
+#
+# Emails are claimed in batches, so more than one sender can run at once,
+# sent by a pool of worker threads over persistent connections to the mail
+# relay, no faster than --rate per second. Failed emails are retried with
+# exponential backoff, and given up on after a while so that they can be
+# queued again. Once an email is accepted by the relay, the fields that
+# record that it was sent (e.g. Pledge.pre_execution_email_sent_at) are
+# set.
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from itfsite.models import OutboundEmail, OutboundEmailStatus
+from itfsite.mailer import EmailDispatcher
+from contrib.utils import RateLimiter
+
+import time, uuid
+from datetime import timedelta
+
+class Command(BaseCommand):
+	args = ''
+	help = 'Sends queued emails.'
+
+	# How long a sender has to send a batch before other senders may
+	# claim the emails in it.
+	claim_lease = 60*10
+
+	# How long to keep sent emails and emails that failed to send.
+	keep_sent_days = 30
+
+	def add_arguments(self, parser):
+		parser.add_argument('--once', action='store_true', help='Send the emails that are due and exit.')
+		parser.add_argument('--interval', type=int, default=15, help='The number of seconds to wait between checks for new emails.')
+		parser.add_argument('--threads', type=int, default=8, help='The number of emails to send concurrently.')
+		parser.add_argument('--rate', type=float, default=20, help='The maximum number of emails to send to the mail relay per second.')
+		parser.add_argument('--batch-size', type=int, default=500, help='The number of emails to claim at a time.')
+
+	def handle(self, *args, **options):
+		limiter = RateLimiter(options.get('rate', 20))
+		while True:
+			self.send_queued_emails(
+				threads=options.get('threads', 0),
+				batch_size=options.get('batch_size', 500),
+				limiter=limiter)
+
+			if options.get('once'):
+				break
+
+			# Don't hold a database connection open while sleeping.
+			close_old_connections()
+			time.sleep(options['interval'])
+
+	def send_queued_emails(self, threads=0, batch_size=500, limiter=None):
+		# Sends batches of emails until none are due.
+		token = uuid.uuid4().hex
+		while True:
+			emails = OutboundEmail.claim_batch(token, batch_size, self.claim_lease)
+			if not emails:
+				break
+
+			def send(email, connection):
+				if limiter: limiter.wait()
+				email.to_message(connection=connection).send()
+
+			dispatcher = EmailDispatcher(threads=threads)
+			dispatcher.run(emails, send, OutboundEmail.record_sent)
+			for email, e in dispatcher.errors:
+				email.record_failed(e)
+			print("Queued emails: %s" % dispatcher.summary())
+			self.print_stats()
+
+		# Clear out old sent emails and emails that were given up on.
+		OutboundEmail.objects.filter(
+			status=OutboundEmailStatus.Sent,
+			sent_at__lt=timezone.now() - timedelta(days=self.keep_sent_days))\
+			.delete()
+		OutboundEmail.objects.filter(
+			status=OutboundEmailStatus.Failed,
+			updated__lt=timezone.now() - timedelta(days=self.keep_sent_days))\
+			.delete()
+
+	def print_stats(self):
+		# Print the number of emails in the queue in each status.
+		print("Email queue: " + ", ".join(
+			"%d %s" % (OutboundEmail.objects.filter(status=status).count(), status.name.lower())
+			for status in OutboundEmailStatus if status != OutboundEmailStatus.Sent))
@@ -19,25 +19,39 @@ def load_brandings():
 		for domain in data.get("alt-domains", []): settings.BRAND_DOMAIN_MAP[domain] = brandid
 	settings.BRAND_CHOICES.sort()
 
-def get_branding(request_or_brandid):
-	if isinstance(request_or_brandid, str):
-		brandid = request_or_brandid
-	elif isinstance(request_or_brandid, int):
-		brandid = settings.BRANDS_FROM_INDEX[request_or_brandid]
-	else:
-		# Choose brand ID from the request hostname.
-		host = request_or_brandid.get_host().split(":")[0]
-		if host in settings.BRAND_DOMAIN_MAP:
-			brandid = settings.BRAND_DOMAIN_MAP[host]
-		elif host in ("127.0.0.1", "localhost", "demo.if.then.fund"):
-			brandid = settings.DEFAULT_BRAND
-		else:
-			raise DisallowedHost(host)
+	# The brand for each host name we serve, including ones used in development.
+	settings.BRAND_HOST_MAP = { host: settings.DEFAULT_BRAND for host in ("127.0.0.1", "localhost", "demo.if.then.fund") }
+	settings.BRAND_HOST_MAP.update(settings.BRAND_DOMAIN_MAP)
+
+	# Build each brand's template context once. They're read-only since
+	# they're shared.
+	from types import MappingProxyType
+	settings.BRAND_CONTEXTS = { }
+	settings.BRAND_REQUEST_CONTEXTS = { }
+	for brandid in settings.BRANDS:
+		ctx = make_branding_context(brandid)
+		settings.BRAND_CONTEXTS[brandid] = MappingProxyType(ctx)
+		settings.BRAND_CONTEXTS[settings.BRANDS[brandid]['index']] = settings.BRAND_CONTEXTS[brandid]
+		settings.BRAND_REQUEST_CONTEXTS[brandid] = MappingProxyType(dict(settings.DEFAULT_TEMPLATE_CONTEXT, **ctx))
+
+	# Find the templates each brand overrides.
+	settings.BRAND_TEMPLATES = { brandid: find_brand_templates(brandid) for brandid in settings.BRANDS }
 
+def find_brand_templates(brandid):
+	# Returns the set of the names of the templates in the brand's
+	# templates directory.
+	import os, os.path
+	root = os.path.join("branding", brandid, "templates")
+	return frozenset(
+		os.path.relpath(os.path.join(dirpath, fn), root).replace(os.sep, "/")
+		for dirpath, dirnames, filenames in os.walk(root)
+		for fn in filenames)
+
+def make_branding_context(brandid):
 	# Return a template context dictionary based on the branding settings.
 	brand = settings.BRANDS[brandid]
 	email_domain = re.sub(r"^www\.", "", brand['site-domain'])
-	return {
+	ctx = {
 		"BRAND_ID": brandid,
 		"BRAND_INDEX": brand['index'],
 		"SITE_NAME": brand['site-name'],
@@ -50,14 +64,47 @@ def get_branding(request_or_brandid):
 		"COPYRIGHT": brand['copyright'],
 	}
 
-def itfsite_template_context_processor(request):
-	ctx = dict(settings.DEFAULT_TEMPLATE_CONTEXT)
-	ctx.update(get_branding(request))
-
 	# for spam obfuscation
-	import re
 	ctx["CONTACT_EMAIL_REVERSED"] = "".join(reversed(re.search(r"<(.*)>", ctx['CONTACT_EMAIL']).group(1)))
 
 	return ctx
 
+def get_brand_id(request):
+	# Choose brand ID from the request hostname. It's looked up many times
+	# per request, so remember it on the request.
+	try:
+		return request._itfsite_brand_id
+	except AttributeError:
+		pass
+	host = request.get_host().split(":")[0]
+	try:
+		request._itfsite_brand_id = settings.BRAND_HOST_MAP[host]
+	except KeyError:
+		raise DisallowedHost(host)
+	return request._itfsite_brand_id
+
+def get_branding(request_or_brandid):
+	# Returns the (read-only) template context for a brand, given its
+	# ID, its index, or a request for a page on the brand's site.
+	if isinstance(request_or_brandid, (str, int)):
+		return settings.BRAND_CONTEXTS[request_or_brandid]
+	return settings.BRAND_CONTEXTS[get_brand_id(request_or_brandid)]
+
+def get_brand_template_name(request_or_brandid, template):
+	# Returns the name of the brand-specific template that overrides the
+	# template, if the brand has one, or else the template name itself.
+	# In DEBUG mode the brand's templates directory is checked each time so
+	# that new templates are picked up without a restart.
+	import os.path
+	brandid = get_branding(request_or_brandid)['BRAND_ID']
+	template1 = os.path.join('branding', brandid, 'templates', template)
+	if settings.DEBUG:
+		exists = os.path.exists(template1)
+	else:
+		exists = template in settings.BRAND_TEMPLATES[brandid]
+	return template1 if exists else template
+
+def itfsite_template_context_processor(request):
+	return settings.BRAND_REQUEST_CONTEXTS[get_brand_id(request)]
+
 load_brandings()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2016-09-06 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import enumfields.fields
+import itfsite.models
+import itfsite.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itfsite', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(blank=True, help_text="An optional unique key for what this email is about, so that the same email isn't queued twice.", max_length=128, null=True, unique=True)),
+                ('from_email', models.CharField(help_text='The From: address.', max_length=256)),
+                ('to', itfsite.utils.JSONField(help_text='The list of recipient addresses.')),
+                ('subject', models.TextField(help_text='The subject line.')),
+                ('body', models.TextField(help_text='The plain text body.')),
+                ('alternatives', itfsite.utils.JSONField(blank=True, help_text='Alternative bodies, as a list of [content, MIME type] pairs.')),
+                ('headers', itfsite.utils.JSONField(blank=True, help_text='Additional headers.')),
+                ('on_sent', itfsite.utils.JSONField(blank=True, help_text='Fields to set to the time the email is sent, as a list of [model label, field name, list of IDs].')),
+                ('status', enumfields.fields.EnumIntegerField(default=1, enum=itfsite.models.OutboundEmailStatus, help_text='Whether the email has been sent.')),
+                ('attempts', models.IntegerField(default=0, help_text='The number of times sending the email failed.')),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text="When to try sending the email next. While being sent, when the sender's claim on it expires.")),
+                ('claim', models.CharField(blank=True, db_index=True, help_text='A token identifying the sender that claimed the email.', max_length=32)),
+                ('last_error', models.TextField(blank=True, help_text='The error from the last failed attempt.')),
+                ('sent_at', models.DateTimeField(blank=True, help_text='When the email was accepted by the mail relay.', null=True)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -171,8 +171,8 @@ class Campaign(models.Model):
 
 		ret = { }
 
-		from django.db.models import Sum, Count
-		from contrib.models import TriggerStatus, TriggerCustomization, Pledge, PledgeExecution, PledgeExecutionProblem
+		from django.db.models import Sum
+		from contrib.models import TriggerStatus, TriggerCustomization, Pledge, PledgeExecution, PledgeExecutionProblem, UserSketch, UserSketchKind
 
 		# What pledges should we show? For consistency across stats, filter out unconfirmed
 		# pledges and pledges made after the trigger was executed, which shouldn't be shown
@@ -182,10 +182,12 @@ class Campaign(models.Model):
 			# When we're showing a campaign owned by an organization, then we
 			# only count pledges to this very campaign.
 			pledges = pledges_base.filter(via_campaign=self)
+			sketch_slice_fields = { "via_campaign": self }
 		else:
 			# Otherwise, we can count any campaign but only to triggers in this
 			# campaign.
 			pledges = pledges_base.filter(trigger__in=self.contrib_triggers.all())
+			sketch_slice_fields = { }
 
 		# If no trigger cutomization has a fixed outcome, then we can show
 		# plege totals. (We can't show pledge totals when there is a fixed
@@ -195,7 +197,10 @@ class Campaign(models.Model):
 		tcusts = TriggerCustomization.objects.filter(owner=self.owner, trigger__campaigns=self)
 		if not tcusts.exclude(outcome=None).exists():
 			ret["pledged_total"] = pledges.aggregate(sum=Sum('amount'))["sum"] or 0
-			ret["pledged_user_count"] = pledges.values("user").distinct().aggregate(count=Count('user'))["count"] or 0
+			# The distinct user count comes from the merged sketches of pledging
+			# users, which is approximate and also counts users who pledged after
+			# trigger execution.
+			ret["pledged_user_count"] = UserSketch.count(UserSketchKind.Pledging, trigger__in=self.contrib_triggers.all(), **sketch_slice_fields)
 		else:
 			ret["pledged_site_wide"] = pledges_base.filter(trigger__in=self.contrib_triggers.all()).aggregate(sum=Sum('amount'))["sum"] or 0
 
@@ -204,7 +209,7 @@ class Campaign(models.Model):
 		# Of course, this could be on all sides of an issue, so this isn't usually
 		# interesting.
 		ret["contrib_total"] = 0
-		ret["contrib_user_count"] = 0 # not distinct across triggers
+		ret["contrib_user_count"] = 0
 
 		# Assume all fixed-outcome triggers are about the same issue. Compute the totals
 		# across those triggers. Otherwise, we don't know whether outcome X in any trigger
@@ -214,6 +219,7 @@ class Campaign(models.Model):
 		# Report outcomes by trigger, with a breakdown by outcome, and sum across triggers.
 		from contrib.views import report_fetch_data
 		ret["by_trigger"] = []
+		reported_triggers = []
 		for trigger in self.contrib_triggers.filter(status=TriggerStatus.Executed).order_by('-created'):
 			try:
 				# Get this trigger's totals.
@@ -229,7 +235,7 @@ class Campaign(models.Model):
 				# if contrib_total > 0, then there is by_trigger information. So we
 				# do these two parts together for consistency.
 				ret["contrib_total"] += agg["total"]["total"]
-				ret["contrib_user_count"] += agg["users"] # not distinct
+				reported_triggers.append(trigger)
 
 				# If this trigger has a TriggerCustomization with a fixed outcome,
 				# sum the total contributions for that outcome only.
@@ -247,8 +253,25 @@ class Campaign(models.Model):
 				# totals.
 				continue
 
+		# Count the distinct users across the triggers that we reported totals
+		# for by merging their sketches of contributing users.
+		if reported_triggers:
+			ret["contrib_user_count"] = UserSketch.count(UserSketchKind.Contributing, trigger__in=reported_triggers, **sketch_slice_fields)
+
 		return ret
 
+	def get_daily_activity(self):
+		# Get the day-by-day pledge and contribution activity for this campaign,
+		# using the same scope as get_contrib_totals: pledges via this very campaign
+		# if the campaign has an owner, else pledges via any campaign to the
+		# campaign's triggers. Unlike get_contrib_totals, unconfirmed pledges
+		# are included.
+		from contrib.models import DailyActivity
+		if self.owner:
+			return DailyActivity.series(via_campaign=self)
+		else:
+			return DailyActivity.series(trigger__in=self.contrib_triggers.all())
+
 
 #####################################################################
 #
@@ -261,6 +284,15 @@ class Campaign(models.Model):
 class NotificationType(enum.Enum):
 	TriggerRecommendation = 1
 
+def get_compiled_template(template_string):
+	# Alerts of the same kind share a template string, so compile each
+	# string once per process.
+	if not hasattr(get_compiled_template, 'cache'):
+		get_compiled_template.cache = { }
+	if template_string not in get_compiled_template.cache:
+		get_compiled_template.cache[template_string] = Template(template_string)
+	return get_compiled_template.cache[template_string]
+
 class Notification(models.Model):
 	"""A notification that we want to show to a user."""
 
@@ -286,10 +318,49 @@ class Notification(models.Model):
 	def __str__(self):
 		return ", ".join([self.created.isoformat(), str(self.user), self.notif_type.name, str(self.source)])
 
+	def save(self, *args, **kwargs):
+		super(Notification, self).save(*args, **kwargs)
+		Notification.invalidate_cache([self.user_id])
+
+	def delete(self, *args, **kwargs):
+		super(Notification, self).delete(*args, **kwargs)
+		Notification.invalidate_cache([self.user_id])
+
 	def dismiss(self):
 		self.dismissed_at = timezone.now()
 		self.save()
 
+	@staticmethod
+	def get_cache_key(user_id):
+		return "notifications:%d" % user_id
+
+	@staticmethod
+	def invalidate_cache(user_ids):
+		# Clears the cached rendered notifications of the users. This must be
+		# called after any bulk change to notifications (QuerySet.update,
+		# bulk_create, etc.) since those don't call save.
+		from django.core.cache import cache
+		cache.delete_many([Notification.get_cache_key(user_id) for user_id in set(user_ids)])
+
+	@staticmethod
+	def render_for_user(user):
+		# Returns the rendered JSON-able notifications for the user's most
+		# recent 30 notifications, which are shown on every page. They are
+		# cached until the user's notifications change. The cache expires
+		# anyway after a while since the objects the notifications are about
+		# may change too.
+		from django.core.cache import cache
+		key = Notification.get_cache_key(user.id)
+		alerts = cache.get(key)
+		if alerts is None:
+			notifs = Notification.objects.filter(user=user)\
+				.select_related('source_content_type')\
+				.prefetch_related('source')\
+				.order_by('-created')[0:30]
+			alerts = Notification.render(notifs)
+			cache.set(key, alerts, settings.NOTIFICATIONS_CACHE_TTL)
+		return alerts
+
 	@staticmethod
 	def render(qs, for_client=True):
 		# Get JSON-able data so the client can render the user's notifications.
@@ -305,8 +376,8 @@ class Notification(models.Model):
 
 		for alert in alerts:
 			# Render the alert content.
-			alert["body_html"] = Template(alert["body_html"]).render(Context(alert["body_context"]))
-			alert["body_text"] = Template(alert["body_text"]).render(Context(alert["body_context"]))
+			alert["body_html"] = get_compiled_template(alert["body_html"]).render(Context(alert["body_context"]))
+			alert["body_text"] = get_compiled_template(alert["body_text"]).render(Context(alert["body_context"]))
 
 			# Add common properties derived from the notifications that underlie the alerts.
 			alert["date"] = max(n.created for n in alert['notifications']) # most recent notification
@@ -320,3 +391,122 @@ class Notification(models.Model):
 
 		# Return.
 		return alerts
+
+#####################################################################
+#
+# Outbound Email
+#
+#####################################################################
+
+class OutboundEmailStatus(enum.Enum):
+	Queued = 1 # waiting to be sent, possibly again after a failure
+	Sending = 2 # claimed by a sender
+	Sent = 3 # accepted by the mail relay
+	Failed = 4 # gave up after too many attempts
+
+class OutboundEmail(models.Model):
+	"""An email that has been rendered and is waiting to be sent, or was sent, by the send_queued_emails command."""
+
+	key = models.CharField(max_length=128, blank=True, null=True, unique=True, help_text="An optional unique key for what this email is about, so that the same email isn't queued twice.")
+
+	from_email = models.CharField(max_length=256, help_text="The From: address.")
+	to = JSONField(help_text="The list of recipient addresses.")
+	subject = models.TextField(help_text="The subject line.")
+	body = models.TextField(help_text="The plain text body.")
+	alternatives = JSONField(blank=True, help_text="Alternative bodies, as a list of [content, MIME type] pairs.")
+	headers = JSONField(blank=True, help_text="Additional headers.")
+	on_sent = JSONField(blank=True, help_text="Fields to set to the time the email is sent, as a list of [model label, field name, list of IDs].")
+
+	status = EnumField(OutboundEmailStatus, default=OutboundEmailStatus.Queued, help_text="Whether the email has been sent.")
+	attempts = models.IntegerField(default=0, help_text="The number of times sending the email failed.")
+	next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True, help_text="When to try sending the email next. While being sent, when the sender's claim on it expires.")
+	claim = models.CharField(max_length=32, blank=True, db_index=True, help_text="A token identifying the sender that claimed the email.")
+	last_error = models.TextField(blank=True, help_text="The error from the last failed attempt.")
+	sent_at = models.DateTimeField(blank=True, null=True, help_text="When the email was accepted by the mail relay.")
+
+	created = models.DateTimeField(auto_now_add=True, db_index=True)
+	updated = models.DateTimeField(auto_now=True, db_index=True)
+
+	# Retry failed emails after 2, 4, 8, ... minutes, up to this many times.
+	MAX_ATTEMPTS = 8
+
+	def __str__(self):
+		return "%s to %s: %s" % (self.status.name, ", ".join(self.to), self.subject)
+
+	@staticmethod
+	def from_message(message, key=None, on_sent=[]):
+		# Returns a new unsaved OutboundEmail for a Django EmailMessage.
+		return OutboundEmail(
+			key=key,
+			from_email=message.from_email,
+			to=list(message.to),
+			subject=message.subject,
+			body=message.body,
+			alternatives=[list(a) for a in getattr(message, 'alternatives', [])],
+			headers=dict(message.extra_headers),
+			on_sent=[[label, field, list(ids)] for label, field, ids in on_sent],
+		)
+
+	def to_message(self, connection=None):
+		# Returns a Django EmailMessage for this email.
+		from django.core.mail import EmailMultiAlternatives
+		return EmailMultiAlternatives(
+			self.subject,
+			self.body,
+			self.from_email,
+			self.to,
+			headers=self.headers or {},
+			alternatives=[tuple(a) for a in (self.alternatives or [])],
+			connection=connection)
+
+	@staticmethod
+	def claim_batch(token, size, lease):
+		# Claims up to size emails that are due to be sent (including
+		# ones whose earlier claim has expired) for the sender identified
+		# by token, for lease seconds, and returns them. The UPDATE only
+		# claims emails that no other sender claimed in the meanwhile.
+		from datetime import timedelta
+		now = timezone.now()
+		due = OutboundEmail.objects.filter(
+			status__in=(OutboundEmailStatus.Queued, OutboundEmailStatus.Sending),
+			next_attempt_at__lte=now)
+		ids = list(due.order_by('next_attempt_at', 'id').values_list('id', flat=True)[0:size])
+		due.filter(id__in=ids).update(
+			status=OutboundEmailStatus.Sending,
+			claim=token,
+			next_attempt_at=now + timedelta(seconds=lease))
+		return list(OutboundEmail.objects.filter(id__in=ids, claim=token, status=OutboundEmailStatus.Sending).order_by('id'))
+
+	@staticmethod
+	def record_sent(emails):
+		# Marks the emails as sent and sets the fields in their on_sent
+		# lists to the time they were sent.
+		from django.apps import apps
+		now = timezone.now()
+		updates = { }
+		for email in emails:
+			for label, field, ids in (email.on_sent or []):
+				updates.setdefault((label, field), set()).update(ids)
+		with transaction.atomic():
+			OutboundEmail.objects.filter(id__in=[email.id for email in emails])\
+				.update(status=OutboundEmailStatus.Sent, sent_at=now, claim="", last_error="")
+			for (label, field), ids in updates.items():
+				apps.get_model(label).objects.filter(id__in=ids).update(**{ field: now })
+
+	def record_failed(self, error):
+		# Schedules the email to be tried again later, with exponential
+		# backoff, or gives up. An email that is given up on releases its
+		# key so that the email can be queued again (e.g. the next time
+		# send_pledge_emails runs), since whatever the key is about hasn't
+		# been marked as sent.
+		from datetime import timedelta
+		self.attempts += 1
+		self.last_error = str(error)
+		self.claim = ""
+		if self.attempts >= OutboundEmail.MAX_ATTEMPTS:
+			self.status = OutboundEmailStatus.Failed
+			self.key = None
+		else:
+			self.status = OutboundEmailStatus.Queued
+			self.next_attempt_at = timezone.now() + timedelta(minutes=2**self.attempts)
+		self.save(update_fields=['attempts', 'last_error', 'claim', 'status', 'next_attempt_at', 'key', 'updated'])
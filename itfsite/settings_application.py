@@ -40,6 +40,17 @@ TEMPLATES[0]['OPTIONS']['context_processors'] += [
 	"itfsite.middleware.itfsite_template_context_processor",
 ]
 
+# Keep compiled templates in memory in production. Django 1.9 only does
+# that if the loaders are listed explicitly.
+if not DEBUG and 'loaders' not in TEMPLATES[0]['OPTIONS']:
+	TEMPLATES[0]['APP_DIRS'] = False
+	TEMPLATES[0]['OPTIONS']['loaders'] = [
+		('django.template.loaders.cached.Loader', [
+			'django.template.loaders.filesystem.Loader',
+			'django.template.loaders.app_directories.Loader',
+		]),
+	]
+
 AUTHENTICATION_BACKENDS += ['itfsite.betteruser.DirectLoginBackend']
 
 DEFAULT_FILE_STORAGE = 'dbstorage.storage.DatabaseStorage'
@@ -69,6 +80,9 @@ VOTERVOICE_API_KEY = environment.get('votervoice', {}).get('api_key')
 VOTERVOICE_ASSOCIATION = environment.get('votervoice', {}).get('association')
 CURRENT_ELECTION_CYCLE = 2016
 VALIDATE_EMAIL_DELIVERABILITY = True # turned off during tests
+HTTP_CACHE_DIR = environment.get('http_cache_dir', '/tmp/itf-http-cache') # for contrib.utils.query_json_api
+DISTRICT_INDEX_PATH = environment.get('district_index_path') # see contrib.districts
+NOTIFICATIONS_CACHE_TTL = 60*15 # seconds, see itfsite.models.Notification.render_for_user
 
 DEFAULT_TEMPLATE_CONTEXT = {
 	"SITE_MODE": SITE_MODE,
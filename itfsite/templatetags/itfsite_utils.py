@@ -70,5 +70,6 @@ class Include2Node(template.Node):
 		self.template_name = template_name
 
 	def render(self, context):
-		from itfsite.views import render2
-		return render2(context['request'], self.template_name.resolve(context), context=context).content
+		from itfsite.middleware import get_brand_template_name
+		template_name = get_brand_template_name(context['request'], self.template_name.resolve(context))
+		return context.template.engine.get_template(template_name).render(context)
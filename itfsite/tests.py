@@ -575,6 +575,22 @@ class ContribTest(SeleniumTest):
 		# Test that all outbound emails are accounted for.
 		self._test_no_more_emails()
 
+	def test_watch_votes(self):
+		# The vote watcher should execute the trigger for the chamber that
+		# voted on passage of the bill, but not the other.
+		from contrib.models import TriggerStatus
+		t1, c1 = self.create_test_campaign("hr30-114", "h")
+		t2, c2 = self.create_test_campaign("hr30-114", "s")
+
+		from django.core.management import call_command
+		call_command('watch_votes', once=True, include_old_votes=True)
+
+		t1.refresh_from_db()
+		t2.refresh_from_db()
+		self.assertEqual(t1.status, TriggerStatus.Executed)
+		self.assertEqual(t2.status, TriggerStatus.Open)
+		self.assertEqual(t1.execution.extra['govtrack_votes'][0]['link'], "https://www.govtrack.us/congress/votes/114-2015/h14")
+
 	def test_triggercustomization_pledge(self):
 		# Create a customized trigger.
 		t, campaign = self.create_test_campaign("s1-114", "h", with_customization=True)
@@ -622,8 +638,14 @@ class ContribTest(SeleniumTest):
 		# Test that all outbound emails are accounted for.
 		self._test_no_more_emails()
 
+def send_queued_emails():
+	# Emails are queued rather than sent, so send them now.
+	from itfsite.management.commands.send_queued_emails import Command
+	Command().handle(once=True)
+
 def pop_email():
 	import django.core.mail
+	send_queued_emails()
 	try:
 		msg = django.core.mail.outbox.pop(0)
 	except:
@@ -632,6 +654,7 @@ def pop_email():
 
 def has_more_email():
 	import django.core.mail
+	send_queued_emails()
 	try:
 		return len(django.core.mail.outbox) > 0
 	except:
@@ -13,6 +13,7 @@ urlpatterns = [
 
 	url(r'^', include('contrib.urls')),
 	url(r'^(user|org)/(\d+)/([^/]+)$', itfsite.views.org_landing_page),
+	url(r'^a/(\d+)/attribution\.json$', itfsite.views.campaign_attribution),
 	url(r'a/(?P<id>\d+)(?:/[a-z0-9_-]+)?(?:/(?P<action>contribute))?(?P<api_format_ext>\.json)?$', itfsite.views.campaign),
 
 	url(r'^find-campaign/bill-sponsors/([a-z]+\d+-\d+)$', itfsite.views.redirect_for_bill_cosponsors),
@@ -1,4 +1,4 @@
-import enum, json, datetime
+import enum, json, datetime, decimal
 
 from django.http import HttpResponse
 
@@ -36,6 +36,11 @@ def serialize_value(val, text_format):
 	if isinstance(val, str) and text_format: return render_text(val, text_format)
 	return val
 
+def serialize_row(row):
+	# Makes a dict of aggregate values (e.g. from a .values() query)
+	# serializable, turning Decimals into floats.
+	return { k: float(v) if isinstance(v, decimal.Decimal) else serialize_value(v, None) for k, v in row.items() }
+
 def serialize_obj(obj, keys=None, render_text_map={}):
 	# Makes a Python object JSON-serializable by turning its fields into dict attributes.
 	return { k: serialize_value(v, getattr(obj, render_text_map.get(k, "--"), None)) for k, v in obj.__dict__.items() if
@@ -48,3 +53,17 @@ def mergedicts(*args):
 	ret = { }
 	for d in args: ret.update(d)
 	return ret
+
+def csv_streaming_response(rows, filename):
+	# Returns a StreamingHttpResponse that writes out each row (a list of
+	# values) from the rows iterable as CSV as the response is sent, so
+	# that large exports don't have to be held in memory.
+	import csv
+	from django.http import StreamingHttpResponse
+	class Echo:
+		# A file-like object whose write() just returns the value written.
+		def write(self, value): return value
+	writer = csv.writer(Echo())
+	resp = StreamingHttpResponse((writer.writerow(row).encode('utf8') for row in rows), content_type="text/csv")
+	resp['Content-Disposition'] = 'attachment; filename="%s"' % filename
+	return resp
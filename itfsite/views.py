@@ -11,18 +11,9 @@ from itfsite.middleware import get_branding
 from twostream.decorators import anonymous_view, user_view_for
 
 def render2(request, template, *args, **kwargs):
-	import os.path
-	from django.template import TemplateDoesNotExist
-	template1 = os.path.join('branding', get_branding(request)['BRAND_ID'], 'templates', template)
-	try:
-		# Try a brand-specific template.
-		return render(request, template1, *args, **kwargs)
-	except TemplateDoesNotExist as e:
-		# Raise if the template that doesn't exist is one that is loaded by an include tag.
-		if hasattr(e, 'django_template_source'):
-			raise
-		# Try a default template.
-		return render(request, template, *args, **kwargs)
+	# Render a brand-specific template if the brand has one, else the default template.
+	from itfsite.middleware import get_brand_template_name
+	return render(request, get_brand_template_name(request, template), *args, **kwargs)
 
 @anonymous_view
 def homepage(request):
@@ -116,76 +107,54 @@ def user_home(request):
 def user_contribution_details(request):
 	from contrib.models import PledgeExecution
 
-	# Assemble a table of all line-item transactions.
-	items = []
-
-	# Contributions.
-	brand = get_branding(request) # only looking at contributions made on the site the user is looking at
-	from contrib.models import Contribution
-	contribs = Contribution.objects.filter(
-		pledge_execution__pledge__user=request.user,
-		pledge_execution__pledge__via_campaign__brand=brand['BRAND_INDEX'])\
-		.select_related('pledge_execution', 'recipient', 'action', 'pledge_execution__trigger_execution__trigger')
-	def contrib_line_item(c):
-		return {
-			'when': c.pledge_execution.created,
-			'amount': c.amount,
-			'recipient': c.name_long(),
-			'trigger': c.pledge_execution.trigger_execution.trigger,
-			'campaign': c.pledge_execution.pledge.via_campaign,
-			'sort': (c.pledge_execution.created, 1, c.recipient.is_challenger, c.id),
-		}
-	items.extend([contrib_line_item(c) for c in contribs])
-
-	# Fees.
-	def fees_line_item(p):
-		return {
-			'when': p.created,
-			'amount': p.fees,
-			'recipient': '%s fees' % brand['SITE_NAME'],
-			'trigger': p.trigger_execution.trigger,
-			'campaign': p.pledge.via_campaign,
-			'sort': (p.created, 0),
-		}
-	items.extend([fees_line_item(p) for p in PledgeExecution.objects.filter(
+	# Generate a table of all line-item transactions, most recent first: each
+	# execution's contributions followed by its fees. Only look at contributions
+	# made on the site the user is looking at.
+	brand = get_branding(request)
+	executions = PledgeExecution.objects.filter(
 		pledge__user=request.user,
 		pledge__via_campaign__brand=brand['BRAND_INDEX'])\
-		.select_related('trigger_execution__trigger')])
+		.select_related('pledge__via_campaign', 'trigger_execution__trigger')
+	def line_items():
+		for pe, contribs in PledgeExecution.iter_with_contributions(executions):
+			# Contributions.
+			for c in contribs:
+				yield {
+					'when': pe.created,
+					'amount': c.amount,
+					'recipient': c.name_long(),
+					'trigger': pe.trigger_execution.trigger,
+					'campaign': pe.pledge.via_campaign,
+				}
 
-	# Sort all together.
-	items.sort(key = lambda x : x['sort'], reverse=True)
+			# Fees.
+			yield {
+				'when': pe.created,
+				'amount': pe.fees,
+				'recipient': '%s fees' % brand['SITE_NAME'],
+				'trigger': pe.trigger_execution.trigger,
+				'campaign': pe.pledge.via_campaign,
+			}
 
 	if request.method == 'GET':
 		# GET => HTML
 		return render(request, "itfsite/user_contrib_details.html", {
-			'items': items,
+			'items': line_items(),
 			})
 	else:
-		# POST => CSV
-		from django.http import HttpResponse
-		import csv
-		from io import StringIO
-		buf = StringIO()
-		writer = csv.writer(buf)
-		writer.writerow(['date', 'amount', 'recipient', 'action', 'link'])
-		for item in items:
-			writer.writerow([
-				item['when'].isoformat(),
-				item['amount'],
-				item['recipient'],
-				item['campaign'].title,
-				item['campaign'].get_short_url(),
-				])
-		buf = buf.getvalue().encode('utf8')
-
-		if True:
-			resp = HttpResponse(buf, content_type="text/csv")
-			resp['Content-Disposition'] = 'attachment; filename="contributions.csv"'
-		else:
-			resp = HttpResponse(buf, content_type="text/plain")
-			resp['Content-Disposition'] = 'inline'
-		resp["Content-Length"] = len(buf)
-		return resp
+		# POST => CSV, streamed as it is generated.
+		from .utils import csv_streaming_response
+		def rows():
+			yield ['date', 'amount', 'recipient', 'action', 'link']
+			for item in line_items():
+				yield [
+					item['when'].isoformat(),
+					item['amount'],
+					item['recipient'],
+					item['campaign'].title,
+					item['campaign'].get_short_url(),
+					]
+		return csv_streaming_response(rows(), "contributions.csv")
 
 @anonymous_view
 def org_landing_page(request, path, id, slug):
@@ -208,7 +177,8 @@ def dismiss_notifications(request):
 		dismissed_at=None,
 		)\
 		.update(dismissed_at=timezone.now())
-		
+	Notification.invalidate_cache([request.user.id])
+
 	# Return something, but this is ignored.
 	return HttpResponse('OK', content_type='text/plain')
 
@@ -280,7 +250,7 @@ def campaign_show(request, campaign, is_json_api):
 
 	# for .json calls, just return data in JSON format
 	if is_json_api:
-		from .utils import json_response, serialize_obj, mergedicts
+		from .utils import json_response, serialize_obj, serialize_row, mergedicts
 		brand = get_branding(request)
 		return json_response({
 			"site": {
@@ -306,6 +276,7 @@ def campaign_show(request, campaign, is_json_api):
 					"max_split": trigger.max_split(),
 					"desired_outcome": outcome_strings[tcust.outcome] if tcust else None,
 				}) if trigger else None,
+			"activity": [serialize_row(day) for day in campaign.get_daily_activity()],
 			})
 
 	try:
@@ -414,6 +385,30 @@ def campaign_user_view(request, id, action, api_format_ext):
 
 	return ret
 
+def campaign_attribution(request, id):
+	# Referral code (utm_campaign) attribution totals for a campaign, as JSON.
+	# Available to staff and, so that an organization can be given a private
+	# link, to anyone with the key stored in the campaign owner's
+	# extra['attribution_key']. Add ?daily=1 for a breakdown by day.
+	from django.utils.crypto import constant_time_compare
+	from contrib.models import ReferralActivity
+	from .utils import json_response, serialize_row
+
+	campaign = get_object_or_404(Campaign, id=id, brand=get_branding(request)['BRAND_INDEX'])
+
+	key = ((campaign.owner.extra or {}).get('attribution_key') if campaign.owner else None)
+	if not (request.user.is_authenticated() and request.user.is_staff) \
+		and not (key and constant_time_compare(key, request.GET.get('key', ''))):
+		return HttpResponse("Not authorized.", content_type="text/plain", status=403)
+
+	return json_response({
+		"campaign": campaign.id,
+		"ref_codes": [
+			serialize_row(row)
+			for row in ReferralActivity.summarize(by_date=bool(request.GET.get('daily')), via_campaign=campaign)
+		],
+	})
+
 def create_automatic_campaign_from_trigger(trigger):
 	# Create/update a Campaign
 	if not trigger.extra.get('auto-campaign'):
@@ -458,16 +453,28 @@ def update_automatic_campaign_from_trigger(trigger):
 
 	return campaign
 
+# How old the sponsor data behind a bill's automatic campaign can get before
+# a visit to redirect_for_bill_cosponsors refreshes it in the background.
+SPONSORS_CAMPAIGN_MAX_AGE = 60*60 # seconds
+
 @anonymous_view
 def redirect_for_bill_cosponsors(request, bill_id):
 	# Redirect to an automaticallg generated campaign for the (co)sponsors
 	# of the given bill and its companion bill.
 	from contrib.models import Trigger
 	from contrib.legislative import create_trigger_for_sponsors
+
+	# If the campaign already exists, redirect to it immediately rather
+	# than waiting on the GovTrack API. If its data is stale, refresh it
+	# after responding.
+	campaign, as_of = get_existing_bill_cosponsors_campaign(bill_id)
+	if campaign:
+		if as_of is None or (timezone.now() - as_of).total_seconds() > SPONSORS_CAMPAIGN_MAX_AGE:
+			refresh_bill_cosponsors_campaign_in_background(bill_id)
+		return redirect(campaign.get_absolute_url())
+
+	# It's the first time, so we have to wait.
 	try:
-		# Get the trigger. If it's already created, don't update it
-		# so that we don't have to wait on the GovTrack API to continue.
-		# TODO: Set update to False in production.
 		trigger = create_trigger_for_sponsors(bill_id, with_companion=True, update=True)
 	except ValueError:
 		# Invalid bill ID.
@@ -478,3 +485,68 @@ def redirect_for_bill_cosponsors(request, bill_id):
 
 	# Redirect.
 	return redirect(campaign.get_absolute_url())
+
+def get_existing_bill_cosponsors_campaign(bill_id):
+	# Returns the automatic campaign that redirect_for_bill_cosponsors would
+	# create for the bill and when its data was last updated, or (None, None)
+	# if it hasn't been created yet, without making any remote API calls.
+	import dateutil.parser
+	from contrib.models import Trigger
+	from contrib.legislative import get_companion_bill
+
+	# Get the bill's own sponsors trigger.
+	t1 = Trigger.objects.filter(key="usbill:sponsors:" + bill_id).first()
+	if not t1 or not t1.extra or 'bill_info' not in t1.extra:
+		return (None, None)
+
+	# Get the trigger that the campaign is for: the super-trigger with the
+	# companion bill if there is one, else the bill's own trigger.
+	if t1.extra.get("supertrigger-with-companion"):
+		trigger = Trigger.objects.filter(id=t1.extra["supertrigger-with-companion"]).first()
+	elif get_companion_bill(t1.extra['bill_info']):
+		# The super-trigger hasn't been made yet.
+		return (None, None)
+	else:
+		trigger = t1
+	if not trigger or not trigger.extra or not trigger.extra.get('auto-campaign'):
+		return (None, None)
+
+	campaign = Campaign.objects.filter(id=trigger.extra['auto-campaign']).first()
+	if not campaign:
+		return (None, None)
+
+	as_of = t1.extra['bill_info'].get('as_of')
+	if as_of: as_of = dateutil.parser.parse(as_of)
+	return (campaign, as_of)
+
+def refresh_bill_cosponsors_campaign_in_background(bill_id):
+	# Update a bill's sponsors triggers and automatic campaign on a background
+	# thread. The cache is used as a lock so that concurrent visitors don't
+	# start redundant refreshes. A successful refresh holds the lock until
+	# the campaign is due for another refresh; a failed one releases it so
+	# the next visitor tries again (and the lock expires on its own in case
+	# the thread dies). The lock only spans processes if the cache backend
+	# is shared (e.g. memcached or the database cache, not the default
+	# per-process local-memory cache); otherwise each process may refresh
+	# once, which is harmless since the refresh is idempotent.
+	import threading
+	from django.core.cache import cache
+	lock_key = "refresh_bill_cosponsors:" + bill_id
+	if not cache.add(lock_key, True, SPONSORS_CAMPAIGN_MAX_AGE):
+		return
+
+	def refresh():
+		from django.db import connection
+		from contrib.legislative import create_trigger_for_sponsors
+		try:
+			trigger = create_trigger_for_sponsors(bill_id, with_companion=True, update=True)
+			create_automatic_campaign_from_trigger(trigger)
+		except Exception:
+			import traceback
+			traceback.print_exc()
+			cache.delete(lock_key)
+		finally:
+			# The thread has its own database connection, which must be closed.
+			connection.close()
+
+	threading.Thread(target=refresh, daemon=True).start()